@@ -0,0 +1,104 @@
+import argparse
+import json
+import statistics
+import sys
+
+from bandits import LinUCB, project_context
+from embedding_service import get_embedding_service
+from reward_store import get_reward_store, is_compare_entry
+from rl_agent import CONFIG_ARMS, make_bandit, reward_with_latency
+
+
+def _mean(values):
+    return round(statistics.fmean(values), 3) if values else None
+
+
+def load_events(store):
+    """
+    Logged (query, arm, reward, latency) events in chronological order. Only
+    compare-pipeline entries are used: the others carry no arm and their
+    rewards are on a different scale (see reward_store.is_compare_entry).
+    """
+    events = []
+    for entry in store.between():
+        if entry.get("reward_score") is None or not is_compare_entry(entry):
+            continue
+        events.append({
+            "query": entry["query"],
+            "arm": entry["arm"],
+            "reward": entry["reward_score"],
+            "latency": entry.get("latency"),
+        })
+    return events
+
+
+def replay(events, contexts, strategy):
+    """
+    Replays the log through a fresh bandit. Replay estimate: an event only
+    counts (and updates the bandit) when the bandit picks the logged arm.
+    Direct estimate: for every event, the logged per-arm averages of the arm the
+    bandit picked.
+    """
+    bandit = make_bandit(strategy)
+    arm_rewards, arm_latencies = {}, {}
+    for event in events:
+        arm_rewards.setdefault(event["arm"], []).append(event["reward"])
+        if event["latency"] is not None:
+            arm_latencies.setdefault(event["arm"], []).append(event["latency"])
+
+    matched_rewards, matched_latencies = [], []
+    direct_rewards, direct_latencies, choices = [], [], {}
+    for event, context in zip(events, contexts):
+        chosen = bandit.select(CONFIG_ARMS, context if isinstance(bandit, LinUCB) else None)
+        choices[chosen] = choices.get(chosen, 0) + 1
+        if chosen in arm_rewards:
+            direct_rewards.append(_mean(arm_rewards[chosen]))
+        if chosen in arm_latencies:
+            direct_latencies.append(_mean(arm_latencies[chosen]))
+        if chosen == event["arm"]:
+            matched_rewards.append(event["reward"])
+            if event["latency"] is not None:
+                matched_latencies.append(event["latency"])
+            bandit.update(chosen, reward_with_latency(event["reward"], event["latency"]), context)
+
+    return {
+        "strategy": strategy,
+        "matched_events": len(matched_rewards),
+        "replay_mean_reward": _mean(matched_rewards),
+        "replay_mean_latency": _mean(matched_latencies),
+        "direct_mean_reward": _mean(direct_rewards),
+        "direct_mean_latency": _mean(direct_latencies),
+        "arm_choices": choices,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the logged rewards through the bandit strategies.")
+    parser.add_argument("--strategies", default="ucb1,thompson,linucb")
+    args = parser.parse_args()
+
+    events = load_events(get_reward_store())
+    if not events:
+        print(json.dumps({"error": "No logged rewards to replay"}))
+        return
+    embeddings = get_embedding_service().encode([e["query"] for e in events])
+    contexts = [project_context(emb) for emb in embeddings]
+
+    logged_latencies = [e["latency"] for e in events if e["latency"] is not None]
+    baseline = {"mean_reward": _mean([e["reward"] for e in events]), "mean_latency": _mean(logged_latencies)}
+    report = {"events": len(events), "logged_policy": baseline, "strategies": []}
+    for strategy in args.strategies.split(","):
+        result = replay(events, contexts, strategy)
+        for estimate in ("replay", "direct"):
+            reward, latency = result[f"{estimate}_mean_reward"], result[f"{estimate}_mean_latency"]
+            result[f"{estimate}_reward_lost"] = round(baseline["mean_reward"] - reward, 3) if reward is not None else None
+            result[f"{estimate}_latency_saved"] = (
+                round(baseline["mean_latency"] - latency, 3) if latency is not None and baseline["mean_latency"] is not None else None
+            )
+        report["strategies"].append(result)
+        print(f"Replayed {len(events)} events with {strategy}", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
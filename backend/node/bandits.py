@@ -0,0 +1,112 @@
+import math
+import random
+import numpy as np
+
+from rag_resources import EMBEDDING_DIM, get_setting
+
+# ======== BANDIT SETTINGS ========
+REWARD_RANGE = float(get_setting("BANDIT_REWARD_RANGE", "10"))  # Rewards are mostly judge scores on a 0-10 scale
+LINUCB_ALPHA = float(get_setting("LINUCB_ALPHA", "1.0"))
+LINUCB_CONTEXT_DIM = int(get_setting("LINUCB_CONTEXT_DIM", "16"))  # Query embeddings are projected down to this size
+
+_projection = None
+
+
+def project_context(embedding, dim=LINUCB_CONTEXT_DIM):
+    """
+    Maps a 384-dim query embedding to a small context vector for LinUCB: a fixed
+    (seeded) random projection, normalised, plus a constant bias feature.
+    """
+    global _projection
+    if _projection is None or _projection.shape[1] != dim:
+        _projection = np.random.default_rng(0).normal(size=(EMBEDDING_DIM, dim)) / math.sqrt(dim)
+    x = np.asarray(embedding, dtype=np.float64) @ _projection
+    norm = np.linalg.norm(x)
+    return np.append(x / norm if norm else x, 1.0)
+
+
+def _empty_stats():
+    return {"sum": 0.0, "count": 0, "sum_sq": 0.0}
+
+
+class UCB1:
+    """UCB1 over per-arm reward sums; the bonus is scaled to the reward range."""
+
+    def __init__(self, stats=None, reward_range=REWARD_RANGE):
+        self.stats = stats if stats is not None else {}
+        self.reward_range = reward_range
+
+    def select(self, arms, context=None):
+        untried = [arm for arm in arms if self.stats.get(arm, _empty_stats())["count"] == 0]
+        if untried:
+            return random.choice(untried)
+        total = sum(self.stats[arm]["count"] for arm in arms)
+
+        def upper_bound(arm):
+            s = self.stats[arm]
+            return s["sum"] / s["count"] + self.reward_range * math.sqrt(2 * math.log(total) / s["count"])
+
+        return max(arms, key=upper_bound)
+
+    def update(self, arm, reward, context=None):
+        s = self.stats.setdefault(arm, _empty_stats())
+        s["sum"] += reward
+        s["count"] += 1
+        s["sum_sq"] += reward * reward
+
+
+class ThompsonSampling(UCB1):
+    """
+    Gaussian Thompson sampling: each arm's mean reward is sampled from a normal
+    posterior built from its sum, count and sum of squares.
+    """
+
+    def select(self, arms, context=None):
+        def sample(arm):
+            s = self.stats.get(arm, _empty_stats())
+            if s["count"] == 0:
+                return random.gauss(self.reward_range / 2, self.reward_range)
+            mean = s["sum"] / s["count"]
+            variance = max(s["sum_sq"] / s["count"] - mean * mean, 0.0)
+            # Shrink towards a wide prior so arms with one or two samples still get explored
+            prior_variance = (self.reward_range / 2) ** 2
+            posterior_variance = 1.0 / (1.0 / prior_variance + s["count"] / max(variance, 1e-2))
+            return random.gauss(mean, math.sqrt(posterior_variance))
+
+        return max(arms, key=sample)
+
+
+class LinUCB:
+    """
+    Disjoint LinUCB: a ridge regression of reward on the context per arm, plus an
+    upper-confidence bonus. `state` maps arm -> (A, b) with A = I + sum(x x^T)
+    and b = sum(reward * x).
+    """
+
+    def __init__(self, state=None, alpha=LINUCB_ALPHA, dim=LINUCB_CONTEXT_DIM + 1):
+        self.state = state if state is not None else {}
+        self.alpha = alpha
+        self.dim = dim
+
+    def _arm_state(self, arm):
+        if arm not in self.state:
+            self.state[arm] = (np.eye(self.dim), np.zeros(self.dim))
+        return self.state[arm]
+
+    def select(self, arms, context=None):
+        if context is None:
+            raise ValueError("LinUCB needs a context vector")
+
+        def upper_bound(arm):
+            A, b = self._arm_state(arm)
+            A_inv_x = np.linalg.solve(A, context)
+            theta = np.linalg.solve(A, b)
+            return float(theta @ context + self.alpha * math.sqrt(max(context @ A_inv_x, 0.0)))
+
+        scores = {arm: upper_bound(arm) for arm in arms}
+        best = max(scores.values())
+        return random.choice([arm for arm, score in scores.items() if score == best])
+
+    def update(self, arm, reward, context=None):
+        A, b = self._arm_state(arm)
+        self.state[arm] = (A + np.outer(context, context), b + reward * context)
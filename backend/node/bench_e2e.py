@@ -0,0 +1,251 @@
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+NODE_DIR = os.path.dirname(os.path.abspath(__file__))
+QUERIES_PATH = os.path.join(NODE_DIR, "reward_memory.json")
+RESULTS_DIR = os.path.join(NODE_DIR, "bench_results")
+PIPELINES = ("query", "compare")
+
+
+def load_queries(path):
+    """The distinct queries users asked, from the reward memory."""
+    with open(path, "r", encoding="utf-8") as f:
+        return list(dict.fromkeys(item["query"] for item in json.load(f) if item.get("query")))
+
+
+def summarize(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "mean": round(float(np.mean(values)), 4), "p50": round(float(p50), 4),
+            "p95": round(float(p95), 4), "p99": round(float(p99), 4), "max": round(float(max(values)), 4)}
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # KB on Linux
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=NODE_DIR, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=NODE_DIR, capture_output=True, text=True).stdout.strip())
+    except OSError:
+        return None
+    return f"{commit}{'-dirty' if dirty else ''}" if commit else None
+
+
+# ======== STAGE TIMING ========
+class StageTimer:
+    """Collects stage durations (seconds) for the request running on the current thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def begin(self):
+        self._local.stages = {}
+        self._local.start = time.perf_counter()
+        return self._local.stages
+
+    def mark(self, name):
+        """Records the time since the request started, once per name (e.g. the first token)."""
+        stages = getattr(self._local, "stages", None)
+        if stages is not None and name not in stages:
+            stages[name] = time.perf_counter() - self._local.start
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                stages = getattr(self._local, "stages", None)
+                if stages is not None:
+                    stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+        return timed
+
+
+def instrument_query(timer):
+    """Wraps the stage functions rag_query.run_query looks up at call time."""
+    import rag_query
+    for name, attribute in (("search", "search_serper"), ("ingestion", "ingest_web_results"),
+                            ("retrieval", "retrieve_passages"), ("generation", "generate_answer"), ("reward", "compute_reward")):
+        setattr(rag_query, attribute, timer.wrap(name, getattr(rag_query, attribute)))
+
+    def run(query):
+        stages = timer.begin()
+
+        def emit(message):
+            if message["type"] == "token":
+                timer.mark("first_token")
+            elif message["type"] == "final_answer":
+                timer.mark("final_answer")
+
+        start = time.perf_counter()
+        result = rag_query.run_query(query, emit=emit)
+        stages["total"] = time.perf_counter() - start
+        if result.get("answer") is None:
+            raise RuntimeError("no answer")
+        return stages
+    return run
+
+
+def instrument_compare(skip_evaluation):
+    import rag_query_compare
+    if skip_evaluation:
+        rag_query_compare.evaluate_answers = lambda query, rag_answer, llm_answer: None
+
+    def run(query):
+        # run_compare times its own stage graph
+        timings = rag_query_compare.run_compare(query)["timings"]
+        return {name: timing["seconds"] for name, timing in timings.items()}
+    return run
+
+
+# ======== LOAD GENERATION ========
+def run_level(run, queries, requests, concurrency):
+    """Sends `requests` queries (cycling through `queries`) with `concurrency` in flight."""
+    def one(query):
+        try:
+            return run(query), None
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(one, [queries[i % len(queries)] for i in range(requests)]))
+    wall = time.perf_counter() - start
+
+    records = [stages for stages, error in outcomes if stages is not None]
+    errors = [error for _, error in outcomes if error is not None]
+    stage_names = sorted({name for stages in records for name in stages})
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:3],
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(records) / wall, 3) if wall else None,
+        "stages": {name: summarize([stages.get(name) for stages in records]) for name in stage_names},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare_with_baseline(report, baseline):
+    """Relative change of total p50/p95 latency and throughput for every run also present in the baseline."""
+    previous = {(r["pipeline"], r["concurrency"]): r for r in baseline.get("runs", [])}
+    deltas = []
+    for run in report["runs"]:
+        old = previous.get((run["pipeline"], run["concurrency"]))
+        if old is None or not run["stages"].get("total") or not old["stages"].get("total"):
+            continue
+        change = lambda new, before: round((new - before) / before * 100, 1) if before else None
+        deltas.append({
+            "pipeline": run["pipeline"],
+            "concurrency": run["concurrency"],
+            "total_p50_pct": change(run["stages"]["total"]["p50"], old["stages"]["total"]["p50"]),
+            "total_p95_pct": change(run["stages"]["total"]["p95"], old["stages"]["total"]["p95"]),
+            "throughput_pct": change(run["throughput_rps"], old["throughput_rps"]),
+        })
+    return {"baseline_revision": baseline.get("revision"), "changes": deltas}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rag_query.py / rag_query_compare.py end to end against local stand-in services.")
+    parser.add_argument("--pipelines", default="query", help=f"Comma-separated: {', '.join(PIPELINES)}")
+    parser.add_argument("--concurrency", default="1,4", help="Comma-separated numbers of requests in flight")
+    parser.add_argument("--requests", type=int, default=24, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured requests that load the models first")
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Stand-in Groq time to first token")
+    parser.add_argument("--llm-tokens-per-s", type=float, default=250)
+    parser.add_argument("--llm-requests-per-minute", type=int, help="Stand-in Groq quota (rate-limit headers and 429s)")
+    parser.add_argument("--page-latency-ms", type=float, default=50)
+    parser.add_argument("--search-latency-ms", type=float, default=150)
+    parser.add_argument("--semantic-cache", action="store_true", help="Keep the semantic cache on (repeated queries then hit it)")
+    parser.add_argument("--skip-evaluation", action="store_true", help="compare: skip the local evaluation models")
+    parser.add_argument("--output", help=f"Result file (default: {RESULTS_DIR}/e2e-<revision>-<time>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare with")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipelines' own output")
+    args = parser.parse_args()
+
+    # Every store the pipelines write goes to a scratch directory, so runs start cold and leave no trace
+    workdir = tempfile.mkdtemp(prefix="bench_e2e-")
+    os.environ.update({
+        "LOCAL_VECTOR_STORE_DIR": os.path.join(workdir, "vector_store"),
+        "CHUNK_STORE_PATH": os.path.join(workdir, "chunk_store.db"),
+        "BM25_PATH": os.path.join(workdir, "bm25_index.db"),
+        "SCRAPE_CACHE_PATH": os.path.join(workdir, "scrape_cache.db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.db"),
+        "SEMANTIC_CACHE_PATH": os.path.join(workdir, "semantic_cache.db"),
+        "REWARD_DB_PATH": os.path.join(workdir, "reward_store.db"),
+        "POLICY_DB_PATH": os.path.join(workdir, "policy_store.db"),
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.db"),
+        "SEMANTIC_CACHE_ENABLED": "1" if args.semantic_cache else "0",
+    })
+    from fake_services import FakeServices
+
+    queries = load_queries(args.queries)
+    services = FakeServices(
+        page_latency_ms=args.page_latency_ms, search_latency_ms=args.search_latency_ms,
+        llm_latency_ms=args.llm_latency_ms, llm_tokens_per_s=args.llm_tokens_per_s,
+        llm_requests_per_minute=args.llm_requests_per_minute,
+    ).start()
+    os.environ.update(services.environ())
+
+    timer = StageTimer()
+    runners = {"query": lambda: instrument_query(timer), "compare": lambda: instrument_compare(args.skip_evaluation)}
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "verbose")},
+        "runs": [],
+    }
+
+    console = sys.stderr
+    output = sys.stderr if args.verbose else open(os.devnull, "w")
+    try:
+        for pipeline in args.pipelines.split(","):
+            run = runners[pipeline]()
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                for query in queries[:args.warmup]:
+                    run(query)
+                for concurrency in (int(c) for c in args.concurrency.split(",")):
+                    result = {"pipeline": pipeline, **run_level(run, queries, args.requests, concurrency)}
+                    report["runs"].append(result)
+                    total = result["stages"].get("total") or {}
+                    print(f"{pipeline} x{concurrency}: p50 {total.get('p50')}s, p95 {total.get('p95')}s, "
+                          f"{result['throughput_rps']} req/s, {result['errors']} errors, peak RSS {result['peak_rss_mb']} MB", file=console)
+    finally:
+        services.stop()
+        if output is not sys.stderr:
+            output.close()
+    report["service_calls"] = services.stats
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["baseline"] = compare_with_baseline(report, json.load(f))
+
+    path = args.output or os.path.join(RESULTS_DIR, f"e2e-{report['revision'] or 'unknown'}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Saved results to {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
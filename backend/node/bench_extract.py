@@ -0,0 +1,110 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from extract import ENGINES, EXTRACT_MAX_CHARS
+from webscrap import get_session
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scraped_data.json")
+HTML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_html")
+
+
+def load_pages(data_path, html_dir):
+    """
+    Returns (url, html bytes, reference text) for the pages in scraped_data.json.
+    Pages are downloaded once and kept in `html_dir`, so later runs compare the
+    engines on exactly the same bytes.
+    """
+    with open(data_path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    os.makedirs(html_dir, exist_ok=True)
+
+    pages = []
+    for item in items:
+        url, reference = item.get("url"), item.get("content")
+        if not url or not reference:
+            continue
+        path = os.path.join(html_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".html")
+        if not os.path.exists(path):
+            try:
+                response = get_session().get(url, timeout=15)
+            except Exception as e:
+                print(f"Skipping {url}: {e}", file=sys.stderr)
+                continue
+            if response.status_code != 200:
+                print(f"Skipping {url}: status {response.status_code}", file=sys.stderr)
+                continue
+            with open(path, "wb") as f:
+                f.write(response.content)
+        with open(path, "rb") as f:
+            pages.append((url, f.read(), reference))
+    return pages
+
+
+def overlap(text, reference):
+    """
+    Word-level precision (extracted words found in the reference) and recall
+    (reference words found in the extraction). The reference is the stored
+    `content`, i.e. BeautifulSoup text of the page when it was first scraped,
+    so it includes boilerplate and may differ from today's page.
+    """
+    words, ref_words = Counter(text.lower().split()), Counter(reference.lower().split())
+    common = sum((words & ref_words).values())
+    precision = common / max(sum(words.values()), 1)
+    recall = common / max(sum(ref_words.values()), 1)
+    return precision, recall
+
+
+def run_engine(name, pages, repeat, max_chars):
+    extract = ENGINES[name]
+    total_bytes = sum(len(html) for _, html, _ in pages)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        texts = [extract(html, max_chars) for _, html, _ in pages]
+    seconds = (time.perf_counter() - start) / repeat
+
+    scores = [overlap(text, reference) for text, (_, _, reference) in zip(texts, pages)]
+    # Recall against the reference prefix that fits the character limit, so early stopping isn't counted as a loss
+    prefix_recalls = [overlap(text, reference[:max_chars] if max_chars else reference)[1] for text, (_, _, reference) in zip(texts, pages)]
+    return {
+        "engine": name,
+        "pages": len(pages),
+        "seconds_per_pass": round(seconds, 4),
+        "pages_per_second": round(len(pages) / seconds, 1) if seconds else None,
+        "mb_per_second": round(total_bytes / seconds / 1e6, 2) if seconds else None,
+        "mean_chars": round(sum(len(t) for t in texts) / len(texts)),
+        "precision": round(sum(p for p, _ in scores) / len(scores), 3),
+        "recall": round(sum(r for _, r in scores) / len(scores), 3),
+        "prefix_recall": round(sum(prefix_recalls) / len(prefix_recalls), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HTML extraction engines on the pages in scraped_data.json.")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--html-dir", default=HTML_DIR, help="Where downloaded pages are kept between runs")
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-chars", type=int, default=EXTRACT_MAX_CHARS, help="0 extracts whole pages")
+    args = parser.parse_args()
+
+    pages = load_pages(args.data, args.html_dir)
+    if not pages:
+        print(json.dumps({"error": "No pages could be loaded"}))
+        return
+    print(f"Benchmarking on {len(pages)} pages ({sum(len(h) for _, h, _ in pages) / 1e6:.1f} MB of HTML)", file=sys.stderr)
+
+    results = []
+    for name in args.engines.split(","):
+        result = run_engine(name, pages, args.repeat, args.max_chars)
+        print(f"{name}: {result['pages_per_second']} pages/s, precision {result['precision']}, recall {result['recall']}", file=sys.stderr)
+        results.append(result)
+    print(json.dumps({"max_chars": args.max_chars, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from inference_backend import BACKENDS, TOLERANCES
+from rag_resources import EMBED_MODEL_NAME
+
+NODE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(NODE_DIR, "reward_memory.json")
+QA_MODEL_NAME = "deepset/roberta-base-squad2"  # Same model as comprehensive_evaluate.py
+
+
+def load_samples(path, limit):
+    """(query, answer) pairs from the reward memory, i.e. real answers the evaluator has scored."""
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    return [(item["query"], item["answer"]) for item in items if item.get("query") and item.get("answer")][:limit]
+
+
+def _timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+
+def _row_cosine(a, b):
+    denominator = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    denominator[denominator == 0] = 1.0
+    return (a * b).sum(axis=1) / denominator
+
+
+def run_worker(backend, bertscore_model, samples, repeat):
+    """
+    Loads the embedder, QA pipeline and BERTScorer on one backend and scores
+    the samples. Runs in its own process so peak RSS belongs to this backend.
+    BERTScore compares each answer with its query; only the differences
+    between backends matter here, not the absolute values.
+    """
+    from inference_backend import load_bert_scorer, load_embedder, load_qa_pipeline
+
+    queries = [q for q, _ in samples]
+    answers = [a for _, a in samples]
+    n = len(samples)
+    result = {"backend": backend, "bertscore_model": bertscore_model, "load_ms": {}, "ms_per_item": {}}
+
+    embedder, result["load_ms"]["embedder"] = _timed(lambda: load_embedder(EMBED_MODEL_NAME, backend), 1)
+    vectors, ms = _timed(lambda: np.asarray(embedder.encode(queries + answers, batch_size=32, show_progress_bar=False)), repeat)
+    result["ms_per_item"]["embedding"] = ms / (2 * n)
+
+    qa, result["load_ms"]["qa"] = _timed(lambda: load_qa_pipeline(QA_MODEL_NAME, backend), 1)
+    qa_results, ms = _timed(lambda: qa(question=queries, context=answers, batch_size=16), repeat)
+    if isinstance(qa_results, dict):
+        qa_results = [qa_results]
+    result["ms_per_item"]["qa"] = ms / n
+
+    scorer, result["load_ms"]["bertscore"] = _timed(lambda: load_bert_scorer(bertscore_model, "int8" if backend == "int8" else "torch"), 1)
+    (_, _, f1), ms = _timed(lambda: scorer.score(answers, queries), repeat)
+    result["ms_per_item"]["bertscore"] = ms / n
+
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+    result["outputs"] = {
+        "embeddings": vectors.tolist(),
+        "similarity": _row_cosine(vectors[n:], vectors[:n]).tolist(),
+        "qa_score": [r["score"] for r in qa_results],
+        "bertscore_f1": f1.tolist(),
+    }
+    return result
+
+
+def spawn_worker(backend, bertscore_model, args):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker", backend, "--bertscore-model", bertscore_model,
+        "--data", args.data, "--limit", str(args.limit), "--repeat", str(args.repeat),
+    ]
+    process = subprocess.run(command, cwd=NODE_DIR, capture_output=True, text=True)
+    if process.returncode != 0:
+        lines = process.stderr.strip().splitlines()
+        return {"backend": backend, "bertscore_model": bertscore_model, "error": lines[-1] if lines else "worker failed"}
+    return json.loads(process.stdout)
+
+
+def compare(result, reference):
+    """Largest deviation of each output from the fp32 torch reference."""
+    out, ref = result["outputs"], reference["outputs"]
+    deltas = {
+        "embedding_cosine": float(np.max(1 - _row_cosine(np.array(out["embeddings"]), np.array(ref["embeddings"])))),
+        "similarity": float(np.max(np.abs(np.subtract(out["similarity"], ref["similarity"])))),
+        "qa_score": float(np.max(np.abs(np.subtract(out["qa_score"], ref["qa_score"])))),
+    }
+    if result["bertscore_model"] == reference["bertscore_model"]:
+        deltas["bertscore_f1"] = float(np.max(np.abs(np.subtract(out["bertscore_f1"], ref["bertscore_f1"]))))
+    return {name: round(delta, 4) for name, delta in deltas.items()}
+
+
+def summarize(result):
+    return {key: value for key, value in result.items() if key != "outputs"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare latency, memory and score drift of the CPU inference backends.")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--bertscore-model", default="roberta-large", help="BERTScore model used for the backend comparison")
+    parser.add_argument("--bertscore-alternatives", default="distilbert-base-uncased",
+                        help="Comma-separated BERTScore models compared with --bertscore-model on fp32 torch")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--limit", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if a backend exceeds the TOLERANCES in inference_backend.py")
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.bertscore_model, load_samples(args.data, args.limit), args.repeat)))
+        return
+
+    backends = args.backends.split(",")
+    if "torch" not in backends:
+        backends.insert(0, "torch")  # The fp32 reference every other backend is compared with
+    results = [spawn_worker(backend, args.bertscore_model, args) for backend in backends]
+    reference = results[0]
+
+    failures = []
+    report = {"samples": len(load_samples(args.data, args.limit)), "tolerances": TOLERANCES, "backends": [], "bertscore_models": []}
+    for result in results:
+        entry = summarize(result)
+        if "error" in result:
+            failures.append(f"{result['backend']}: {result['error']}")
+        elif "error" not in reference and result is not reference:
+            entry["max_delta"] = compare(result, reference)
+            exceeded = [name for name, delta in entry["max_delta"].items() if delta > TOLERANCES[name]]
+            entry["within_tolerance"] = not exceeded
+            failures.extend(f"{result['backend']}: {name} drifted by {entry['max_delta'][name]} (tolerance {TOLERANCES[name]})" for name in exceeded)
+        report["backends"].append(entry)
+        print(f"{result['backend']}: {entry.get('ms_per_item', entry.get('error'))}", file=sys.stderr)
+
+    # Smaller BERTScore models shift the absolute scores, so they are judged by how well they preserve the ranking
+    for model in filter(None, args.bertscore_alternatives.split(",")):
+        result = spawn_worker("torch", model, args)
+        entry = summarize(result)
+        if "error" not in result and "error" not in reference:
+            entry["f1_correlation"] = round(float(np.corrcoef(result["outputs"]["bertscore_f1"], reference["outputs"]["bertscore_f1"])[0, 1]), 4)
+        report["bertscore_models"].append(entry)
+
+    print(json.dumps(report, indent=2))
+    if args.check:
+        for failure in failures:
+            print(f"Tolerance check failed: {failure}", file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from collections import Counter
+
+from rag_resources import get_setting
+
+# ======== BM25 SETTINGS ========
+BM25_PATH = get_setting("BM25_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bm25_index.db"))
+BM25_K1 = float(get_setting("BM25_K1", "1.2"))
+BM25_B = float(get_setting("BM25_B", "0.75"))
+
+# Keeps names with dots or dashes ("gpt-4o", "3.5", "node.js") together as one term
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "how", "in", "is", "it", "its",
+    "of", "on", "or", "that", "the", "this", "to", "was", "were", "what", "when", "where", "which", "who", "why",
+    "will", "with", "you", "your", "do", "does", "can", "i", "we", "they", "he", "she", "not", "but", "so", "if",
+}
+
+
+def tokenize(text):
+    """Lowercased terms without stopwords; compound terms are also indexed by their parts."""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in re.split(r"[._-]", token) if part and part not in STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    """
+    Incremental BM25 index over the same chunks as the vector store, kept in
+    SQLite. Terms and chunks are interned to integer ids, postings are a
+    WITHOUT ROWID table of (term, chunk, tf), and each chunk keeps its term ids
+    as a packed array so it can be removed again without a reverse index.
+    """
+
+    def __init__(self, path=BM25_PATH, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE, df INTEGER NOT NULL DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                parent_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                term_ids BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_parent ON chunks (parent_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term_id INTEGER NOT NULL,
+                chunk INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term_id, chunk)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS documents (parent_id TEXT PRIMARY KEY, metadata TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), chunks INTEGER NOT NULL, total_length INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats (id, chunks, total_length) VALUES (0, 0, 0);
+        """)
+        self._conn.commit()
+
+    def _term_ids(self, terms):
+        self._conn.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)", [(t,) for t in terms])
+        ids = {}
+        terms = list(terms)
+        for start in range(0, len(terms), 500):
+            batch = terms[start:start + 500]
+            ids.update(self._conn.execute(
+                f"SELECT term, id FROM terms WHERE term IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        return ids
+
+    def _remove(self, parent_id):
+        rows = self._conn.execute("SELECT id, length, term_ids FROM chunks WHERE parent_id = ?", (parent_id,)).fetchall()
+        for chunk, length, blob in rows:
+            term_ids = array("I")
+            term_ids.frombytes(blob)
+            self._conn.executemany("DELETE FROM postings WHERE term_id = ? AND chunk = ?", [(t, chunk) for t in term_ids])
+            self._conn.executemany("UPDATE terms SET df = df - 1 WHERE id = ?", [(t,) for t in term_ids])
+            self._conn.execute("UPDATE stats SET chunks = chunks - 1, total_length = total_length - ?", (length,))
+        self._conn.execute("DELETE FROM chunks WHERE parent_id = ?", (parent_id,))
+        self._conn.execute("DELETE FROM documents WHERE parent_id = ?", (parent_id,))
+
+    def add_document(self, parent_id, chunk_ids, chunks, metadata):
+        """Indexes (or re-indexes) the chunks of one document; `metadata` is returned with its hits."""
+        counted = [Counter(tokenize(text)) for text in chunks]
+        with self._lock:
+            with self._conn:
+                self._remove(parent_id)
+                ids = self._term_ids({term for counts in counted for term in counts})
+                self._conn.execute("INSERT INTO documents (parent_id, metadata) VALUES (?, ?)", (parent_id, json.dumps(metadata)))
+                for position, (chunk_id, counts) in enumerate(zip(chunk_ids, counted)):
+                    term_ids = array("I", (ids[term] for term in counts))
+                    length = sum(counts.values())
+                    chunk = self._conn.execute(
+                        "INSERT INTO chunks (chunk_id, parent_id, position, length, term_ids) VALUES (?, ?, ?, ?, ?)",
+                        (chunk_id, parent_id, position, length, term_ids.tobytes())
+                    ).lastrowid
+                    self._conn.executemany("INSERT INTO postings (term_id, chunk, tf) VALUES (?, ?, ?)", [(ids[t], chunk, n) for t, n in counts.items()])
+                    self._conn.executemany("UPDATE terms SET df = df + 1 WHERE id = ?", [(t,) for t in term_ids])
+                    self._conn.execute("UPDATE stats SET chunks = chunks + 1, total_length = total_length + ?", (length,))
+
+    def remove_document(self, parent_id):
+        with self._lock:
+            with self._conn:
+                self._remove(parent_id)
+
+    def search(self, query, top_k=10):
+        """
+        Returns the `top_k` chunks by BM25 score as dicts shaped like vector
+        matches: {"id", "score", "metadata"} with the document metadata plus
+        "parent_id" and "chunk".
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n_chunks, total_length = self._conn.execute("SELECT chunks, total_length FROM stats").fetchone()
+            if not n_chunks:
+                return []
+            avg_length = total_length / n_chunks
+            scores = {}
+            rows = self._conn.execute(f"SELECT id, df FROM terms WHERE term IN ({','.join('?' * len(terms))}) AND df > 0", terms).fetchall()
+            for term_id, df in rows:
+                idf = math.log(1 + (n_chunks - df + 0.5) / (df + 0.5))
+                for chunk, tf, length in self._conn.execute(
+                    "SELECT p.chunk, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk WHERE p.term_id = ?", (term_id,)
+                ):
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk] = scores.get(chunk, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            matches = []
+            for chunk, score in best:
+                chunk_id, parent_id, position, metadata = self._conn.execute(
+                    "SELECT c.chunk_id, c.parent_id, c.position, d.metadata FROM chunks c JOIN documents d ON d.parent_id = c.parent_id WHERE c.id = ?",
+                    (chunk,)
+                ).fetchone()
+                matches.append({"id": chunk_id, "score": score, "metadata": {**json.loads(metadata), "parent_id": parent_id, "chunk": position}})
+        return matches
+
+    def stats(self):
+        with self._lock:
+            n_chunks, total_length = self._conn.execute("SELECT chunks, total_length FROM stats").fetchone()
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            terms = self._conn.execute("SELECT COUNT(*) FROM terms WHERE df > 0").fetchone()[0]
+        return {"documents": documents, "chunks": n_chunks, "terms": terms, "avg_chunk_length": round(total_length / n_chunks, 1) if n_chunks else 0}
+
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                for table in ("postings", "chunks", "documents", "terms"):
+                    self._conn.execute(f"DELETE FROM {table}")
+                self._conn.execute("UPDATE stats SET chunks = 0, total_length = 0")
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_bm25_index():
+    """Returns the process-wide BM25Index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = BM25Index()
+        return _index
+
+
+if __name__ == "__main__":
+    from chunk_store import get_chunk_store
+    from chunking import chunk_id
+
+    parser = argparse.ArgumentParser(description="Inspect or rebuild the BM25 index.")
+    parser.add_argument("--rebuild", action="store_true", help="Re-index every document in the chunk store")
+    args = parser.parse_args()
+
+    index = BM25Index()
+    if args.rebuild:
+        index.clear()
+        # Only the URL is known for documents indexed before the BM25 index existed
+        for parent_id, url, chunks in get_chunk_store().iter_documents():
+            index.add_document(parent_id, [chunk_id(parent_id, p) for p in range(len(chunks))], chunks, {"url": url or ""})
+    print(json.dumps(index.stats(), indent=2))
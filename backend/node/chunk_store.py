@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from rag_resources import get_setting
+
+CHUNK_STORE_PATH = get_setting("CHUNK_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chunk_store.db"))
+
+
+class ChunkStore:
+    """
+    Sidecar store for chunk texts, keyed by parent document id and position.
+    Texts are zlib-compressed in SQLite so that vector metadata stays small.
+    The documents table records each indexed document's (normalised) URL,
+    chunk count and optional expiry time, so a document's vectors can be found
+    again by URL and deleted once it is stale.
+    """
+
+    def __init__(self, path=CHUNK_STORE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                parent_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                text BLOB NOT NULL,
+                PRIMARY KEY (parent_id, position)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS documents (
+                parent_id TEXT PRIMARY KEY,
+                url TEXT,
+                chunks INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS documents_url ON documents (url);
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(documents)")]
+        if "expires_at" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN expires_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_expires_at ON documents (expires_at)")
+        self._conn.commit()
+
+    def put(self, parent_id, chunks, url=None, expires_at=None):
+        """Replaces all chunks of a parent document; `expires_at` is None for permanent documents."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks WHERE parent_id = ?", (parent_id,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (parent_id, url, chunks, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (parent_id, url, len(chunks), time.time(), expires_at)
+                )
+                self._conn.executemany(
+                    "INSERT INTO chunks (parent_id, position, text) VALUES (?, ?, ?)",
+                    [(parent_id, position, zlib.compress(text.encode("utf-8"))) for position, text in enumerate(chunks)]
+                )
+
+    def get(self, parent_id, positions):
+        """Returns {position: text} for the requested positions that exist."""
+        positions = sorted(set(positions))
+        if not positions:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT position, text FROM chunks WHERE parent_id = ? AND position IN ({','.join('?' * len(positions))})",
+                [parent_id, *positions]
+            ).fetchall()
+        return {position: zlib.decompress(text).decode("utf-8") for position, text in rows}
+
+    def has(self, parent_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents WHERE parent_id = ?", (parent_id,)).fetchone() is not None
+
+    def extend(self, parent_id, expires_at):
+        """Pushes back the expiry of a document that is still in use; permanent documents stay permanent."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE documents SET expires_at = MAX(expires_at, ?) WHERE parent_id = ? AND expires_at IS NOT NULL",
+                    (expires_at, parent_id)
+                )
+
+    def expired(self, now=None):
+        """Returns [(parent_id, chunk count)] of the documents past their expiry time."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT parent_id, chunks FROM documents WHERE expires_at < ?", (now if now is not None else time.time(),)
+            ).fetchall()
+
+    def documents_for_url(self, url):
+        """Returns [(parent_id, chunk count)] of the documents indexed for a URL."""
+        with self._lock:
+            return self._conn.execute("SELECT parent_id, chunks FROM documents WHERE url = ?", (url,)).fetchall()
+
+    def iter_documents(self):
+        """Yields (parent_id, url, [chunk texts]) for every stored document."""
+        with self._lock:
+            documents = self._conn.execute("SELECT parent_id, url, chunks FROM documents").fetchall()
+        for parent_id, url, count in documents:
+            texts = self.get(parent_id, range(count))
+            yield parent_id, url, [texts[p] for p in sorted(texts)]
+
+    def delete(self, parent_id):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks WHERE parent_id = ?", (parent_id,))
+                self._conn.execute("DELETE FROM documents WHERE parent_id = ?", (parent_id,))
+
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks")
+                self._conn.execute("DELETE FROM documents")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_chunk_store():
+    """Returns the process-wide ChunkStore."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChunkStore()
+        return _store
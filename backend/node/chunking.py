@@ -0,0 +1,91 @@
+import re
+
+from rag_resources import get_embedder, get_setting
+
+# ======== CHUNKING SETTINGS ========
+CHUNKING_ENABLED = get_setting("CHUNKING_ENABLED", "1") == "1"
+CHUNK_TOKENS = int(get_setting("CHUNK_TOKENS", "200"))  # MiniLM truncates inputs at 256 word pieces
+CHUNK_OVERLAP = int(get_setting("CHUNK_OVERLAP", "40"))  # Tokens of trailing sentences repeated in the next chunk
+CHUNK_MAX_PER_DOC = int(get_setting("CHUNK_MAX_PER_DOC", "40"))
+UNCHUNKED_CHARS = 4000  # What a whole page was truncated to before chunking existed
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+def split_sentences(text):
+    """Splits text on sentence-ending punctuation followed by a capitalised word."""
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def count_tokens(text):
+    """Counts MiniLM word pieces; falls back to a word-based estimate without a tokenizer."""
+    try:
+        return len(get_embedder().tokenizer.tokenize(text))
+    except Exception:
+        return len(text.split()) * 4 // 3
+
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP, max_chunks=CHUNK_MAX_PER_DOC):
+    """
+    Packs whole sentences into chunks of at most `max_tokens` tokens. Each new
+    chunk starts with the last sentences of the previous one, up to `overlap`
+    tokens, so facts spanning a boundary stay retrievable. Sentences longer
+    than a chunk are split on words.
+    """
+    if not CHUNKING_ENABLED:
+        return [text[:UNCHUNKED_CHARS]] if text else []
+
+    pieces = []
+    for sentence in split_sentences(text):
+        tokens = count_tokens(sentence)
+        if tokens <= max_tokens:
+            pieces.append((sentence, tokens))
+            continue
+        words = sentence.split()
+        step = max(1, len(words) * max_tokens // tokens)
+        for start in range(0, len(words), step):
+            part = " ".join(words[start:start + step])
+            pieces.append((part, count_tokens(part)))
+
+    chunks, current, current_tokens = [], [], 0
+    for piece, tokens in pieces:
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(" ".join(p for p, _ in current))
+            if len(chunks) >= max_chunks:
+                return chunks
+            # Carry trailing sentences over as overlap
+            carried, carried_tokens = [], 0
+            for p, t in reversed(current):
+                if carried_tokens + t > overlap:
+                    break
+                carried.insert(0, (p, t))
+                carried_tokens += t
+            current, current_tokens = carried, carried_tokens
+        current.append((piece, tokens))
+        current_tokens += tokens
+    if current:
+        chunks.append(" ".join(p for p, _ in current))
+    return chunks[:max_chunks]
+
+
+def chunk_id(parent_id, position):
+    return f"{parent_id}#{position}"
+
+
+def build_chunk_vectors(parent_id, chunks, metadata, embeddings):
+    """
+    Embeds all chunks of a document in one batch and returns the vectors to
+    upsert. Their metadata carries the parent id and position instead of the
+    text; the caller saves the texts to the chunk store once the upsert worked.
+    """
+    if not chunks:
+        return []
+    vectors = embeddings.encode(chunks)
+    return [
+        {
+            "id": chunk_id(parent_id, position),
+            "values": vector.tolist(),
+            "metadata": {**metadata, "parent_id": parent_id, "chunk": position},
+        }
+        for position, vector in enumerate(vectors)
+    ]
@@ -1,48 +1,76 @@
+import argparse
 import json
 import sys
-from sentence_transformers import SentenceTransformer, util
-from bert_score import score as bert_scorer
-from transformers import pipeline
-from groq import Groq
-import dotenv
-import torch
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import numpy as np
 import time
 from datetime import datetime
+from llm_client import get_llm_client
+from rag_resources import get_setting
+from embedding_service import cosine_similarity, get_embedding_service
+from stage_graph import StageGraph
+from tracing import span
 
 print(f"[{datetime.now()}] comprehensive_evaluate.py: Script version check - Function 'check_factual_accuracy' should be defined.", file=sys.stderr)
 
-# ======== LOAD ENVIRONMENT VARIABLES ========
-dotenv.load_dotenv()
-GROQ_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "GROQ_API_KEY")
-
 # ======== INITIALIZE MODELS ========
-semantic_model = SentenceTransformer("all-MiniLM-L6-v2")
-qa_pipeline = pipeline("question-answering", model="deepset/roberta-base-squad2")
-groq_client = Groq(api_key=GROQ_API_KEY)
+# Models load on first use, so importing this module (e.g. from rag_query_compare.py)
+# costs nothing until an evaluation actually runs. The embedder and LLM client are
+# shared with the query scripts (see rag_resources.py and llm_client.py).
+QA_MODEL_NAME = "deepset/roberta-base-squad2"
+# bert_score's English default; "distilbert-base-uncased" is about 5x faster on CPU
+BERTSCORE_MODEL = get_setting("BERTSCORE_MODEL", "roberta-large")
+
+_qa_pipeline = None
+_bert_scorer = None
+_model_lock = threading.Lock()
+
+def get_semantic_model():
+    """Returns the shared embedding service used for the similarity metrics."""
+    return get_embedding_service()
+
+def get_qa_pipeline():
+    """Returns the extractive QA pipeline on QA_BACKEND, loading it on first use."""
+    global _qa_pipeline
+    with _model_lock:
+        if _qa_pipeline is None:
+            from inference_backend import load_qa_pipeline
+            _qa_pipeline = load_qa_pipeline(QA_MODEL_NAME)
+        return _qa_pipeline
+
+def get_bert_scorer():
+    """Returns a BERTScorer for BERTSCORE_MODEL (rescaled with its baseline), loading it on first use."""
+    global _bert_scorer
+    with _model_lock:
+        if _bert_scorer is None:
+            from inference_backend import load_bert_scorer
+            _bert_scorer = load_bert_scorer(BERTSCORE_MODEL)
+        return _bert_scorer
+
+def bert_scorer(candidates, references):
+    """Returns BERTScore (P, R, F1) tensors for paired candidate and reference lists."""
+    return get_bert_scorer().score(candidates, references)
 
 def calculate_semantic_similarity_between_answers(answer1, answer2):
     """Calculates semantic similarity between two answers."""
     if not answer1 or not answer2:
         return 0.0
-    emb1 = semantic_model.encode(answer1, convert_to_tensor=True)
-    emb2 = semantic_model.encode(answer2, convert_to_tensor=True)
-    similarity = util.pytorch_cos_sim(emb1, emb2).item()
-    return round(float(similarity), 3)
+    emb1, emb2 = get_semantic_model().encode([answer1, answer2])
+    return round(cosine_similarity(emb1, emb2), 3)
 
 def calculate_semantic_similarity_to_query(answer, query):
     """Calculates semantic similarity between an answer and the original query."""
     if not answer or not query:
         return 0.0
-    emb_answer = semantic_model.encode(answer, convert_to_tensor=True)
-    emb_query = semantic_model.encode(query, convert_to_tensor=True)
-    similarity = util.pytorch_cos_sim(emb_answer, emb_query).item()
-    return round(float(similarity), 3)
+    emb_answer, emb_query = get_semantic_model().encode([answer, query])
+    return round(cosine_similarity(emb_answer, emb_query), 3)
 
 def calculate_bert_score(candidate, reference):
     """Calculates BERTScore between a candidate and reference answer."""
     if not candidate or not reference:
         return {"precision": 0.0, "recall": 0.0, "f1": 0.0}
-    P, R, F1 = bert_scorer([candidate], [reference], lang="en", rescale_with_baseline=True)
+    P, R, F1 = bert_scorer([candidate], [reference])
     return {"precision": round(P.item(), 3), "recall": round(R.item(), 3), "f1": round(F1.item(), 3)}
 
 def check_factual_accuracy(query, answer):
@@ -51,9 +79,21 @@ def check_factual_accuracy(query, answer):
     """
     if not query or not answer:
         return 0.0
-    result = qa_pipeline(question=query, context=answer)
+    result = get_qa_pipeline()(question=query, context=answer)
     return round(result['score'], 3)
 
+def check_factual_accuracy_batch(query, answers):
+    """Runs check_factual_accuracy for several answers with a single QA pipeline call."""
+    scores = [0.0] * len(answers)
+    present = [i for i, answer in enumerate(answers) if query and answer]
+    if present:
+        results = get_qa_pipeline()(question=[query] * len(present), context=[answers[i] for i in present])
+        if isinstance(results, dict):
+            results = [results]
+        for i, result in zip(present, results):
+            scores[i] = round(result['score'], 3)
+    return scores
+
 def get_judge_evaluation(query, rag_answer, llm_answer):
     """Uses a powerful LLM to act as a judge and provide detailed scores."""
     prompt = f"""
@@ -88,87 +128,188 @@ Then, declare a winner ("RAG", "LLM", or "Tie") and provide a brief justificatio
 }}
 """
     try:
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
+        # Deterministic enough (temperature 0.1) to be served from the LLM cache on re-evaluation
+        response = get_llm_client().complete(
+            [{"role": "user", "content": prompt}],
             temperature=0.1,
             response_format={"type": "json_object"}
         )
-        return json.loads(response.choices[0].message.content)
+        return json.loads(response["content"])
     except Exception as e:
         return {"rag_scores": {}, "llm_scores": {}, "winner": "Error", "justification": str(e)}
 
-def calculate_reward(evaluation_results):
+# Weights based on user's previous formula: 0.40*faithfulness + 0.30*factual + 0.15*completeness + 0.10*clarity + 0.05*similarity
+REWARD_WEIGHTS = {
+    "faithfulness": 0.40,
+    "factual_accuracy": 0.30,
+    "completeness": 0.15,
+    "clarity": 0.10,
+    "semantic_similarity": 0.05,
+}
+
+def calculate_reward(evaluation_results, weights=None):
     """Calculates a scalar reward for the RAG answer based on evaluation metrics."""
+    weights = {**REWARD_WEIGHTS, **(weights or {})}
     rag_scores = evaluation_results["judge"]["rag_scores"]
     factual_accuracy_rag = evaluation_results["factual_accuracy"]["rag"]
     semantic_similarity_rag_query = evaluation_results["semantic_similarity_rag_query"]
 
-    # Weights based on user's previous formula: 0.40*faithfulness + 0.30*factual + 0.15*completeness + 0.10*clarity + 0.05*similarity
     reward = (
-        0.40 * rag_scores.get("faithfulness", 0) +
-        0.30 * factual_accuracy_rag +
-        0.15 * rag_scores.get("completeness", 0) +
-        0.10 * rag_scores.get("clarity", 0) +
-        0.05 * semantic_similarity_rag_query
+        weights["faithfulness"] * rag_scores.get("faithfulness", 0) +
+        weights["factual_accuracy"] * factual_accuracy_rag +
+        weights["completeness"] * rag_scores.get("completeness", 0) +
+        weights["clarity"] * rag_scores.get("clarity", 0) +
+        weights["semantic_similarity"] * semantic_similarity_rag_query
     )
     return round(reward, 3)
 
 def comprehensive_evaluation(query, rag_answer, llm_answer):
-    """Performs a comprehensive evaluation of two answers."""
+    """
+    Performs a comprehensive evaluation of two answers. The local model metrics
+    and the remote judge call are independent, so they run concurrently.
+    """
     print(f"[{datetime.now()}] Starting comprehensive_evaluation", file=sys.stderr)
-    
-    # Semantic Similarity (between RAG and LLM answers)
-    semantic_start_time = time.time()
-    semantic_similarity_rag_llm = calculate_semantic_similarity_between_answers(rag_answer, llm_answer)
-    semantic_end_time = time.time()
-    print(f"[{datetime.now()}] Semantic Similarity (RAG vs LLM) took {semantic_end_time - semantic_start_time:.2f} seconds", file=sys.stderr)
 
+    with span("evaluate"):
+        return _comprehensive_evaluation(query, rag_answer, llm_answer)
+
+def _comprehensive_evaluation(query, rag_answer, llm_answer):
+    graph = StageGraph()
+    # Semantic Similarity (between RAG and LLM answers)
+    graph.add("semantic_similarity_rag_llm", lambda: calculate_semantic_similarity_between_answers(rag_answer, llm_answer))
     # Semantic Similarity (RAG answer vs Query)
-    semantic_rag_query_start_time = time.time()
-    semantic_similarity_rag_query = calculate_semantic_similarity_to_query(rag_answer, query)
-    semantic_rag_query_end_time = time.time()
-    print(f"[{datetime.now()}] Semantic Similarity (RAG vs Query) took {semantic_rag_query_end_time - semantic_rag_query_start_time:.2f} seconds", file=sys.stderr)
-    
+    graph.add("semantic_similarity_rag_query", lambda: calculate_semantic_similarity_to_query(rag_answer, query))
     # BERTScore (RAG vs. LLM)
-    bert_start_time = time.time()
-    bert_score_rag_vs_llm = calculate_bert_score(rag_answer, llm_answer)
-    bert_end_time = time.time()
-    print(f"[{datetime.now()}] BERTScore took {bert_end_time - bert_start_time:.2f} seconds", file=sys.stderr)
-    
-    # Factual Accuracy
-    factual_start_time = time.time()
-    factual_accuracy_rag = check_factual_accuracy(query, rag_answer)
-    factual_accuracy_llm = check_factual_accuracy(query, llm_answer)
-    factual_end_time = time.time()
-    print(f"[{datetime.now()}] Factual Accuracy took {factual_end_time - factual_start_time:.2f} seconds", file=sys.stderr)
-    
+    graph.add("bert_score", lambda: calculate_bert_score(rag_answer, llm_answer))
+    # Factual Accuracy (both answers in one QA pipeline call)
+    graph.add("factual_accuracy", lambda: check_factual_accuracy_batch(query, [rag_answer, llm_answer]))
     # Judge Evaluation
-    judge_start_time = time.time()
-    judge_evaluation = get_judge_evaluation(query, rag_answer, llm_answer)
-    judge_end_time = time.time()
-    print(f"[{datetime.now()}] Judge Evaluation took {judge_end_time - judge_start_time:.2f} seconds", file=sys.stderr)
-    
+    graph.add("judge", lambda: get_judge_evaluation(query, rag_answer, llm_answer))
+    results, timings = graph.run()
+
     # Combine all scores
     evaluation_results = {
-        "semantic_similarity_rag_llm": semantic_similarity_rag_llm,
-        "semantic_similarity_rag_query": semantic_similarity_rag_query,
-        "bert_score_rag_vs_llm": bert_score_rag_vs_llm,
+        "semantic_similarity_rag_llm": results["semantic_similarity_rag_llm"],
+        "semantic_similarity_rag_query": results["semantic_similarity_rag_query"],
+        "bert_score_rag_vs_llm": results["bert_score"],
         "factual_accuracy": {
-            "rag": factual_accuracy_rag,
-            "llm": factual_accuracy_llm
+            "rag": results["factual_accuracy"][0],
+            "llm": results["factual_accuracy"][1]
         },
-        "judge": judge_evaluation
+        "judge": results["judge"]
     }
 
     # Calculate RAG reward
     rag_reward = calculate_reward(evaluation_results)
     evaluation_results["rag_reward"] = rag_reward
+    evaluation_results["timings"] = timings
 
     print(f"[{datetime.now()}] Finished comprehensive_evaluation", file=sys.stderr)
     return evaluation_results
 
+# ======== BATCH EVALUATION ========
+def _row_cosine(a, b):
+    """Row-wise cosine similarity of two equally shaped matrices."""
+    denominator = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    denominator[denominator == 0] = 1.0
+    return (a * b).sum(axis=1) / denominator
+
+def evaluate_batch(items, use_judge=True, judge_workers=4, weights=None):
+    """
+    Evaluates a list of {"query", "rag_answer", "llm_answer"} dicts with one
+    embedding call, one BERTScore call and one QA pipeline call for the whole
+    list. An item that already carries a "judge" result (e.g. a previous
+    evaluation) reuses it; otherwise the judge runs if `use_judge` is set.
+    """
+    n = len(items)
+    queries = [item.get("query") or "" for item in items]
+    rag_answers = [item.get("rag_answer") or item.get("answer") or "" for item in items]
+    llm_answers = [item.get("llm_answer") or "" for item in items]
+
+    # Semantic similarity: every query and answer encoded in one call
+    embeddings = get_semantic_model().encode(queries + rag_answers + llm_answers)
+    query_emb, rag_emb, llm_emb = embeddings[:n], embeddings[n:2 * n], embeddings[2 * n:]
+    sim_rag_llm = _row_cosine(rag_emb, llm_emb)
+    sim_rag_query = _row_cosine(rag_emb, query_emb)
+
+    # BERTScore over all pairs that have both answers
+    bert = [{"precision": 0.0, "recall": 0.0, "f1": 0.0} for _ in range(n)]
+    paired = [i for i in range(n) if rag_answers[i] and llm_answers[i]]
+    if paired:
+        P, R, F1 = bert_scorer([rag_answers[i] for i in paired], [llm_answers[i] for i in paired])
+        for j, i in enumerate(paired):
+            bert[i] = {"precision": round(P[j].item(), 3), "recall": round(R[j].item(), 3), "f1": round(F1[j].item(), 3)}
+
+    # QA factual checks for every answer in one pipeline call
+    factual = [0.0] * (2 * n)
+    contexts = rag_answers + llm_answers
+    present = [i for i in range(2 * n) if queries[i % n] and contexts[i]]
+    if present:
+        results = get_qa_pipeline()(question=[queries[i % n] for i in present], context=[contexts[i] for i in present], batch_size=16)
+        if isinstance(results, dict):
+            results = [results]
+        for i, result in zip(present, results):
+            factual[i] = round(result['score'], 3)
+
+    # Judge calls are remote, so they run in parallel threads
+    judges = [item.get("judge") for item in items]
+    missing = [i for i in range(n) if judges[i] is None]
+    if use_judge and missing:
+        with ThreadPoolExecutor(max_workers=judge_workers) as executor:
+            for i, judge in zip(missing, executor.map(lambda i: get_judge_evaluation(queries[i], rag_answers[i], llm_answers[i]), missing)):
+                judges[i] = judge
+
+    evaluations = []
+    for i in range(n):
+        evaluation_results = {
+            "semantic_similarity_rag_llm": round(float(sim_rag_llm[i]), 3) if rag_answers[i] and llm_answers[i] else 0.0,
+            "semantic_similarity_rag_query": round(float(sim_rag_query[i]), 3) if rag_answers[i] and queries[i] else 0.0,
+            "bert_score_rag_vs_llm": bert[i],
+            "factual_accuracy": {"rag": factual[i], "llm": factual[n + i]},
+            "judge": judges[i] or {"rag_scores": {}, "llm_scores": {}, "winner": "Skipped", "justification": ""}
+        }
+        evaluation_results["rag_reward"] = calculate_reward(evaluation_results, weights)
+        evaluations.append(evaluation_results)
+    return evaluations
+
+def batch_evaluation(input_path, output, batch_size=64, use_judge=True, judge_workers=4, weights=None):
+    """Streams a JSONL file of triples through evaluate_batch and writes one JSONL result per line."""
+    def flush(batch):
+        for item, evaluation in zip(batch, evaluate_batch(batch, use_judge, judge_workers, weights)):
+            output.write(json.dumps({"query": item.get("query"), "timestamp": item.get("timestamp"), "evaluation": evaluation}) + "\n")
+        output.flush()
+        print(f"[{datetime.now()}] Evaluated {len(batch)} items", file=sys.stderr)
+
+    batch = []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) == batch_size:
+                flush(batch)
+                batch = []
+    if batch:
+        flush(batch)
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate RAG vs. LLM answers. Without --batch, reads one JSON triple from stdin.")
+    parser.add_argument("--batch", help="JSONL file of {query, rag_answer (or answer), llm_answer[, judge]} objects")
+    parser.add_argument("--output", help="Where to write JSONL results (default: stdout)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--no-judge", action="store_true", help="Skip the Groq judge for items without a stored judge result")
+    parser.add_argument("--judge-workers", type=int, default=4)
+    parser.add_argument("--weights", type=json.loads, help='Reward weight overrides as JSON, e.g. \'{"faithfulness": 0.5}\'')
+    args = parser.parse_args()
+
+    if args.batch:
+        output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            batch_evaluation(args.batch, output, args.batch_size, not args.no_judge, args.judge_workers, args.weights)
+        finally:
+            if args.output:
+                output.close()
+        sys.exit(0)
+
     data = json.load(sys.stdin)
     query = data.get("query")
     rag_answer = data.get("rag_answer")
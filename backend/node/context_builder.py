@@ -0,0 +1,142 @@
+import sys
+import threading
+
+import numpy as np
+
+from chunking import split_sentences
+from embedding_service import get_embedding_service
+from rag_resources import get_setting
+from tracing import count, span
+
+# ======== CONTEXT SETTINGS ========
+CONTEXT_TOKEN_BUDGET = int(get_setting("CONTEXT_TOKEN_BUDGET", "2000"))  # Prompt tokens spent on retrieved passages
+# Tokenizer of the generation model (llama-3.3-70b-versatile uses the Llama 3 tokenizer; this mirror is not gated)
+CONTEXT_TOKENIZER = get_setting("CONTEXT_TOKENIZER", "NousResearch/Meta-Llama-3-8B-Instruct")
+CONTEXT_MMR_LAMBDA = float(get_setting("CONTEXT_MMR_LAMBDA", "0.7"))  # 1.0 = relevance only, lower = more diversity
+CONTEXT_DUPLICATE_THRESHOLD = float(get_setting("CONTEXT_DUPLICATE_THRESHOLD", "0.92"))  # Cosine above which a passage is a near-duplicate
+CONTEXT_MIN_PASSAGE_TOKENS = int(get_setting("CONTEXT_MIN_PASSAGE_TOKENS", "64"))  # Smallest useful truncated passage
+SEPARATOR = "\n\n"
+
+_tokenizer = None
+_tokenizer_failed = False
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """The generation model's tokenizer, or None if it cannot be loaded (then tokens are estimated)."""
+    global _tokenizer, _tokenizer_failed
+    with _tokenizer_lock:
+        if _tokenizer is None and not _tokenizer_failed:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(CONTEXT_TOKENIZER)
+            except Exception as e:
+                print(f"Could not load tokenizer {CONTEXT_TOKENIZER} ({e}); estimating tokens from characters.", file=sys.stderr)
+                _tokenizer_failed = True
+        return _tokenizer
+
+
+def count_llm_tokens(text):
+    """Tokens `text` costs the generation model; about 4 characters per token without the tokenizer."""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return (len(text) + 3) // 4
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """The longest run of leading whole sentences of `text` that fits in `max_tokens`."""
+    kept, used = [], 0
+    for sentence in split_sentences(text):
+        tokens = count_llm_tokens(sentence + " ")
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    return " ".join(kept)
+
+
+def mmr_order(relevance, similarity, mmr_lambda=CONTEXT_MMR_LAMBDA, duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD):
+    """
+    Maximal marginal relevance: repeatedly picks the candidate with the best
+    mmr_lambda * relevance - (1 - mmr_lambda) * (highest similarity to an
+    already picked one). Candidates more similar than `duplicate_threshold`
+    to a picked one are dropped. Returns (picked indexes in order, dropped).
+    """
+    remaining = list(range(len(relevance)))
+    picked, dropped = [], []
+    closest = np.zeros(len(relevance))
+    while remaining:
+        best = max(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * closest[i])
+        remaining.remove(best)
+        if picked and closest[best] >= duplicate_threshold:
+            dropped.append(best)
+            continue
+        picked.append(best)
+        closest = np.maximum(closest, similarity[best])
+    return picked, dropped
+
+
+def build_context(passages, budget=CONTEXT_TOKEN_BUDGET, titles=False):
+    """
+    Turns retrieved passages (in retrieval order, see retrieval.py) into the
+    prompt context. Near-duplicate passages are removed with MMR over their
+    MiniLM embeddings, passages are added in MMR order until `budget` tokens
+    of the generation model are used (the last one may be cut at a sentence
+    boundary), and the result is ordered by relevance. With `titles`, each
+    passage is prefixed with its page title.
+
+    Returns {"context", "passages" (the ones used), "tokens", "dropped"}.
+    """
+    with span("build_context", candidates=len(passages), budget=budget) as current:
+        result = _build_context(passages, budget, titles)
+        current.set(passages=len(result["passages"]), tokens=result["tokens"], dropped=result["dropped"])
+    return result
+
+
+def _format(passage, text, titles):
+    return f"{passage['title']}: {text}" if titles else text
+
+
+def _build_context(passages, budget, titles):
+    passages = [p for p in passages if p.get("text")]
+    if not passages:
+        return {"context": "", "passages": [], "tokens": 0, "dropped": {"duplicate": 0, "budget": 0}}
+
+    # Retrieval scores are cosine, RRF or cross-encoder values depending on the
+    # settings, so relevance is taken from their order rather than their scale
+    n = len(passages)
+    relevance = np.array([1.0 - i / n for i in range(n)])
+    vectors = get_embedding_service().encode([p["text"] for p in passages])
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit = vectors / norms
+    picked, duplicates = mmr_order(relevance, unit @ unit.T)
+
+    used, over_budget, selected = 0, 0, []
+    separator_tokens = count_llm_tokens(SEPARATOR)
+    for i in picked:
+        cost = separator_tokens if selected else 0
+        text = _format(passages[i], passages[i]["text"], titles)
+        tokens = count_llm_tokens(text)
+        if used + cost + tokens > budget:
+            room = budget - used - cost - count_llm_tokens(_format(passages[i], "", titles))
+            truncated = truncate_to_tokens(passages[i]["text"], room) if room >= CONTEXT_MIN_PASSAGE_TOKENS else ""
+            if not truncated:
+                over_budget += 1
+                continue
+            text = _format(passages[i], truncated, titles)
+            tokens = count_llm_tokens(text)
+        used += cost + tokens
+        selected.append((i, text))
+
+    selected.sort()  # Back into relevance order
+    count("context_passages_dropped", len(duplicates), reason="duplicate")
+    count("context_passages_dropped", over_budget, reason="budget")
+    count("context_tokens", used)
+    return {
+        "context": SEPARATOR.join(text for _, text in selected),
+        "passages": [passages[i] for i, _ in selected],
+        "tokens": used,
+        "dropped": {"duplicate": len(duplicates), "budget": over_budget},
+    }
@@ -1,85 +1,264 @@
+import argparse
 import json
-import dotenv
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
 import os
+import random
+import sys
+import time
+import dotenv
+from rag_resources import INDEX_NAME, EMBEDDING_DIM, get_setting, get_index
+from embedding_service import get_embedding_service
+from chunking import chunk_id, chunk_text
+from chunk_store import get_chunk_store
+from bm25_index import get_bm25_index
+from scrape_cache import get_scrape_cache
+from ingestion import delete_documents, document_id, normalize_url, purge_legacy_vectors, store_document
 
 # ======== STEP 1: LOAD ENVIRONMENT VARIABLES ========
 dotenv.load_dotenv()
 
 PINECONE_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "PINECONE_API_KEY")
 
-# ======== STEP 2: INITIALIZE PINECONE ========
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index_name = "rag-knowledge-384"
-
-# Delete Pinecone index if it exists
-if index_name in [i.name for i in pc.list_indexes()]:
-    pc.delete_index(index_name)
-    print(f"Deleted existing Pinecone index: {index_name}")
-
-# Create Pinecone index
-pc.create_index(
-    name=index_name,
-    dimension=384,  # Hugging Face MiniLM outputs 384-dim embeddings
-    metric="cosine",
-    spec=ServerlessSpec(cloud="aws", region="us-east-1")
-)
-print(f"Created Pinecone index: {index_name}")
-
-index = pc.Index(index_name)
-print(f"Connected to Pinecone index: {index_name}")
-
-# ======== STEP 3: LOAD SCRAPED DATA ========
-DATA_PATH = "backend/node/scraped_data.json"
-
-if not os.path.exists(DATA_PATH):
-    raise FileNotFoundError(f"Could not find scraped data file: {DATA_PATH}")
-
-with open(DATA_PATH, "r", encoding="utf-8") as f:
-    all_results = json.load(f)
-
-print(f"Loaded {len(all_results)} documents from scraped_data.json")
-
-# ======== STEP 4: EMBEDDING FUNCTION (Hugging Face MiniLM) ========
-model = SentenceTransformer("all-MiniLM-L6-v2")  # Free, local 384-dim model
-
-def generate_embedding(text):
-    try:
-        return model.encode(text).tolist()
-    except Exception as e:
-        print(f"Error generating embedding: {e}")
-        return [0.0] * 384
-
-# ======== STEP 5: PREPARE & UPLOAD TO PINECONE ========
-vectors = []
-
-for i, item in enumerate(all_results):
-    text = item.get("content", "")[:4000]  # Truncate overly long text
-    emb = generate_embedding(text)
-    
-    vector = {
-        "id": str(i),
-        "values": emb,
-        "metadata": {
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scraped_data.json")
+UPSERT_BATCH_SIZE = int(get_setting("UPSERT_BATCH_SIZE", "100"))  # Vectors per upsert request, well under Pinecone's 2 MB limit
+UPSERT_RETRIES = int(get_setting("UPSERT_RETRIES", "5"))
+EMBED_BATCH_CHUNKS = 512  # Chunks embedded together before they are upserted and checkpointed
+
+
+# ======== STEP 2: INITIALIZE VECTOR STORE ========
+def rebuild_index():
+    """Deletes and recreates the index (the loader's original behaviour)."""
+    if get_setting("VECTOR_STORE", "pinecone") == "local":
+        index = get_index()
+        index.delete(delete_all=True)
+        print(f"Cleared local vector store: {index.path}")
+    else:
+        from pinecone import Pinecone, ServerlessSpec
+
+        pc = Pinecone(api_key=PINECONE_API_KEY)
+
+        # Delete Pinecone index if it exists
+        if INDEX_NAME in [i.name for i in pc.list_indexes()]:
+            pc.delete_index(INDEX_NAME)
+            print(f"Deleted existing Pinecone index: {INDEX_NAME}")
+
+        # Create Pinecone index
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=EMBEDDING_DIM,  # Hugging Face MiniLM outputs 384-dim embeddings
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region="us-east-1")
+        )
+        print(f"Created Pinecone index: {INDEX_NAME}")
+        index = pc.Index(INDEX_NAME)
+
+    # Chunk texts and BM25 entries of the old index are no longer referenced by any vector
+    get_chunk_store().clear()
+    get_bm25_index().clear()
+    return index
+
+
+# ======== STEP 3: STREAM SCRAPED DATA ========
+def read_documents(path, read_size=1 << 16):
+    """
+    Yields the documents of a JSONL file or a JSON array one at a time, without
+    loading the whole file into memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(read_size).lstrip()
+        if not buffer.startswith("["):
+            # JSON Lines: one document per line
+            while buffer:
+                lines = buffer.split("\n")
+                buffer = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+                more = f.read(read_size)
+                if not more:
+                    if buffer.strip():
+                        yield json.loads(buffer)
+                    return
+                buffer += more
+            return
+
+        # JSON array: decode one element at a time from a sliding buffer
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                more = f.read(read_size)
+                if not more:
+                    raise
+                buffer += more
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+# ======== STEP 4: CHECKPOINT ========
+class Checkpoint:
+    """
+    Remembers how many input records were fully uploaded, so an interrupted
+    load resumes after them. It only applies to the same, unmodified input file.
+    """
+
+    def __init__(self, path, input_path):
+        stat = os.stat(input_path)
+        self.path = path
+        self.key = {"input": os.path.abspath(input_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        return saved.get("records_done", 0) if saved.get("key") == self.key else 0
+
+    def save(self, records_done):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"key": self.key, "records_done": records_done}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# ======== STEP 5: EMBED & UPLOAD IN BATCHES ========
+def upsert_with_retry(index, vectors, retries=UPSERT_RETRIES):
+    """Upserts one batch, retrying with exponential backoff and jitter."""
+    for attempt in range(retries + 1):
+        try:
+            return index.upsert(vectors=vectors)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+            print(f"Upsert of {len(vectors)} vectors failed ({e}); retrying in {delay:.1f}s", file=sys.stderr)
+            time.sleep(delay)
+
+
+def flush(index, pending, batch_size):
+    """Embeds and upserts the pending documents, then records them as indexed."""
+    chunk_store = get_chunk_store()
+    scrape_cache = get_scrape_cache()
+
+    texts = [text for doc in pending for text in doc["chunks"]]
+    # Duplicate texts are encoded once and previously seen texts come from the embedding cache
+    embeddings = iter(get_embedding_service().encode(texts))
+
+    vectors = []
+    for doc in pending:
+        item = doc["item"]
+        doc["metadata"] = {
             "title": item.get("title", ""),
             "url": item.get("url", ""),
             "snippet": item.get("snippet", ""),
-            "query": item.get("query", "")
+            "query": item.get("query", ""),
         }
-    }
-    vectors.append(vector)
+        for position in range(len(doc["chunks"])):
+            vectors.append({
+                "id": chunk_id(doc["id"], position),
+                "values": next(embeddings).tolist(),
+                "metadata": {**doc["metadata"], "parent_id": doc["id"], "chunk": position}
+            })
+    for start in range(0, len(vectors), batch_size):
+        upsert_with_retry(index, vectors[start:start + batch_size])
+
+    for doc in pending:
+        url = doc["item"].get("url")
+        # The previous version of a changed page is removed once the new one is in;
+        # loaded documents never expire
+        if url:
+            delete_documents(index, [(p, n) for p, n in chunk_store.documents_for_url(normalize_url(url)) if p != doc["id"]])
+        store_document(doc["id"], doc["chunks"], doc["metadata"], url=normalize_url(url) if url else None)
+
+        # Pre-warm the scrape cache so these pages are not downloaded again at query time
+        if scrape_cache is not None and url:
+            scrape_cache.put(url, doc["item"]["content"])
+    return len(vectors)
+
+
+def load(index, input_path, checkpoint, batch_size=UPSERT_BATCH_SIZE):
+    chunk_store = get_chunk_store()
+    resume_from = checkpoint.load()
+    if resume_from:
+        print(f"Resuming after {resume_from} records from checkpoint {checkpoint.path}")
+
+    stats = {"records": 0, "indexed": 0, "unchanged": 0, "empty": 0, "chunks": 0}
+    pending, pending_chunks, seen = [], 0, set()
+    for number, item in enumerate(read_documents(input_path), start=1):
+        stats["records"] += 1
+        if number <= resume_from:
+            continue
+        content = item.get("content", "")
+        doc_id = document_id(item.get("url"), content)
+        if not content:
+            stats["empty"] += 1
+        elif doc_id in seen or chunk_store.has(doc_id):
+            stats["unchanged"] += 1
+        else:
+            # Each document is split into overlapping sentence-aligned chunks; the chunk
+            # texts go to the local chunk store and only their vectors to the index
+            chunks = chunk_text(content)
+            pending.append({"id": doc_id, "item": item, "chunks": chunks})
+            pending_chunks += len(chunks)
+            seen.add(doc_id)
+
+        if pending_chunks >= EMBED_BATCH_CHUNKS:
+            stats["chunks"] += flush(index, pending, batch_size)
+            stats["indexed"] += len(pending)
+            pending, pending_chunks = [], 0
+            checkpoint.save(number)
+
+    if pending:
+        stats["chunks"] += flush(index, pending, batch_size)
+        stats["indexed"] += len(pending)
+    checkpoint.clear()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed scraped documents and upload them to the vector store.")
+    parser.add_argument("--input", default=DATA_PATH, help="JSON array or JSON Lines file of documents")
+    parser.add_argument("--rebuild", action="store_true", help="Delete and recreate the index before loading")
+    parser.add_argument("--purge-legacy", action="store_true",
+                        help="Delete vectors with pre-chunking ids (dynamic-<n>, dynamic-<timestamp>, <n>) before loading")
+    parser.add_argument("--batch-size", type=int, default=UPSERT_BATCH_SIZE, help="Vectors per upsert request")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <input>.checkpoint)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        raise FileNotFoundError(f"Could not find scraped data file: {args.input}")
+    checkpoint = Checkpoint(args.checkpoint or args.input + ".checkpoint", args.input)
+
+    if args.rebuild:
+        checkpoint.clear()
+        index = rebuild_index()
+    else:
+        index = get_index()  # Created if it does not exist yet
+    print(f"Connected to index: {INDEX_NAME}")
+    if args.purge_legacy and not args.rebuild:  # A rebuilt index is empty
+        purge_legacy_vectors(index)
 
-# Upload all vectors to Pinecone
-if vectors:
-    index.upsert(vectors=vectors)
-    print(f"Uploaded {len(vectors)} documents to Pinecone successfully!")
-else:
-    print("No vectors found to upload.")
+    stats = load(index, args.input, checkpoint, args.batch_size)
+    print(
+        f"Processed {stats['records']} records: {stats['indexed']} new or changed documents "
+        f"uploaded as {stats['chunks']} chunks, {stats['unchanged']} unchanged, {stats['empty']} without content"
+    )
 
-# ======== STEP 6: VERIFY INDEX ========
+    # ======== STEP 6: VERIFY INDEX ========
+    stats = index.describe_index_stats()
+    print("Index Stats:")
+    print(stats.to_dict() if hasattr(stats, "to_dict") else stats)
 
-stats = index.describe_index_stats()
-print("Pinecone Index Stats:")
-print(stats.to_dict())
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from inference_backend import EMBED_BACKEND
+from rag_resources import EMBED_MODEL_NAME, EMBEDDING_DIM, get_embedder, get_setting
+from tracing import count, span
+
+# ======== EMBEDDING SETTINGS ========
+EMBEDDING_CACHE_PATH = get_setting("EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.db"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(get_setting("EMBEDDING_CACHE_MAX_ENTRIES", "20000"))  # ~1.5 KB per vector
+EMBEDDING_BATCH_SIZE = int(get_setting("EMBEDDING_BATCH_SIZE", "32"))
+# Quantized vectors differ slightly from fp32 ones, so each backend caches its own
+EMBEDDING_CACHE_TAG = EMBED_MODEL_NAME if EMBED_BACKEND == "torch" else f"{EMBED_MODEL_NAME}@{EMBED_BACKEND}"
+
+
+def content_hash(text):
+    """Stable hex digest of a text, used as a cache key and document fingerprint."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cosine_similarity(a, b):
+    """Cosine similarity between two 1-D vectors."""
+    denominator = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b)) / denominator if denominator else 0.0
+
+
+class EmbeddingCache:
+    """
+    On-disk content-hash -> vector cache in SQLite. Entries carry a last-used
+    timestamp and the least recently used ones are evicted once the cache
+    holds more than `max_entries` vectors.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):  # Stay below SQLite's bound-parameter limit
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+                self._conn.commit()
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+                )
+            self._conn.commit()
+
+
+class EmbeddingService:
+    """
+    Single entry point for MiniLM encodes. A call to `encode` removes duplicate
+    texts, serves cached vectors, and encodes the rest in length-sorted batches
+    so that each batch pads to similar lengths.
+    """
+
+    def __init__(self, cache=None, batch_size=EMBEDDING_BATCH_SIZE):
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.batch_size = batch_size
+        self.stats = {"requested": 0, "cache_hits": 0, "encoded": 0}
+        self._model_lock = threading.Lock()
+        self._stats_lock = threading.Lock()  # The service is shared by the server's worker threads
+
+    def encode(self, texts):
+        """Returns a float32 array with one embedding row per input text."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        keys = [content_hash(f"{EMBEDDING_CACHE_TAG}\n{text}") for text in texts]
+        unique = dict(zip(keys, texts))
+
+        vectors = self.cache.get_many(list(unique))
+        missing = sorted((key for key in unique if key not in vectors), key=lambda key: len(unique[key]), reverse=True)
+        count("embeddings", len(unique) - len(missing), source="cache")
+        if missing:
+            with span("embed", texts=len(missing)):
+                model = get_embedder()
+                new_vectors = []
+                with self._model_lock:
+                    for start in range(0, len(missing), self.batch_size):
+                        batch = [unique[key] for key in missing[start:start + self.batch_size]]
+                        new_vectors.extend(model.encode(batch, batch_size=self.batch_size, convert_to_numpy=True))
+            count("embeddings", len(missing), source="model")
+            self.cache.put_many(zip(missing, new_vectors))
+            vectors.update(zip(missing, new_vectors))
+
+        with self._stats_lock:
+            self.stats["requested"] += len(texts)
+            self.stats["cache_hits"] += len(unique) - len(missing)
+            self.stats["encoded"] += len(missing)
+        return np.stack([np.asarray(vectors[key], dtype=np.float32) for key in keys])
+
+    def encode_one(self, text):
+        return self.encode([text])[0]
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service():
+    """Returns the process-wide EmbeddingService."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService()
+        return _service
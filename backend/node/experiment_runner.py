@@ -0,0 +1,288 @@
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from bench_e2e import RESULTS_DIR, git_revision, summarize
+
+NODE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(NODE_DIR, "scraped_data.json")
+
+# Alternative weightings for calculate_reward in comprehensive_evaluate.py; unset weights keep their defaults
+WEIGHT_PRESETS = {
+    "default": {},
+    "judge": {"faithfulness": 0.45, "factual_accuracy": 0.10, "completeness": 0.25, "clarity": 0.15, "semantic_similarity": 0.05},
+    "factual": {"faithfulness": 0.30, "factual_accuracy": 0.50, "completeness": 0.10, "clarity": 0.05, "semantic_similarity": 0.05},
+}
+LIVE_ONLY_PRESETS = {"judge"}  # Weighted almost entirely on the judge terms, so only meaningful with --live-llm
+JUDGE_TERMS = ("faithfulness", "completeness", "clarity")  # The reward terms scored by the LLM judge
+
+
+def stubbed_weights(weights):
+    """
+    `weights` with the judge terms zeroed. The stand-in judge returns the same
+    scores for every answer, so those terms would only add a constant; what is
+    left measures retrieval and QA overlap (factual accuracy, similarity).
+    """
+    return {**weights, **{term: 0.0 for term in JUDGE_TERMS}}
+
+
+def load_logged_queries(limit=None):
+    """Distinct logged queries, oldest first."""
+    from reward_store import get_reward_store
+    queries = list(dict.fromkeys(entry["query"] for entry in get_reward_store().between() if entry.get("query")))
+    return queries[:limit] if limit else queries
+
+
+def config_grid(top_ks, chunking, rerank):
+    """Every combination of the pipeline settings, as {"name", "top_k", "chunking", "rerank"} dicts."""
+    configs = []
+    for top_k, chunk, rr in itertools.product(top_ks, chunking, rerank):
+        configs.append({
+            "name": f"top_k={top_k},chunking={'on' if chunk else 'off'},rerank={'on' if rr else 'off'}",
+            "top_k": top_k,
+            "chunking": chunk,
+            "rerank": rr,
+        })
+    return configs
+
+
+def _flags(value):
+    return [v.strip().lower() in ("1", "on", "true", "yes") for v in value.split(",")]
+
+
+# ======== WORKER ========
+def run_config(config, queries, weight_sets, settings, verbose=False):
+    """
+    Replays `queries` through one pipeline configuration in this (fresh)
+    process. The settings are applied before any pipeline module is imported,
+    because those read them at import time. Each query goes through ingestion,
+    retrieval, context building and generation as in rag_query.py; the answers
+    are then evaluated in one batch and scored with every weight set.
+    """
+    os.environ.update(settings)
+    os.environ["CHUNKING_ENABLED"] = "1" if config["chunking"] else "0"
+    os.environ["RERANK_ENABLED"] = "1" if config["rerank"] else "0"
+
+    output = sys.stderr if verbose else open(os.devnull, "w")
+    records, errors = [], []
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            from comprehensive_evaluate import calculate_reward, evaluate_batch
+            from context_builder import build_context
+            from embedding_service import get_embedding_service
+            from rag_query import build_prompt, generate_answer, ingest_web_results
+            from rag_query_compare import generate_llm_answer
+            from rag_resources import get_index
+            from retrieval import retrieve_passages
+
+            embedder = get_embedding_service()
+            index = get_index()
+            for query in queries:
+                try:
+                    timings = {}
+                    start = time.perf_counter()
+                    query_emb = embedder.encode_one(query).tolist()
+                    ingest_web_results(query, index, embedder)
+                    timings["ingestion"] = time.perf_counter() - start
+
+                    mark = time.perf_counter()
+                    passages = retrieve_passages(query_emb, index, top_k=config["top_k"], query=query)
+                    built = build_context(passages, titles=True)
+                    timings["retrieval"] = time.perf_counter() - mark
+
+                    mark = time.perf_counter()
+                    answer = generate_answer(build_prompt(query, built["context"]), emit=lambda message: None)
+                    timings["generation"] = time.perf_counter() - mark
+                    timings["total"] = time.perf_counter() - start
+
+                    records.append({
+                        "query": query,
+                        "rag_answer": answer,
+                        # The baseline the evaluator compares against; not part of the measured latency
+                        "llm_answer": generate_llm_answer(query),
+                        "timings": timings,
+                        "context_tokens": built["tokens"],
+                        "passages": len(built["passages"]),
+                    })
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+
+            evaluations = evaluate_batch(records) if records else []
+    except Exception as e:
+        return {**config, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        if output is not sys.stderr:
+            output.close()
+
+    stages = sorted({name for record in records for name in record["timings"]})
+    return {
+        **config,
+        "replayed": len(records),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:3],
+        "latency": {name: summarize([r["timings"].get(name) for r in records]) for name in stages},
+        "context_tokens": summarize([r["context_tokens"] for r in records]),
+        "passages": summarize([r["passages"] for r in records]),
+        "reward": {
+            preset: summarize([calculate_reward(evaluation, weights) for evaluation in evaluations])
+            for preset, weights in weight_sets.items()
+        },
+    }
+
+
+# ======== REPORT ========
+def recommend(results, presets, tolerance):
+    """
+    For each weight set, the configuration with the lowest median total latency
+    among those whose mean reward is at most `tolerance` reward points below
+    the best.
+    """
+    picks = {}
+    for preset in presets:
+        scored = [r for r in results if "error" not in r and (r["reward"].get(preset) or {}).get("mean") is not None
+                  and (r["latency"].get("total") or {}).get("p50") is not None]
+        if not scored:
+            continue
+        best = max(r["reward"][preset]["mean"] for r in scored)
+        eligible = [r for r in scored if r["reward"][preset]["mean"] >= best - tolerance]
+        fastest = min(eligible, key=lambda r: r["latency"]["total"]["p50"])
+        picks[preset] = {
+            "config": fastest["name"],
+            "reward_mean": fastest["reward"][preset]["mean"],
+            "best_reward_mean": best,
+            "total_p50": fastest["latency"]["total"]["p50"],
+            "context_tokens_mean": (fastest["context_tokens"] or {}).get("mean"),
+        }
+    return picks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay logged queries through alternative pipeline configurations offline.")
+    parser.add_argument("--top-k", default="3,5", help="Comma-separated top_k values")
+    parser.add_argument("--chunking", default="on,off", help="Comma-separated on/off values")
+    parser.add_argument("--rerank", default="off,on", help="Comma-separated on/off values")
+    parser.add_argument("--weights", help="Comma-separated presets from WEIGHT_PRESETS, or a JSON file of {name: weights} "
+                                          "(default: every preset usable with the chosen LLM)")
+    parser.add_argument("--limit", type=int, help="Replay only the first N logged queries")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Configurations replayed in parallel; above 1 they compete for the CPU, so no latency recommendation is made")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Mean reward loss (absolute, in reward points) accepted for a faster configuration")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="Stand-in LLM time to first token")
+    parser.add_argument("--live-llm", action="store_true", help="Use the real Groq API (GROQ_API_KEY) for answers and the judge instead of the stand-in")
+    parser.add_argument("--output", help=f"Result file (default: {RESULTS_DIR}/experiment-<revision>-<time>.json)")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipelines' own output")
+    args = parser.parse_args()
+
+    if args.weights and os.path.exists(args.weights):
+        with open(args.weights, "r", encoding="utf-8") as f:
+            weight_sets = json.load(f)
+    else:
+        names = args.weights.split(",") if args.weights else [
+            name for name in WEIGHT_PRESETS if args.live_llm or name not in LIVE_ONLY_PRESETS
+        ]
+        unknown = [name for name in names if name not in WEIGHT_PRESETS]
+        if unknown:
+            parser.error(f"unknown weight presets: {', '.join(unknown)}")
+        if not args.live_llm and LIVE_ONLY_PRESETS.intersection(names):
+            parser.error(f"{', '.join(sorted(LIVE_ONLY_PRESETS.intersection(names)))} weights need --live-llm")
+        weight_sets = {name: WEIGHT_PRESETS[name] for name in names}
+    if not args.live_llm:
+        weight_sets = {name: stubbed_weights(weights) for name, weights in weight_sets.items()}
+        # Unset weights keep their (non-zero) defaults in calculate_reward
+        judge_only = [name for name, weights in weight_sets.items()
+                      if weights.get("factual_accuracy", 1) == 0 and weights.get("semantic_similarity", 1) == 0]
+        if judge_only:
+            parser.error(f"{', '.join(judge_only)} weights only use judge terms and need --live-llm")
+    configs = config_grid([int(k) for k in args.top_k.split(",")], _flags(args.chunking), _flags(args.rerank))
+    queries = load_logged_queries(args.limit)
+    if not queries:
+        print(json.dumps({"error": "No logged queries to replay"}))
+        return
+
+    # Search and the LLM are local stand-ins, and search results point at the
+    # original URLs, which are all served from a pre-warmed scrape cache
+    from fake_services import FakeServices
+    from scrape_cache import ScrapeCache
+    workdir = tempfile.mkdtemp(prefix="experiment-")
+    scrape_cache_path = os.path.join(workdir, "scrape_cache.db")
+    ScrapeCache(path=scrape_cache_path).prewarm(DATA_PATH)
+    services = FakeServices(page_hosts=1, search_latency_ms=0, llm_latency_ms=args.llm_latency_ms, llm_tokens_per_s=0,
+                            original_links=True).start()
+
+    def settings(config):
+        directory = os.path.join(workdir, config["name"].replace(",", "_").replace("=", "-"))
+        os.makedirs(directory, exist_ok=True)
+        values = {
+            **services.environ(),
+            "SCRAPE_CACHE_PATH": scrape_cache_path,
+            "SCRAPE_CACHE_TTL": str(10 * 365 * 24 * 3600),
+            "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.db"),  # Content-addressed, so shared
+            "LOCAL_VECTOR_STORE_DIR": os.path.join(directory, "vector_store"),
+            "CHUNK_STORE_PATH": os.path.join(directory, "chunk_store.db"),
+            "BM25_PATH": os.path.join(directory, "bm25_index.db"),
+            "REWARD_DB_PATH": os.path.join(directory, "reward_store.db"),
+            "POLICY_DB_PATH": os.path.join(directory, "policy_store.db"),
+            "LLM_CACHE_PATH": os.path.join(directory, "llm_cache.db"),
+            "SEMANTIC_CACHE_ENABLED": "0",
+        }
+        if args.live_llm:
+            for name in ("GROQ_BASE_URL", "GROQ_API_KEY"):
+                values.pop(name)
+        return values
+
+    print(f"Replaying {len(queries)} queries through {len(configs)} configurations with {args.workers} workers", file=sys.stderr)
+    results = []
+    start = time.perf_counter()
+    try:
+        # One fresh process per configuration: the pipeline modules read their settings at import time
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"), max_tasks_per_child=1) as executor:
+            futures = [executor.submit(run_config, config, queries, weight_sets, settings(config), args.verbose) for config in configs]
+            for future in futures:
+                result = future.result()
+                results.append(result)
+                total = (result.get("latency") or {}).get("total") or {}
+                reward = ((result.get("reward") or {}).get(next(iter(weight_sets))) or {}).get("mean")
+                if "error" in result:
+                    print(f"{result['name']}: failed ({result['error']})", file=sys.stderr)
+                else:
+                    print(f"{result['name']}: total p50 {total.get('p50')}s, mean reward {reward}, {result['errors']} errors", file=sys.stderr)
+    finally:
+        services.stop()
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+        "queries": len(queries),
+        "wall_seconds": round(time.perf_counter() - start, 1),
+        "judge": "live" if args.live_llm else "stand-in",
+        "reward_note": None if args.live_llm else
+        "Stand-in judge: the judge terms are zeroed, so rewards only measure retrieval and QA overlap "
+        "(factual_accuracy, semantic_similarity). Use --live-llm for judge-weighted rewards.",
+        "weights": weight_sets,
+        "configs": results,
+        "service_calls": services.stats,
+        # Concurrent workers slow each other down depending on what runs alongside, so their latencies are not comparable
+        "recommendation": recommend(results, weight_sets, args.tolerance) if args.workers == 1 else None,
+    }
+    path = args.output or os.path.join(RESULTS_DIR, f"experiment-{report['revision'] or 'unknown'}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if report["recommendation"] is None:
+        print(f"No recommendation: latencies measured with {args.workers} concurrent workers are not comparable; rerun with --workers 1.", file=sys.stderr)
+    else:
+        print(json.dumps(report["recommendation"], indent=2))
+    print(f"Saved results to {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import re
+import sys
+from html.parser import HTMLParser
+
+from rag_resources import get_setting
+
+# ======== EXTRACTION SETTINGS ========
+EXTRACT_ENGINE = get_setting("EXTRACT_ENGINE", "auto")  # auto, lxml, stream or bs4
+# Text beyond this is never embedded (chunking keeps at most CHUNK_MAX_PER_DOC chunks), so parsing stops there; 0 disables
+EXTRACT_MAX_CHARS = int(get_setting("EXTRACT_MAX_CHARS", "40000"))
+MIN_EXTRACTED_LENGTH = 200  # Below this the boilerplate rules probably removed the content itself
+
+# Elements that never hold article text
+DROP_TAGS = {"script", "style", "noscript", "iframe", "svg", "template", "nav", "footer", "aside", "form", "button", "select"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "dialog", "alertdialog"}
+BOILERPLATE_TOKEN = re.compile(
+    r"^(cookie|consent|gdpr)"
+    r"|^(nav|navbar|navigation|menu|site-footer|footer|sidebar|breadcrumbs?|share|sharing|social|newsletter|subscribe|popup|modal|advert|ads?|banner|promo)$"
+)
+# Containers whose classes often describe the page layout rather than the element itself
+NEVER_BOILERPLATE = {"html", "body", "main", "article"}
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.I)
+
+
+def is_boilerplate(tag, attrs, use_attributes=True):
+    """True for navigation, footers, cookie banners and similar page furniture."""
+    if tag in DROP_TAGS:
+        return True
+    if not use_attributes or tag in NEVER_BOILERPLATE:
+        return False
+    if (attrs.get("role") or "").lower() in BOILERPLATE_ROLES:
+        return True
+    tokens = f"{attrs.get('class') or ''} {attrs.get('id') or ''}".lower().split()
+    return any(BOILERPLATE_TOKEN.search(token) for token in tokens)
+
+
+def decode_html(html):
+    """Decodes page bytes using the declared meta charset, falling back to UTF-8."""
+    if isinstance(html, str):
+        return html
+    match = _META_CHARSET.search(html[:4096])
+    encoding = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return html.decode(encoding, errors="replace")
+    except LookupError:
+        return html.decode("utf-8", errors="replace")
+
+
+class _TextCollector:
+    """Joins stripped text pieces with single spaces and signals when the limit is reached."""
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.parts = []
+        self.length = 0
+
+    def add(self, text):
+        text = text.strip()
+        if text:
+            self.parts.append(text)
+            self.length += len(text) + 1
+
+    @property
+    def full(self):
+        return bool(self.max_chars) and self.length >= self.max_chars
+
+    def text(self):
+        text = " ".join(self.parts)
+        return text[:self.max_chars] if self.max_chars else text
+
+
+# ======== ENGINE: LXML ========
+def extract_lxml(html, max_chars=EXTRACT_MAX_CHARS, use_attributes=True):
+    """Parses with lxml's C parser, drops boilerplate subtrees and collects text until the limit."""
+    import lxml.html
+
+    if isinstance(html, str):
+        html = html.encode("utf-8")
+    root = lxml.html.fromstring(html)
+    doomed = [
+        el for el in root.iter()
+        if isinstance(el.tag, str) and is_boilerplate(el.tag.lower(), el.attrib, use_attributes)
+    ]
+    for el in doomed:
+        if el.getparent() is not None:
+            el.drop_tree()
+
+    collected = _TextCollector(max_chars)
+    for text in root.itertext():
+        collected.add(text)
+        if collected.full:
+            break
+    return collected.text()
+
+
+# ======== ENGINE: STREAMING TOKENIZER ========
+class _StopParsing(Exception):
+    pass
+
+
+class _StreamingExtractor(HTMLParser):
+    """Stdlib tokenizer that skips boilerplate subtrees without building a tree."""
+
+    def __init__(self, collected, use_attributes):
+        super().__init__(convert_charrefs=True)
+        self.collected = collected
+        self.use_attributes = use_attributes
+        self.skipping = []  # Open tags inside the boilerplate subtree being skipped
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+        if self.skipping:
+            self.skipping.append(tag)
+        elif is_boilerplate(tag, dict(attrs), self.use_attributes):
+            self.skipping.append(tag)
+
+    def handle_endtag(self, tag):
+        # Unclosed tags inside the skipped subtree are closed along with it
+        if tag in self.skipping:
+            while self.skipping.pop() != tag:
+                pass
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.collected.add(data)
+            if self.collected.full:
+                raise _StopParsing()
+
+
+def extract_stream(html, max_chars=EXTRACT_MAX_CHARS, use_attributes=True, feed_size=32768):
+    """Tokenizes the page in slices and stops as soon as enough text was collected."""
+    collected = _TextCollector(max_chars)
+    parser = _StreamingExtractor(collected, use_attributes)
+    html = decode_html(html)
+    try:
+        for start in range(0, len(html), feed_size):
+            parser.feed(html[start:start + feed_size])
+        parser.close()
+    except _StopParsing:
+        pass
+    return collected.text()
+
+
+# ======== ENGINE: BEAUTIFULSOUP (FALLBACK) ========
+def extract_bs4(html, max_chars=EXTRACT_MAX_CHARS, use_attributes=True):
+    """The original extraction: a full html.parser tree without boilerplate removal."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Remove unwanted elements
+    for tag in soup(['script', 'style', 'noscript', 'iframe']):
+        tag.decompose()
+
+    # Extract readable text
+    text = soup.get_text(separator=' ', strip=True)
+    return text[:max_chars] if max_chars else text
+
+
+ENGINES = {
+    "lxml": extract_lxml,
+    "stream": extract_stream,
+    "bs4": extract_bs4,
+}
+
+
+def resolve_engine(engine=EXTRACT_ENGINE):
+    """Maps "auto" to lxml when it is installed and to the streaming tokenizer otherwise."""
+    if engine != "auto":
+        return engine
+    try:
+        import lxml.html  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "stream"
+
+
+def extract_text(html, engine=EXTRACT_ENGINE, max_chars=EXTRACT_MAX_CHARS):
+    """
+    Extracts readable text from an HTML document with the configured engine.
+    If the boilerplate rules leave almost nothing, the page is extracted again
+    using tag rules only; if the engine fails, BeautifulSoup is used instead.
+    """
+    name = resolve_engine(engine)
+    try:
+        text = ENGINES[name](html, max_chars)
+        if len(text) < MIN_EXTRACTED_LENGTH and name != "bs4":
+            text = ENGINES[name](html, max_chars, use_attributes=False)
+        return text
+    except Exception as e:
+        if name == "bs4":
+            raise
+        print(f"{name} extraction failed ({e}); falling back to BeautifulSoup", file=sys.stderr)
+        return extract_bs4(html, max_chars)
@@ -0,0 +1,293 @@
+import hashlib
+import html
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ======== LOCAL STAND-INS FOR THE EXTERNAL SERVICES ========
+# Serper search, the scraped web pages and the Groq chat API, served over HTTP
+# on localhost so that rag_query.py and rag_query_compare.py can be run (and
+# benchmarked) end to end without API keys. Pinecone is replaced by the local
+# vector store (VECTOR_STORE=local).
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scraped_data.json")
+
+JUDGE_RESPONSE = {
+    "rag_scores": {"faithfulness": 8, "completeness": 7, "clarity": 8},
+    "llm_scores": {"faithfulness": 6, "completeness": 7, "clarity": 8},
+    "winner": "RAG",
+    "justification": "Stand-in judge result from fake_services.py.",
+}
+
+_WORD = re.compile(r"\w+")
+
+
+def _words(text):
+    return set(_WORD.findall(text.lower()))
+
+
+def page_html(item):
+    """Renders a scraped_data.json item as an HTML page with some boilerplate around the text."""
+    paragraphs = "".join(f"<p>{html.escape(p)}</p>" for p in re.split(r"(?<=[.!?])\s+(?=[A-Z])", item["content"]) if p.strip())
+    return (
+        f"<!DOCTYPE html><html><head><title>{html.escape(item.get('title') or '')}</title></head><body>"
+        "<nav><a href='/'>Home</a> | <a href='/about'>About</a> | <a href='/contact'>Contact</a></nav>"
+        f"<main><article><h1>{html.escape(item.get('title') or '')}</h1>{paragraphs}</article></main>"
+        "<footer>Copyright Example Publisher. All rights reserved.</footer></body></html>"
+    ).encode("utf-8")
+
+
+class FakeServices:
+    """
+    Starts the stand-in services on ephemeral localhost ports:
+
+    - POST /search: Serper-compatible search over scraped_data.json, ranked by
+      word overlap with the title, snippet and start of the content. With
+      `original_links`, results link to the pages' real URLs instead, for
+      runs that serve every page from a pre-warmed scrape cache.
+    - GET /page/<n>: the n-th page as HTML with an ETag, spread over
+      `page_hosts` servers so per-host scrape limits behave as with real sites.
+    - POST /openai/v1/chat/completions: Groq/OpenAI-compatible completions,
+      streamed or not, with `llm_latency_ms` before the first token and
+      `llm_tokens_per_s` after it. JSON-mode requests get a judge verdict.
+      With `llm_requests_per_minute` set, responses carry Groq's
+      x-ratelimit-* headers and requests over the quota get a 429.
+
+    Use as a context manager; `environ()` returns the settings that point the
+    pipeline at the stand-ins.
+    """
+
+    def __init__(self, data_path=DATA_PATH, page_hosts=4, page_latency_ms=50, search_latency_ms=150,
+                 llm_latency_ms=300, llm_tokens_per_s=250, llm_answer_tokens=150, llm_requests_per_minute=None,
+                 original_links=False):
+        with open(data_path, "r", encoding="utf-8") as f:
+            self.items = [item for item in json.load(f) if item.get("content")]
+        self.pages = [page_html(item) for item in self.items]
+        self.etags = [f'"{hashlib.sha256(item["content"].encode("utf-8")).hexdigest()[:16]}"' for item in self.items]
+        self.index_words = [_words(f"{item.get('title', '')} {item.get('snippet', '')} {item['content'][:1000]}") for item in self.items]
+        self.page_hosts = page_hosts
+        self.page_latency = page_latency_ms / 1000.0
+        self.search_latency = search_latency_ms / 1000.0
+        self.llm_latency = llm_latency_ms / 1000.0
+        self.llm_tokens_per_s = llm_tokens_per_s
+        self.llm_answer_tokens = llm_answer_tokens
+        self.llm_requests_per_minute = llm_requests_per_minute
+        self.original_links = original_links
+        self.stats = {"search": 0, "page": 0, "page_not_modified": 0, "chat": 0, "chat_rate_limited": 0}
+        self._stats_lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_used = 0
+        self._servers = []
+
+    # ======== LIFECYCLE ========
+    def start(self):
+        for _ in range(max(1, self.page_hosts)):
+            server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self._servers.append(server)
+        return self
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def base_url(self, host=0):
+        return f"http://127.0.0.1:{self._servers[host].server_address[1]}"
+
+    def environ(self):
+        return {
+            "SERPER_URL": self.base_url() + "/search",
+            "GROQ_BASE_URL": self.base_url(),
+            "GROQ_API_KEY": "fake-key",
+            "SERPER_API_KEY": "fake-key",
+            "VECTOR_STORE": "local",
+        }
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    # ======== SEARCH ========
+    def search(self, query, num):
+        words = _words(query)
+        ranked = sorted(range(len(self.items)), key=lambda i: len(words & self.index_words[i]), reverse=True)[:num]
+        return {"organic": [
+            {
+                "title": self.items[i].get("title"),
+                "link": self.items[i]["url"] if self.original_links and self.items[i].get("url") else f"{self.base_url(i % len(self._servers))}/page/{i}",
+                "snippet": self.items[i].get("snippet"),
+                "position": rank + 1,
+            }
+            for rank, i in enumerate(ranked)
+        ]}
+
+    # ======== CHAT COMPLETIONS ========
+    def take_chat_quota(self):
+        """Counts a chat request against the per-minute quota; returns (allowed, rate-limit headers)."""
+        limit = self.llm_requests_per_minute
+        if not limit:
+            return True, {}
+        with self._stats_lock:
+            now = time.monotonic()
+            if now - self._window_start >= 60:
+                self._window_start, self._window_used = now, 0
+            allowed = self._window_used < limit
+            if allowed:
+                self._window_used += 1
+            reset = 60 - (now - self._window_start)
+            used = self._window_used
+        return allowed, {
+            "x-ratelimit-limit-requests": str(limit),
+            "x-ratelimit-remaining-requests": str(limit - used),
+            "x-ratelimit-reset-requests": f"{reset:.2f}s",
+        }
+
+    def answer_words(self, messages):
+        """A deterministic answer assembled from the words of the prompt's context."""
+        prompt = " ".join(m.get("content") or "" for m in messages)
+        words = prompt.split()
+        start = len(words) // 3
+        return (words[start:start + self.llm_answer_tokens] or ["No", "context."])
+
+    def completion(self, body):
+        messages = body.get("messages", [])
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            return [json.dumps(JUDGE_RESPONSE)]
+        return [word + " " for word in self.answer_words(messages)]
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_json(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                match = re.fullmatch(r"/page/(\d+)", self.path)
+                if not match or int(match.group(1)) >= len(services.pages):
+                    return self._json(404, {"error": "not found"})
+                n = int(match.group(1))
+                time.sleep(services.page_latency)
+                if self.headers.get("If-None-Match") == services.etags[n]:
+                    services._count("page_not_modified")
+                    self.send_response(304)
+                    self.send_header("ETag", services.etags[n])
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                services._count("page")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("ETag", services.etags[n])
+                self.send_header("Content-Length", str(len(services.pages[n])))
+                self.end_headers()
+                self.wfile.write(services.pages[n])
+
+            def do_POST(self):
+                body = self._read_json()
+                if self.path == "/search":
+                    services._count("search")
+                    time.sleep(services.search_latency)
+                    return self._json(200, services.search(body.get("q", ""), int(body.get("num", 10))))
+                if self.path.rstrip("/") == "/openai/v1/chat/completions":
+                    allowed, headers = services.take_chat_quota()
+                    if not allowed:
+                        services._count("chat_rate_limited")
+                        headers["retry-after"] = str(int(float(headers["x-ratelimit-reset-requests"].rstrip("s"))) + 1)
+                        return self._json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, headers)
+                    services._count("chat")
+                    return self._chat(body, headers)
+                self._json(404, {"error": "not found"})
+
+            def _chat(self, body, headers):
+                pieces = services.completion(body)
+                model = body.get("model", "fake-model")
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                created = int(time.time())
+                usage = {"prompt_tokens": sum(len((m.get("content") or "").split()) for m in body.get("messages", [])),
+                         "completion_tokens": len(pieces)}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                time.sleep(services.llm_latency)
+                delay = 1.0 / services.llm_tokens_per_s if services.llm_tokens_per_s else 0.0
+
+                if not body.get("stream"):
+                    time.sleep(delay * len(pieces))
+                    return self._json(200, {
+                        "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(pieces).strip()}, "finish_reason": "stop"}],
+                        "usage": usage,
+                    }, headers)
+
+                self.send_response(200)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def event(delta, finish_reason=None, **extra):
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                event({"role": "assistant", "content": ""})
+                for piece in pieces:
+                    event({"content": piece})
+                    time.sleep(delay)
+                event({}, "stop", x_groq={"usage": usage})  # Groq reports usage with the last chunk
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the Serper, page and Groq stand-ins until interrupted.")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=250)
+    parser.add_argument("--llm-requests-per-minute", type=int, help="Chat quota; requests over it get a 429")
+    args = parser.parse_args()
+
+    with FakeServices(llm_latency_ms=args.llm_latency_ms, llm_tokens_per_s=args.llm_tokens_per_s,
+                      llm_requests_per_minute=args.llm_requests_per_minute) as services:
+        print("Export these settings to use the stand-ins:")
+        for name, value in services.environ().items():
+            print(f"{name}={value}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,80 @@
+import sys
+
+from rag_resources import get_setting
+
+# ======== INFERENCE SETTINGS ========
+# torch: fp32 PyTorch (the original behaviour)
+# int8:  PyTorch with dynamic int8 quantization of the Linear layers
+# onnx:  ONNX Runtime through optimum (pip install "optimum[onnxruntime]")
+BACKENDS = ("torch", "int8", "onnx")
+INFERENCE_BACKEND = get_setting("INFERENCE_BACKEND", "torch")
+EMBED_BACKEND = get_setting("EMBED_BACKEND", INFERENCE_BACKEND)
+QA_BACKEND = get_setting("QA_BACKEND", INFERENCE_BACKEND)
+# BERTScore needs hidden states from the model, so it supports torch and int8 only
+BERTSCORE_BACKEND = get_setting("BERTSCORE_BACKEND", "int8" if INFERENCE_BACKEND == "int8" else "torch")
+
+# Largest acceptable differences from fp32 torch, checked by `bench_inference.py --check`
+TOLERANCES = {
+    "embedding_cosine": 0.02,  # 1 - cosine(fp32 vector, backend vector)
+    "similarity": 0.02,        # Semantic similarity scores reported by the evaluator
+    "qa_score": 0.05,          # Factual accuracy (QA confidence)
+    "bertscore_f1": 0.03,      # BERTScore F1 with the same BERTSCORE_MODEL
+}
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'; expected one of {', '.join(BACKENDS)}")
+
+
+def quantize(model):
+    """Dynamic int8 quantization of every Linear layer (weights int8, activations quantized on the fly)."""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_embedder(model_name, backend=EMBED_BACKEND):
+    """Returns a SentenceTransformer for `model_name` running on the given CPU backend."""
+    _check_backend(backend)
+    from sentence_transformers import SentenceTransformer
+    if backend == "onnx":
+        try:
+            return SentenceTransformer(model_name, device="cpu", backend="onnx")
+        except Exception as e:  # Older sentence-transformers or optimum not installed
+            print(f"ONNX embedder unavailable ({e}); falling back to int8.", file=sys.stderr)
+            backend = "int8"
+    model = SentenceTransformer(model_name, device="cpu")
+    return quantize(model) if backend == "int8" else model
+
+
+def load_qa_pipeline(model_name, backend=QA_BACKEND):
+    """Returns a transformers question-answering pipeline for `model_name` on the given CPU backend."""
+    _check_backend(backend)
+    from transformers import AutoTokenizer, pipeline
+    if backend == "torch":
+        return pipeline("question-answering", model=model_name)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForQuestionAnswering
+            model = ORTModelForQuestionAnswering.from_pretrained(model_name, export=True)
+            return pipeline("question-answering", model=model, tokenizer=tokenizer)
+        except Exception as e:
+            print(f"ONNX QA model unavailable ({e}); falling back to int8.", file=sys.stderr)
+
+    from transformers import AutoModelForQuestionAnswering
+    model = quantize(AutoModelForQuestionAnswering.from_pretrained(model_name).eval())
+    return pipeline("question-answering", model=model, tokenizer=tokenizer)
+
+
+def load_bert_scorer(model_type, backend=BERTSCORE_BACKEND):
+    """Returns a bert_score.BERTScorer for `model_type` with rescaled scores, quantized for the int8 backend."""
+    _check_backend(backend)
+    from bert_score import BERTScorer
+    scorer = BERTScorer(model_type=model_type, lang="en", rescale_with_baseline=True, device="cpu")
+    if backend == "int8":
+        scorer._model = quantize(scorer._model)
+    elif backend == "onnx":
+        print("BERTScore has no ONNX backend; using fp32 torch.", file=sys.stderr)
+    return scorer
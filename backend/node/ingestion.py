@@ -0,0 +1,176 @@
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from bm25_index import get_bm25_index
+from chunk_store import get_chunk_store
+from chunking import build_chunk_vectors, chunk_id, chunk_text
+from embedding_service import content_hash
+from rag_resources import get_setting
+from tracing import count, span
+
+# ======== INGESTION SETTINGS ========
+DYNAMIC_DOC_TTL = float(get_setting("DYNAMIC_DOC_TTL", str(7 * 86400)))  # Seconds a web page ingested at query time stays indexed
+EXPIRE_INTERVAL = float(get_setting("DYNAMIC_DOC_EXPIRE_INTERVAL", "600"))  # Minimum seconds between expiry sweeps
+
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src", "igshid", "source"}
+# Ids used before documents had content-derived ids: "dynamic-<n>" (rag_query.py),
+# "dynamic-<timestamp>" (rag_query_compare.py) and "<n>" (embed_and_upload.py)
+LEGACY_ID = re.compile(r"dynamic-\d+(?:\.\d+)?|\d+")
+LEGACY_ID_PREFIXES = ["dynamic-", *"0123456789"]
+
+_last_expiry = 0.0
+_expiry_lock = threading.Lock()
+
+
+def normalize_url(url):
+    """
+    Canonical form of a URL for deduplication: lowercase scheme and host
+    without "www." or default ports, no fragment, no tracking parameters,
+    sorted query and no trailing slash.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and not (scheme, parts.port) in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def document_id(url, content):
+    """Stable id from the normalised URL and the content, so re-ingesting an unchanged page is a no-op."""
+    return "doc-" + content_hash(f"{normalize_url(url) if url else ''}\n{content}")[:24]
+
+
+def store_document(doc_id, chunks, metadata, url=None, expires_at=None):
+    """
+    Records an upserted document in the chunk store and the BM25 index, which
+    must cover exactly the chunks that have vectors.
+    """
+    get_chunk_store().put(doc_id, chunks, url=url, expires_at=expires_at)
+    get_bm25_index().add_document(doc_id, [chunk_id(doc_id, p) for p in range(len(chunks))], chunks, metadata)
+
+
+def delete_documents(index, documents):
+    """Deletes the vectors, chunk texts and BM25 entries of [(parent_id, chunk count)]."""
+    chunk_store = get_chunk_store()
+    bm25 = get_bm25_index()
+    for parent_id, count in documents:
+        if count:
+            index.delete(ids=[chunk_id(parent_id, position) for position in range(count)])
+        chunk_store.delete(parent_id)
+        bm25.remove_document(parent_id)
+
+
+def expire_dynamic_documents(index, force=False):
+    """
+    Deletes dynamically ingested documents older than their TTL. Sweeps run at
+    most every EXPIRE_INTERVAL seconds unless `force` is set. Returns the
+    number of documents removed.
+    """
+    global _last_expiry
+    with _expiry_lock:
+        if not force and time.time() - _last_expiry < EXPIRE_INTERVAL:
+            return 0
+        _last_expiry = time.time()
+    expired = get_chunk_store().expired()
+    if expired:
+        delete_documents(index, expired)
+        print(f"Expired {len(expired)} stale dynamic documents.", file=sys.stderr)
+    return len(expired)
+
+
+def purge_legacy_vectors(index, batch_size=1000):
+    """
+    Deletes the vectors stored under legacy ids. They have no chunk store entry,
+    so replacement by URL and expiry never reach them. The index must be able
+    to list ids by prefix (the local store, or a serverless Pinecone index).
+    Returns the number of vectors deleted.
+    """
+    # Collected first: deleting while paging through the listing could skip ids
+    legacy = [i for prefix in LEGACY_ID_PREFIXES for ids in index.list(prefix=prefix) for i in ids if LEGACY_ID.fullmatch(i)]
+    for start in range(0, len(legacy), batch_size):
+        index.delete(ids=legacy[start:start + batch_size])
+    if legacy:
+        print(f"Deleted {len(legacy)} vectors with legacy ids.", file=sys.stderr)
+    return len(legacy)
+
+
+def ingest_pages(query, pages, index, embedder, ttl=DYNAMIC_DOC_TTL):
+    """
+    Chunks, embeds and upserts scraped pages given as (search result, content)
+    pairs, e.g. straight from `webscrap.scrape_concurrently`.
+
+    Pages whose normalised URL and content are already indexed are skipped (and
+    their expiry is pushed back); a page whose content changed replaces its old
+    version. Dynamic documents expire `ttl` seconds after they were last seen.
+    Returns {"indexed", "skipped", "chunks"}.
+    """
+    with span("ingest") as current:
+        stats = _ingest_pages(query, pages, index, embedder, ttl)
+        current.set(**stats)
+    count("documents_ingested", stats["indexed"], result="indexed")
+    count("documents_ingested", stats["skipped"], result="skipped")
+    return stats
+
+
+def _ingest_pages(query, pages, index, embedder, ttl):
+    chunk_store = get_chunk_store()
+    expires_at = time.time() + ttl if ttl else None
+    stats = {"indexed": 0, "skipped": 0, "chunks": 0}
+    new_documents, vectors, seen = [], [], set()
+
+    for result, content in pages:
+        url = result.get('link') or result.get('url')
+        doc_id = document_id(url, content)
+        if doc_id in seen or chunk_store.has(doc_id):
+            if expires_at:
+                chunk_store.extend(doc_id, expires_at)
+            stats["skipped"] += 1
+            continue
+        seen.add(doc_id)
+
+        chunks = chunk_text(content)
+        metadata = {
+            "title": result.get('title'),
+            "url": url,
+            "snippet": result.get('snippet', ''),
+            "query": query # Associate with the current user query
+        }
+        vectors.extend(build_chunk_vectors(doc_id, chunks, metadata, embedder))
+        new_documents.append((doc_id, normalize_url(url) if url else None, chunks, metadata))
+
+    if vectors:
+        with span("upsert", vectors=len(vectors)):
+            index.upsert(vectors=vectors)
+        for doc_id, url, chunks, metadata in new_documents:
+            if url:
+                delete_documents(index, [(p, n) for p, n in chunk_store.documents_for_url(url) if p != doc_id])
+            store_document(doc_id, chunks, metadata, url=url, expires_at=expires_at)
+        stats["indexed"] = len(new_documents)
+        stats["chunks"] = len(vectors)
+
+    expire_dynamic_documents(index)
+    return stats
+
+
+if __name__ == "__main__":
+    from rag_resources import get_index
+
+    parser = argparse.ArgumentParser(description="Maintain dynamically ingested documents.")
+    parser.add_argument("--expire", action="store_true", help="Delete dynamic documents past their TTL now")
+    args = parser.parse_args()
+
+    if args.expire:
+        print(json.dumps({"expired": expire_dynamic_documents(get_index(), force=True)}))
@@ -0,0 +1,342 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import dotenv
+import requests
+from requests.adapters import HTTPAdapter
+
+from rag_resources import GROQ_MODEL, get_setting
+from tracing import count, observe, span
+
+# ======== LLM CLIENT SETTINGS ========
+# Any OpenAI-compatible endpoint works; fake_services.py points this at a local stand-in
+GROQ_BASE_URL = get_setting("GROQ_BASE_URL", "https://api.groq.com").rstrip("/")
+LLM_POOL_SIZE = int(get_setting("LLM_POOL_SIZE", "8"))  # Kept-alive connections to the endpoint
+LLM_TIMEOUT = float(get_setting("LLM_TIMEOUT", "30"))  # Per attempt: connect, and the longest gap between bytes
+LLM_DEADLINE = float(get_setting("LLM_DEADLINE", "90"))  # Per call, including rate-limit waits and retries
+LLM_MAX_RETRIES = int(get_setting("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(get_setting("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(get_setting("LLM_BACKOFF_MAX", "8"))
+# Completions at or below this temperature are treated as deterministic and cached
+LLM_CACHE_ENABLED = get_setting("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_MAX_TEMPERATURE = float(get_setting("LLM_CACHE_MAX_TEMPERATURE", "0.2"))
+LLM_CACHE_PATH = get_setting("LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.db"))
+LLM_CACHE_TTL = float(get_setting("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(get_setting("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+class LLMError(RuntimeError):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_duration(value):
+    """Seconds in a rate-limit reset header, e.g. "7.66s", "2m59.56s" or "120ms"."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def request_key(payload):
+    """Cache and coalescing key: a hash of the whole request (model, messages, temperature, format, ...)."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(payload):
+    """Rough token cost of a request for the token bucket (about 4 characters per token)."""
+    characters = sum(len(message.get("content") or "") for message in payload["messages"])
+    return characters // 4 + (payload.get("max_tokens") or 0)
+
+
+# ======== RATE LIMITING ========
+class TokenBucket:
+    """
+    Client-side view of one provider quota (requests or tokens). It does not
+    limit anything until the first response arrives; after that every
+    response's x-ratelimit-* headers reset it to the provider's numbers, and
+    in between it refills at the rate that restores the full quota by the
+    reported reset time.
+    """
+
+    def __init__(self):
+        self.capacity = None
+        self.available = 0.0
+        self.rate = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def sync(self, limit, remaining, reset_seconds):
+        with self._lock:
+            self.capacity = float(limit)
+            self.available = float(remaining)
+            missing = self.capacity - self.available
+            self.rate = missing / reset_seconds if reset_seconds else (missing or self.capacity)
+            self._updated = time.monotonic()
+
+    def reserve(self, cost):
+        """Takes `cost` from the bucket and returns how long to wait before it is actually available."""
+        with self._lock:
+            if self.capacity is None:
+                return 0.0
+            now = time.monotonic()
+            self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+            self._updated = now
+            self.available -= min(cost, self.capacity)
+            if self.available >= 0:
+                return 0.0
+            return -self.available / self.rate if self.rate else float("inf")
+
+    def refund(self, cost):
+        with self._lock:
+            if self.capacity is not None:
+                self.available = min(self.capacity, self.available + min(cost, self.capacity))
+
+
+class RateLimiter:
+    """The request and token buckets of one API key."""
+
+    def __init__(self):
+        self.buckets = {"requests": TokenBucket(), "tokens": TokenBucket()}
+
+    def acquire(self, tokens, deadline):
+        costs = {"requests": 1, "tokens": tokens}
+        wait = max(bucket.reserve(costs[name]) for name, bucket in self.buckets.items())
+        if time.monotonic() + wait >= deadline:
+            for name, bucket in self.buckets.items():
+                bucket.refund(costs[name])
+            raise LLMError(f"Rate limit quota would not allow this call before its deadline (wait {wait:.1f}s)", 429)
+        if wait > 0:
+            count("llm_rate_limit_waits")
+            observe("llm_rate_limit_wait_seconds", wait)
+            time.sleep(wait)
+
+    def update(self, headers):
+        for name, bucket in self.buckets.items():
+            limit = headers.get(f"x-ratelimit-limit-{name}")
+            remaining = headers.get(f"x-ratelimit-remaining-{name}")
+            if limit is None or remaining is None:
+                continue
+            try:
+                bucket.sync(float(limit), float(remaining), parse_duration(headers.get(f"x-ratelimit-reset-{name}")))
+            except ValueError:
+                continue
+
+
+# ======== RESPONSE CACHE ========
+class LLMCache:
+    """
+    On-disk request-key -> completion cache in SQLite for deterministic calls
+    (e.g. the judge). Entries expire after `ttl` seconds; the least recently
+    used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM completions WHERE key = ? AND created > ?", (key, now - self.ttl)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(response), now, now)
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM completions WHERE key IN (SELECT key FROM completions ORDER BY last_used LIMIT ?)", (excess,)
+                )
+            self._conn.commit()
+
+
+# ======== CLIENT ========
+class LLMClient:
+    """
+    Chat completions over one pooled HTTP session. Every call waits for the
+    rate-limit quota, is retried with jittered exponential backoff on 429, 5xx
+    and connection errors until its deadline, and identical calls that are in
+    flight at the same time share a single request. Non-streamed calls at
+    temperature <= LLM_CACHE_MAX_TEMPERATURE are answered from the cache.
+    """
+
+    def __init__(self, api_key, base_url=GROQ_BASE_URL, pool_size=LLM_POOL_SIZE, cache=None):
+        self.url = f"{base_url}/openai/v1/chat/completions"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
+        self.limiter = RateLimiter()
+        self.cache = cache
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def _post(self, payload, deadline, stream=False):
+        """Sends the request, waiting for quota and retrying until `deadline` (a time.monotonic() value)."""
+        attempt = 0
+        while True:
+            self.limiter.acquire(estimate_tokens(payload), deadline)
+            remaining = deadline - time.monotonic()
+            retry_after = None
+            try:
+                response = self.session.post(
+                    self.url, json=payload, stream=stream, timeout=(min(LLM_TIMEOUT, remaining), min(LLM_TIMEOUT, remaining))
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error, reason = LLMError(f"{type(e).__name__}: {e}"), "connection"
+            else:
+                self.limiter.update(response.headers)
+                count("llm_requests", model=payload["model"], status=response.status_code)
+                if response.status_code < 400:
+                    return response
+                error = LLMError(f"HTTP {response.status_code}: {response.text[:300]}", response.status_code)
+                reason = str(response.status_code)
+                retry_after = parse_duration(response.headers.get("retry-after"))
+                response.close()
+                if response.status_code not in RETRY_STATUSES:
+                    raise error
+
+            attempt += 1
+            # Full jitter, but never sooner than the server asked for
+            backoff = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            if retry_after is not None:
+                backoff = max(backoff, retry_after)
+            if attempt > LLM_MAX_RETRIES or time.monotonic() + backoff >= deadline:
+                raise error
+            count("llm_retries", reason=reason)
+            time.sleep(backoff)
+
+    @staticmethod
+    def _count_usage(usage):
+        for kind in ("prompt", "completion"):
+            if usage.get(f"{kind}_tokens"):
+                count("llm_tokens", usage[f"{kind}_tokens"], kind=kind)
+
+    def complete(self, messages, model=GROQ_MODEL, temperature=None, max_tokens=None, response_format=None, timeout=LLM_DEADLINE):
+        """Returns {"content": ..., "usage": {...}, "cached": bool} for a non-streamed completion."""
+        payload = {"model": model, "messages": messages}
+        for name, value in (("temperature", temperature), ("max_tokens", max_tokens), ("response_format", response_format)):
+            if value is not None:
+                payload[name] = value
+        key = request_key(payload)
+
+        cacheable = self.cache is not None and temperature is not None and temperature <= LLM_CACHE_MAX_TEMPERATURE
+        if cacheable:
+            cached = self.cache.get(key)
+            count("cache_lookups", cache="llm", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                return {**cached, "cached": True}
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            count("llm_coalesced")
+            return dict(future.result(timeout=timeout))
+
+        try:
+            with span("llm", model=model, cacheable=cacheable):
+                response = self._post(payload, time.monotonic() + timeout)
+                body = response.json()
+            result = {"content": body["choices"][0]["message"]["content"], "usage": body.get("usage") or {}, "cached": False}
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+        self._count_usage(result["usage"])
+        if cacheable:
+            self.cache.put(key, {"content": result["content"], "usage": result["usage"]})
+        return dict(result)
+
+    def stream(self, messages, model=GROQ_MODEL, temperature=None, max_tokens=None, timeout=LLM_DEADLINE):
+        """
+        Yields the content deltas of a streamed completion. Retries can only
+        happen before the response starts; an error mid-stream is raised.
+        """
+        payload = {"model": model, "messages": messages, "stream": True}
+        for name, value in (("temperature", temperature), ("max_tokens", max_tokens)):
+            if value is not None:
+                payload[name] = value
+
+        start = time.perf_counter()
+        response = self._post(payload, time.monotonic() + timeout, stream=True)
+        response.encoding = "utf-8"  # requests assumes ISO-8859-1 for text/event-stream
+        usage, deltas = None, 0
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # Groq reports usage in the last chunk under x_groq, OpenAI under usage
+                usage = (chunk.get("x_groq") or {}).get("usage") or chunk.get("usage") or usage
+                for choice in chunk.get("choices") or []:
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        if not deltas:
+                            observe("llm_first_token_seconds", time.perf_counter() - start)
+                        deltas += 1
+                        yield delta
+        # Without reported usage, stream deltas are roughly one token each
+        self._count_usage(usage or {"completion_tokens": deltas})
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """Returns the process-wide LLMClient for the Groq API (GROQ_API_KEY, GROQ_BASE_URL)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            api_key = dotenv.get_key(dotenv.find_dotenv(), "GROQ_API_KEY") or get_setting("GROQ_API_KEY")
+            if not api_key:
+                raise LLMError("GROQ_API_KEY is not set")
+            _client = LLMClient(api_key, cache=LLMCache() if LLM_CACHE_ENABLED else None)
+        return _client
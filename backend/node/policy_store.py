@@ -0,0 +1,164 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+import numpy as np
+
+from rag_resources import get_setting
+
+NODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+POLICY_DB_PATH = get_setting("POLICY_DB_PATH", os.path.join(NODE_DIR, "policy_store.db"))
+# Policy files written by the old JSON-backed RLAgent (relative to whichever directory it ran from)
+LEGACY_POLICY_FILES = [
+    os.path.join(os.path.dirname(NODE_DIR), "reward_memory.json"),
+    os.path.join(NODE_DIR, "reward_memory.json"),
+]
+
+
+class PolicyStore:
+    """
+    Per-arm sufficient statistics (sum, count, sum of squares of rewards) for
+    the RL agent, kept in SQLite. Every update is a single atomic UPSERT, so
+    concurrent `learn()` calls from threads or processes never lose an update
+    and reading the whole policy at startup is one small query.
+    """
+
+    def __init__(self, path=POLICY_DB_PATH, legacy_files=LEGACY_POLICY_FILES):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS arms (
+                policy TEXT NOT NULL,
+                arm TEXT NOT NULL,
+                sum REAL NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                sum_sq REAL NOT NULL DEFAULT 0,
+                updated_at TEXT,
+                PRIMARY KEY (policy, arm)
+            );
+            CREATE TABLE IF NOT EXISTS linear_arms (
+                policy TEXT NOT NULL,
+                arm TEXT NOT NULL,
+                A BLOB NOT NULL,
+                b BLOB NOT NULL,
+                dim INTEGER NOT NULL,
+                updated_at TEXT,
+                PRIMARY KEY (policy, arm)
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._conn.commit()
+        for path in legacy_files or []:
+            self.migrate_legacy_policy(path)
+
+    def migrate_legacy_policy(self, path, policy="top_k"):
+        """One-time import of a {"top_k_rewards": {arm: {"sum", "count"}}} JSON file."""
+        key = f"migrated:{os.path.abspath(path)}"
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                    arms = {}
+                    if os.path.exists(path):
+                        with open(path, "r", encoding="utf-8") as f:
+                            try:
+                                data = json.load(f)
+                            except json.JSONDecodeError:
+                                data = None
+                        if isinstance(data, dict):  # The list-shaped file is the reward log, not a policy
+                            arms = data.get("top_k_rewards", {})
+                    for arm, stats in arms.items():
+                        count = stats.get("count", 0)
+                        mean = stats.get("sum", 0) / count if count else 0.0
+                        # The old format has no sum of squares; assume zero variance around the mean
+                        self._upsert(policy, arm, stats.get("sum", 0), count, count * mean * mean)
+                    self._conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, datetime.now().isoformat()))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def _upsert(self, policy, arm, reward_sum, count, sum_sq):
+        self._conn.execute("""
+            INSERT INTO arms (policy, arm, sum, count, sum_sq, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (policy, arm) DO UPDATE SET
+                sum = sum + excluded.sum,
+                count = count + excluded.count,
+                sum_sq = sum_sq + excluded.sum_sq,
+                updated_at = excluded.updated_at
+        """, (policy, str(arm), reward_sum, count, sum_sq, datetime.now().isoformat()))
+
+    def record(self, policy, arm, reward):
+        """Atomically adds one observed reward to an arm's statistics."""
+        with self._lock:
+            with self._conn:
+                self._upsert(policy, arm, reward, 1, reward * reward)
+
+    def record_linear(self, policy, arm, context, reward):
+        """
+        Adds one (context, reward) observation to an arm's LinUCB matrices. An
+        arm stored with another context dimension (LINUCB_CONTEXT_DIM changed)
+        starts over from the identity.
+        """
+        x = np.asarray(context, dtype=np.float64)
+        dim = len(x)
+        with self._lock:
+            # BEGIN IMMEDIATE serialises the read-modify-write across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT A, b, dim FROM linear_arms WHERE policy = ? AND arm = ?", (policy, str(arm))
+                ).fetchone()
+                if row is None or row[2] != dim:
+                    A, b = np.eye(dim), np.zeros(dim)
+                else:
+                    A = np.frombuffer(row[0]).reshape(dim, dim)
+                    b = np.frombuffer(row[1])
+                A = A + np.outer(x, x)
+                b = b + reward * x
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO linear_arms (policy, arm, A, b, dim, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (policy, str(arm), A.tobytes(), b.tobytes(), dim, datetime.now().isoformat())
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def load_linear(self, policy, dim=None):
+        """Returns {arm: (A, b)} for one LinUCB policy; with `dim`, arms of another dimension are left out."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT arm, A, b, dim FROM linear_arms WHERE policy = ?", (policy,)
+            ).fetchall()
+        state = {}
+        for arm, A, b, stored_dim in rows:
+            if dim is not None and stored_dim != dim:
+                continue
+            b = np.frombuffer(b).copy()
+            state[arm] = (np.frombuffer(A).reshape(len(b), len(b)).copy(), b)
+        return state
+
+    def load(self, policy):
+        """Returns {arm: {"sum", "count", "sum_sq"}} for one policy."""
+        with self._lock:
+            rows = self._conn.execute("SELECT arm, sum, count, sum_sq FROM arms WHERE policy = ?", (policy,)).fetchall()
+        return {arm: {"sum": s, "count": c, "sum_sq": sq} for arm, s, c, sq in rows}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_policy_store():
+    """Returns the process-wide PolicyStore."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PolicyStore()
+        return _store
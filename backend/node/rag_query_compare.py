@@ -1,151 +1,164 @@
 import json
-import dotenv
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
-import os
-from groq import Groq
 from datetime import datetime
 import sys
 import codecs
 import time
 
-# Reconfigure stdout to use UTF-8 encoding
-sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
-
 # Import functions from other local scripts
 from searchurl import search_serper
-from webscrap import scrape_webpage
-from comprehensive_evaluate import comprehensive_evaluation
+from webscrap import scrape_concurrently
 from rl_agent import RLAgent # Import the RLAgent
-
-def main():
-    start_time = time.time()
-    print(f"[{datetime.now()}] Starting rag_query_compare.py", file=sys.stderr)
-
-    # ======== STEP 1: PARSE ARGUMENTS AND SETUP ========
-    if len(sys.argv) > 1:
-        query = sys.argv[1]
-    else:
-        query = sys.stdin.read().strip()
-    print(f"[{datetime.now()}] Query received: '{query}'", file=sys.stderr)
-
-    dotenv.load_dotenv()
-    PINECONE_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "PINECONE_API_KEY")
-    GROQ_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "GROQ_API_KEY")
-
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    index_name = "rag-knowledge-384"
-
-    if index_name not in [i.name for i in pc.list_indexes()]:
-        pc.create_index(
-            name=index_name,
-            dimension=384,
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1")
-        )
-    index = pc.Index(index_name)
-
-    embedder = SentenceTransformer("all-MiniLM-L6-v2")
-    groq_client = Groq(api_key=GROQ_API_KEY)
-
-    # Initialize RL Agent and choose top_k
-    rl_agent = RLAgent()
-    available_top_ks = [3, 5, 7] # Define possible actions for top_k
-    chosen_top_k = rl_agent.choose_action(available_top_ks)
-    print(f"[{datetime.now()}] RL Agent chose top_k: {chosen_top_k}", file=sys.stderr)
-
-    # ======== STEP 2: DYNAMIC DATA INGESTION ========
-    ingestion_start_time = time.time()
-    search_results = search_serper(query, num_results=5)
-    
-    dynamic_vectors = []
-    if search_results:
-        for result in search_results:
-            url = result.get('link')
-            title = result.get('title')
-            content = scrape_webpage(url)
-            if len(content) < 200:
-                continue
-            
-            text_to_embed = content[:4000]
-            emb = embedder.encode(text_to_embed).tolist()
-            
-            dynamic_vectors.append({
-                "id": f"dynamic-{datetime.now().timestamp()}",
-                "values": emb,
-                "metadata": {
-                    "title": title,
-                    "url": url,
-                    "snippet": result.get('snippet', ''),
-                    "query": query
-                }
-            })
-        
-        if dynamic_vectors:
-            index.upsert(vectors=dynamic_vectors)
-    ingestion_end_time = time.time()
-    print(f"[{datetime.now()}] Dynamic Data Ingestion took {ingestion_end_time - ingestion_start_time:.2f} seconds", file=sys.stderr)
-
-    # ======== STEP 3: EMBED & RETRIEVE ========
-    embed_retrieve_start_time = time.time()
-    query_emb = embedder.encode(query).tolist()
-    results = index.query(vector=query_emb, top_k=chosen_top_k, include_metadata=True) # Use chosen_top_k
+from stage_graph import StageGraph
+from reward_store import get_reward_store
+from semantic_cache import get_semantic_cache
+from llm_client import get_llm_client
+from rag_resources import get_index
+from embedding_service import get_embedding_service
+from ingestion import ingest_pages
+from context_builder import build_context
+from retrieval import retrieve_passages
+from tracing import span
+
+# ======== STEP 2: DYNAMIC DATA INGESTION ========
+def ingest_dynamic_documents(query, index, embedder, num_results=5):
+    search_results = search_serper(query, num_results=num_results)
     
-    context_texts = [match["metadata"].get("snippet", "") for match in results["matches"]]
-    context = "\n\n".join(context_texts)
-    embed_retrieve_end_time = time.time()
-    print(f"[{datetime.now()}] Embed & Retrieve took {embed_retrieve_end_time - embed_retrieve_start_time:.2f} seconds", file=sys.stderr)
-
-    # ======== STEP 4: GENERATE RAG ANSWER ========
-    rag_start_time = time.time()
-    rag_answer = None
+    if not search_results:
+        return 0
+    # Pages are chunked and embedded as soon as each one is scraped; pages that
+    # are already indexed with the same content are skipped
+    stats = ingest_pages(query, scrape_concurrently(search_results), index, embedder)
+    return stats["indexed"]
+
+# ======== STEP 3: EMBED & RETRIEVE ========
+def retrieve_context(query, query_emb, index, top_k):
+    # top_k chunks are retrieved and merged with their neighbours into passages,
+    # then reranked when RERANK_ENABLED=1, deduplicated and fitted into
+    # CONTEXT_TOKEN_BUDGET tokens
+    built = build_context(retrieve_passages(query_emb, index, top_k, query=query))
+    return {
+        "context": built["context"],
+        "urls": [passage["url"] for passage in built["passages"]],
+        "tokens": built["tokens"]
+    }
+
+# ======== STEP 4: GENERATE RAG ANSWER ========
+def generate_rag_answer(query, context):
     try:
         prompt = f"Based on the following context, generate a comprehensive answer to the question.\\n\\nContext:\\n{context}\\n\\nQuestion: {query}"
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        rag_answer = response.choices[0].message.content.strip()
+        response = get_llm_client().complete([{"role": "user", "content": prompt}])
+        return response["content"].strip()
     except Exception as e:
         print(f"[{datetime.now()}] Error generating RAG answer: {e}", file=sys.stderr)
-        rag_answer = "Error generating RAG answer."
-    rag_end_time = time.time()
-    print(f"[{datetime.now()}] RAG Answer Generation took {rag_end_time - rag_start_time:.2f} seconds", file=sys.stderr)
+        return "Error generating RAG answer."
 
-    # ======== STEP 5: GENERATE LLM ANSWER (NO RAG) ========
-    llm_start_time = time.time()
-    llm_answer = None
+# ======== STEP 5: GENERATE LLM ANSWER (NO RAG) ========
+def generate_llm_answer(query):
     try:
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": query}]
-        )
-        llm_answer = response.choices[0].message.content.strip()
+        response = get_llm_client().complete([{"role": "user", "content": query}])
+        return response["content"].strip()
     except Exception as e:
         print(f"[{datetime.now()}] Error generating LLM answer: {e}", file=sys.stderr)
-        llm_answer = "Error generating LLM answer."
-    llm_end_time = time.time()
-    print(f"[{datetime.now()}] LLM Answer Generation took {llm_end_time - llm_start_time:.2f} seconds", file=sys.stderr)
+        return "Error generating LLM answer."
 
-    # ======== STEP 6: EVALUATE ANSWERS ========
-    evaluation_start_time = time.time()
-    evaluation = None
+# ======== STEP 6: EVALUATE ANSWERS ========
+def evaluate_answers(query, rag_answer, llm_answer):
     if rag_answer and llm_answer and "Error" not in rag_answer and "Error" not in llm_answer:
-        evaluation = comprehensive_evaluation(query, rag_answer, llm_answer)
-    evaluation_end_time = time.time()
-    print(f"[{datetime.now()}] Evaluation took {evaluation_end_time - evaluation_start_time:.2f} seconds", file=sys.stderr)
+        # Imported here so that loading the evaluation models is only paid for when they are used
+        from comprehensive_evaluate import comprehensive_evaluation
+        return comprehensive_evaluation(query, rag_answer, llm_answer)
+    return None
+
+def run_compare(query):
+    """
+    Runs the RAG vs. LLM comparison for one query and returns the result dict.
+
+    The steps run as a dependency graph: the plain LLM answer starts right away
+    and overlaps with ingestion, retrieval and the RAG answer; evaluation starts
+    once both answers exist.
+    """
+    with span("rag_compare"):
+        return _run_compare(query)
+
+def _run_compare(query):
+    start_time = time.time()
+    print(f"[{datetime.now()}] Query received: '{query}'", file=sys.stderr)
+
+    # ======== STEP 1: SETUP ========
+    embedder = get_embedding_service()
+    query_emb = embedder.encode_one(query)
+
+    # A near-duplicate of a recent query is answered from the semantic cache
+    cache = get_semantic_cache()
+    if cache is not None:
+        cached, info = cache.lookup("compare", query_emb)
+        if cached is not None:
+            print(f"[{datetime.now()}] Semantic cache hit: '{info['cached_query']}' (similarity {info['similarity']})", file=sys.stderr)
+            cached["cache"] = info
+            cached["timings"] = {"total": {"start": 0.0, "seconds": round(time.time() - start_time, 3)}}
+            return cached
+
+    index = get_index()
 
-    # Learn from the reward
+    # The RL agent picks top_k, whether to ingest from the web and how many
+    # results to scrape, using the query embedding as context
+    rl_agent = RLAgent()
+    config = rl_agent.choose_config(query_emb)
+    print(f"[{datetime.now()}] RL Agent chose config: {config['arm']}", file=sys.stderr)
+
+    graph = StageGraph()
+    graph.add("llm_answer", lambda: generate_llm_answer(query))
+    if config["web_ingest"]:
+        graph.add("ingestion", lambda: ingest_dynamic_documents(query, index, embedder, config["num_results"]))
+    else:
+        graph.add("ingestion", lambda: 0)  # The existing index is expected to answer this query
+    graph.add("retrieval", lambda ingestion: retrieve_context(query, query_emb.tolist(), index, config["top_k"]), deps=["ingestion"])
+    graph.add("rag_answer", lambda retrieval: generate_rag_answer(query, retrieval["context"]), deps=["retrieval"])
+    graph.add("evaluation", lambda rag_answer, llm_answer: evaluate_answers(query, rag_answer, llm_answer), deps=["rag_answer", "llm_answer"])
+    results, timings = graph.run()
+
+    rag_answer = results["rag_answer"]
+    llm_answer = results["llm_answer"]
+    evaluation = results["evaluation"]
+
+    # Learn from the reward; latency is the time the RAG answer took to produce
+    rag_latency = timings["rag_answer"]["start"] + timings["rag_answer"]["seconds"]
     if evaluation and "rag_reward" in evaluation:
-        rl_agent.learn(chosen_top_k, evaluation["rag_reward"])
-        print(f"[{datetime.now()}] RL Agent learned: top_k={chosen_top_k}, reward={evaluation['rag_reward']}", file=sys.stderr)
+        rl_agent.learn_config(config, evaluation["rag_reward"], query_emb, rag_latency)
+        print(f"[{datetime.now()}] RL Agent learned: config={config['arm']}, reward={evaluation['rag_reward']}", file=sys.stderr)
+        get_reward_store().log(
+            query, results["retrieval"]["urls"], rag_answer, evaluation["rag_reward"],
+            arm=config["arm"], latency=rag_latency, ingestion_seconds=timings["ingestion"]["seconds"], pipeline="compare"
+        )
+
+    timings["total"] = {"start": 0.0, "seconds": round(time.time() - start_time, 3)}
+    print(f"[{datetime.now()}] Stage timings: {json.dumps(timings)}", file=sys.stderr)
 
     # ======== STEP 7: FINAL OUTPUT ========
     final_output = {
         "rag_answer": rag_answer,
         "llm_answer": llm_answer,
-        "evaluation": evaluation
+        "evaluation": evaluation,
+        "rl_config": config,
+        "timings": timings
     }
+    if cache is not None and evaluation is not None:
+        cache.store("compare", query, query_emb, final_output)
+    return final_output
+
+def main():
+    # Reconfigure stdout to use UTF-8 encoding
+    sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
+
+    start_time = time.time()
+    print(f"[{datetime.now()}] Starting rag_query_compare.py", file=sys.stderr)
+
+    if len(sys.argv) > 1:
+        query = sys.argv[1]
+    else:
+        query = sys.stdin.read().strip()
+
+    final_output = run_compare(query)
     print(json.dumps(final_output), flush=True)
     
     end_time = time.time()
@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+import time
+import dotenv
+
+# ======== SHARED SETTINGS ========
+dotenv.load_dotenv()
+
+INDEX_NAME = "rag-knowledge-384"
+EMBEDDING_DIM = 384  # Hugging Face MiniLM outputs 384-dim embeddings
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+GROQ_MODEL = "llama-3.3-70b-versatile"
+INDEX_CHECK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".index_check.json")
+
+_lock = threading.Lock()
+_embedder = None
+_index = None
+
+
+def get_setting(name, default=None):
+    """Read a setting from the environment (populated from .env by dotenv)."""
+    value = os.environ.get(name)
+    return default if value in (None, "") else value
+
+
+def _index_known_to_exist():
+    """True if a previous process confirmed the index exists less than INDEX_CHECK_TTL seconds ago."""
+    try:
+        with open(INDEX_CHECK_PATH, "r", encoding="utf-8") as f:
+            checked = json.load(f)
+    except (OSError, ValueError):
+        return False
+    ttl = float(get_setting("INDEX_CHECK_TTL", "86400"))
+    return checked.get("index") == INDEX_NAME and time.time() - checked.get("checked_at", 0) < ttl
+
+
+def _remember_index_exists():
+    try:
+        with open(INDEX_CHECK_PATH, "w", encoding="utf-8") as f:
+            json.dump({"index": INDEX_NAME, "checked_at": time.time()}, f)
+    except OSError:
+        pass  # Only a startup shortcut; the next process checks again
+
+
+def get_embedder():
+    """Return the shared SentenceTransformer, loading it on first use (on EMBED_BACKEND, see inference_backend.py)."""
+    global _embedder
+    with _lock:
+        if _embedder is None:
+            from inference_backend import load_embedder
+            _embedder = load_embedder(EMBED_MODEL_NAME)
+        return _embedder
+
+
+def get_index():
+    """
+    Return the shared vector index. VECTOR_STORE=local selects the in-process
+    store from vector_store.py; otherwise the Pinecone index is used (and
+    created if it does not exist yet). Both expose the same upsert/query calls.
+    Whether the Pinecone index exists is remembered in INDEX_CHECK_PATH, so
+    a fresh process skips the list_indexes round trip.
+    """
+    global _index
+    with _lock:
+        if _index is None and get_setting("VECTOR_STORE", "pinecone") == "local":
+            from vector_store import LocalVectorStore
+            _index = LocalVectorStore()
+        if _index is None:
+            from pinecone import Pinecone, ServerlessSpec
+            pc = Pinecone(api_key=dotenv.get_key(dotenv.find_dotenv(), "PINECONE_API_KEY"))
+            if not _index_known_to_exist():
+                if INDEX_NAME not in [i.name for i in pc.list_indexes()]:
+                    pc.create_index(
+                        name=INDEX_NAME,
+                        dimension=EMBEDDING_DIM,
+                        metric="cosine",
+                        spec=ServerlessSpec(cloud="aws", region="us-east-1")
+                    )
+                _remember_index_exists()
+            _index = pc.Index(INDEX_NAME)
+        return _index
@@ -0,0 +1,179 @@
+import json
+import queue
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_client import get_llm_client
+from rag_resources import get_setting, get_embedder, get_index
+from semantic_cache import get_semantic_cache
+from reranker import RERANK_ENABLED, get_cross_encoder
+from tracing import count, metrics, propagate, span
+
+# ======== SERVER SETTINGS ========
+RAG_SERVER_HOST = get_setting("RAG_SERVER_HOST", "127.0.0.1")
+RAG_SERVER_PORT = int(get_setting("RAG_SERVER_PORT", "5801"))
+RAG_WORKERS = int(get_setting("RAG_WORKERS", "4"))  # Number of requests processed at the same time
+
+
+def warm_up():
+    """Load the models and clients once so that requests skip the cold start."""
+    print(f"[{datetime.now()}] Loading models and clients...", file=sys.stderr)
+    get_embedder()
+    get_index()
+    get_llm_client()
+    if RERANK_ENABLED:
+        get_cross_encoder()
+    import rag_query
+    import rag_query_compare
+    # The evaluation models load lazily; a long-running server loads them up front
+    from comprehensive_evaluate import get_qa_pipeline
+    get_qa_pipeline()
+    print(f"[{datetime.now()}] Models and clients ready.", file=sys.stderr)
+
+
+def handle_query(query):
+    import rag_query
+    result = rag_query.run_query(query, emit=lambda message: None)
+    if result["answer"] is None:
+        raise RuntimeError("Failed to generate an answer")
+    return result
+
+
+def handle_compare(query):
+    import rag_query_compare
+    return rag_query_compare.run_compare(query)
+
+
+def stream_query(query, emit):
+    import rag_query
+    rag_query.run_query(query, emit=emit)
+
+
+ROUTES = {
+    "/query": handle_query,
+    "/compare": handle_compare,
+}
+
+# Routes that stream their events as NDJSON while the work is still running
+STREAM_ROUTES = {
+    "/query/stream": stream_query,
+}
+
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    """JSON request/response handler; the actual work runs on the shared worker pool."""
+    pool = None
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_ndjson(self, handler, query):
+        """
+        Writes each event the handler emits as one NDJSON line. The response
+        ends with the reward_score event; whatever the handler does after that
+        (reward logging, caching) finishes on the worker without holding up
+        the client.
+        """
+        events = queue.Queue()
+
+        def finished(future):
+            if future.exception() is not None:
+                events.put({"type": "error", "message": str(future.exception())})
+            events.put(None)
+
+        self.pool.submit(propagate(handler), query, events.put).add_done_callback(finished)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            while True:
+                event = events.get()
+                if event is None:
+                    break
+                self.wfile.write((json.dumps(event) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                if event.get("type") == "reward_score":
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            print(f"[{datetime.now()}] Client disconnected from {self.path}", file=sys.stderr)
+
+    def do_GET(self):
+        if self.path == "/health":
+            cache = get_semantic_cache()
+            self._send_json(200, {"status": "ok", "workers": RAG_WORKERS, "semantic_cache": cache.metrics() if cache else None})
+        elif self.path == "/metrics":
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        # The request span is the root of the pipeline spans, which run on the worker pool
+        with span("http_request", path=self.path) as request_span:
+            try:
+                self._handle_post()
+            finally:
+                status = getattr(self, "_status", 500)
+                request_span.set(status=status)
+                count("http_requests", path=self.path, status=status)
+
+    def _handle_post(self):
+        handler = ROUTES.get(self.path) or STREAM_ROUTES.get(self.path)
+        if handler is None:
+            return self._send_json(404, {"error": "Not found"})
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            query = json.loads(self.rfile.read(length) or b"{}").get("query")
+        except (ValueError, AttributeError):
+            return self._send_json(400, {"error": "Invalid JSON body"})
+        if not query:
+            return self._send_json(400, {"error": "Query is required"})
+
+        if self.path in STREAM_ROUTES:
+            return self._stream_ndjson(handler, query.strip())
+
+        try:
+            result = self.pool.submit(propagate(handler), query.strip()).result()
+        except Exception as e:
+            print(f"[{datetime.now()}] Error handling {self.path}: {e}", file=sys.stderr)
+            return self._send_json(500, {"error": "Failed to process query", "details": str(e)})
+        self._send_json(200, result)
+
+    def log_message(self, format, *args):
+        print(f"[{datetime.now()}] {self.address_string()} {format % args}", file=sys.stderr)
+
+
+def main():
+    warm_up()
+    RAGRequestHandler.pool = ThreadPoolExecutor(max_workers=RAG_WORKERS)
+    server = ThreadingHTTPServer((RAG_SERVER_HOST, RAG_SERVER_PORT), RAGRequestHandler)
+    print(f"[{datetime.now()}] RAG server listening on http://{RAG_SERVER_HOST}:{RAG_SERVER_PORT} with {RAG_WORKERS} workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        RAGRequestHandler.pool.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+from embedding_service import content_hash
+from rag_resources import get_setting
+from tracing import count, propagate, span
+
+# ======== RERANK SETTINGS ========
+RERANK_ENABLED = get_setting("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = get_setting("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_OVERFETCH = int(get_setting("RERANK_OVERFETCH", "3"))  # Candidates fetched per context slot
+RERANK_TOP_N = int(get_setting("RERANK_TOP_N", "3"))  # Passages kept after reranking
+RERANK_BUDGET_MS = float(get_setting("RERANK_BUDGET_MS", "300"))  # Past this, the vector order is used
+RERANK_BATCH_SIZE = int(get_setting("RERANK_BATCH_SIZE", "16"))
+RERANK_CACHE_SIZE = int(get_setting("RERANK_CACHE_SIZE", "4096"))
+
+_model = None
+_model_lock = threading.Lock()
+# A single scoring thread: when it falls behind, requests time out and use the
+# vector order instead of queueing up CPU work
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+
+def get_cross_encoder():
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+            _model = CrossEncoder(RERANK_MODEL, max_length=512, device="cpu")
+        return _model
+
+
+class ScoreCache:
+    """LRU cache of cross-encoder scores keyed by (query, passage text hash)."""
+
+    def __init__(self, max_entries=RERANK_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._scores:
+                return None
+            self._scores.move_to_end(key)
+            return self._scores[key]
+
+    def put(self, key, score):
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+
+_cache = ScoreCache()
+
+
+def _score_pairs(query, texts, keys):
+    """Scores (query, text) pairs in batches and caches every score as soon as its batch is done."""
+    model = get_cross_encoder()
+    for start in range(0, len(texts), RERANK_BATCH_SIZE):
+        batch = texts[start:start + RERANK_BATCH_SIZE]
+        scores = model.predict([(query, text) for text in batch], batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+        for key, score in zip(keys[start:start + RERANK_BATCH_SIZE], scores):
+            _cache.put(key, float(score))
+
+
+def rerank(query, passages, top_n=RERANK_TOP_N, budget_ms=RERANK_BUDGET_MS):
+    """
+    Reorders passages (in vector order) by cross-encoder relevance to the
+    query and keeps the best `top_n`. If scoring does not finish within
+    `budget_ms`, the first `top_n` passages in vector order are returned; the
+    scores still land in the cache for later requests. A cold model load
+    happens before the budget starts, otherwise a freshly spawned process
+    would always run out of budget and never rerank.
+    """
+    if not passages:
+        return passages
+    start = time.monotonic()
+    keys = [(query, content_hash(p["text"])) for p in passages]
+    missing = [i for i, key in enumerate(keys) if _cache.get(key) is None]
+
+    count("rerank_pairs", len(passages) - len(missing), source="cache")
+    if missing:
+        count("rerank_pairs", len(missing), source="model")
+        try:
+            get_cross_encoder()
+        except Exception as e:
+            print(f"Rerank model unavailable ({e}); using vector order.", file=sys.stderr)
+            count("rerank_fallbacks", reason="error")
+            return passages[:top_n]
+        future = _executor.submit(propagate(_score_pairs), query, [passages[i]["text"] for i in missing], [keys[i] for i in missing])
+        try:
+            with span("rerank", pairs=len(missing)):
+                future.result(timeout=budget_ms / 1000.0)
+        except FuturesTimeoutError:
+            print(f"Rerank exceeded its {budget_ms:.0f} ms budget; using vector order.", file=sys.stderr)
+            count("rerank_fallbacks", reason="timeout")
+            return passages[:top_n]
+        except Exception as e:
+            print(f"Rerank failed ({e}); using vector order.", file=sys.stderr)
+            count("rerank_fallbacks", reason="error")
+            return passages[:top_n]
+
+    scores = [_cache.get(key) for key in keys]
+    if any(score is None for score in scores):
+        # Evicted between scoring and reading back; not worth a second attempt
+        return passages[:top_n]
+    ranked = sorted(zip(scores, range(len(passages))), key=lambda pair: pair[0], reverse=True)[:top_n]
+    print(f"Reranked {len(passages)} passages in {(time.monotonic() - start) * 1000:.0f} ms ({len(passages) - len(missing)} cached).", file=sys.stderr)
+    return [{**passages[i], "rerank_score": score} for score, i in ranked]
@@ -0,0 +1,153 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+from bm25_index import get_bm25_index
+from chunk_store import get_chunk_store
+from chunking import split_sentences
+from rag_resources import get_setting
+from reranker import RERANK_ENABLED, RERANK_OVERFETCH, RERANK_TOP_N, rerank
+from tracing import count, propagate, span
+
+CHUNK_NEIGHBOURS = int(get_setting("CHUNK_NEIGHBOURS", "1"))  # Chunks on each side of a hit that are merged into its passage
+HYBRID_RETRIEVAL = get_setting("HYBRID_RETRIEVAL", "1") == "1"  # Fuse BM25 hits with the vector hits
+RRF_K = int(get_setting("RRF_K", "60"))  # Reciprocal-rank fusion damping constant
+VECTOR_QUERY_TIMEOUT = float(get_setting("VECTOR_QUERY_TIMEOUT", "3"))  # Seconds before BM25 results are used alone
+
+# Vector queries run here so a slow store can be abandoned after VECTOR_QUERY_TIMEOUT
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vector-query")
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """
+    Merges ranked match lists ({"id", "score", "metadata"}) by summing
+    1 / (k + rank) over the lists each id appears in. The fused value becomes
+    the match score; metadata comes from the first list containing the id.
+    """
+    fused = {}
+    for matches in rankings:
+        for rank, match in enumerate(matches, start=1):
+            entry = fused.setdefault(match["id"], {**match, "score": 0.0})
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda m: m["score"], reverse=True)[:top_k]
+
+
+def _vector_matches(query_emb, index, top_k):
+    with span("vector_query", top_k=top_k):
+        return index.query(vector=query_emb, top_k=top_k, include_metadata=True)["matches"]
+
+
+def _fetch_matches(query_emb, index, top_k, query):
+    """
+    Vector matches, fused with BM25 matches when the query text is known. If
+    the vector store fails or does not answer within VECTOR_QUERY_TIMEOUT,
+    the BM25 matches are used on their own.
+    """
+    if not (HYBRID_RETRIEVAL and query):
+        return _vector_matches(query_emb, index, top_k)
+    future = _executor.submit(propagate(_vector_matches), query_emb, index, top_k)
+    try:
+        with span("bm25_query", top_k=top_k):
+            lexical = get_bm25_index().search(query, top_k)
+    except Exception as e:
+        print(f"BM25 search failed ({e}); using vector results only.", file=sys.stderr)
+        return future.result()
+    try:
+        dense = future.result(timeout=VECTOR_QUERY_TIMEOUT)
+    except FuturesTimeoutError:
+        print(f"Vector query exceeded {VECTOR_QUERY_TIMEOUT:.1f}s; using BM25 results only.", file=sys.stderr)
+        count("retrieval_fallbacks", reason="timeout")
+        return lexical
+    except Exception as e:
+        if not lexical:
+            raise
+        print(f"Vector query failed ({e}); using BM25 results only.", file=sys.stderr)
+        count("retrieval_fallbacks", reason="error")
+        return lexical
+    return reciprocal_rank_fusion([dense, lexical], top_k)
+
+
+def retrieve_passages(query_emb, index, top_k, neighbours=CHUNK_NEIGHBOURS, query=None):
+    """
+    Queries the index for the `top_k` best chunks and turns them into passages.
+    Hits from the same document are grouped, widened by `neighbours` chunks on
+    each side, and contiguous runs are merged into one text. Vectors indexed
+    before chunking (no parent id) fall back to their search snippet.
+
+    Returns a list of {"title", "url", "snippet", "text", "score"} ordered by
+    the best chunk score in each passage. With RERANK_ENABLED=1 and the query
+    text given, RERANK_OVERFETCH times as many chunks are fetched and the
+    passages are reordered and cut down by the cross-encoder (see reranker.py).
+
+    With HYBRID_RETRIEVAL=1 and the query text given, chunk hits come from
+    reciprocal-rank fusion of the vector and BM25 rankings, and scores are
+    fused RRF values rather than similarities.
+    """
+    with span("retrieve", top_k=top_k) as current:
+        passages = _retrieve_passages(query_emb, index, top_k, neighbours, query)
+        current.set(passages=len(passages))
+    return passages
+
+
+def _retrieve_passages(query_emb, index, top_k, neighbours, query):
+    should_rerank = RERANK_ENABLED and query is not None
+    fetch_k = top_k * RERANK_OVERFETCH if should_rerank else top_k
+
+    documents = {}  # parent id -> {"meta", "hits": {position: score}}
+    passages = []
+    for match in _fetch_matches(query_emb, index, fetch_k, query):
+        meta = match.get("metadata") or {}
+        parent_id = meta.get("parent_id")
+        if parent_id is None:
+            passages.append(_passage(meta, meta.get("snippet", ""), match.get("score", 0.0)))
+            continue
+        doc = documents.setdefault(parent_id, {"meta": meta, "hits": {}})
+        doc["hits"][int(meta.get("chunk", 0))] = match.get("score", 0.0)
+
+    store = get_chunk_store()
+    for parent_id, doc in documents.items():
+        wanted = {p + offset for p in doc["hits"] for offset in range(-neighbours, neighbours + 1) if p + offset >= 0}
+        texts = store.get(parent_id, wanted)
+        if not texts:
+            # Chunk texts are missing (e.g. the sidecar store was cleared); keep the snippet
+            passages.append(_passage(doc["meta"], doc["meta"].get("snippet", ""), max(doc["hits"].values())))
+            continue
+        # Split the available positions into contiguous runs, one passage per run
+        run = []
+        for position in sorted(texts):
+            if run and position != run[-1] + 1:
+                passages.append(_merge_run(doc, run, texts))
+                run = []
+            run.append(position)
+        passages.append(_merge_run(doc, run, texts))
+
+    passages.sort(key=lambda p: p["score"], reverse=True)
+    if should_rerank:
+        return rerank(query, passages, top_n=min(top_k, RERANK_TOP_N))
+    return passages
+
+
+def _strip_overlap(previous, text):
+    """Drops the leading sentences of `text` that repeat the end of `previous`."""
+    sentences = split_sentences(text)
+    for k in range(len(sentences) - 1, 0, -1):
+        if previous.endswith(" ".join(sentences[:k])):
+            return " ".join(sentences[k:])
+    return text
+
+
+def _merge_run(doc, run, texts):
+    score = max((doc["hits"][p] for p in run if p in doc["hits"]), default=0.0)
+    merged = texts[run[0]]
+    for position in run[1:]:
+        merged += " " + _strip_overlap(merged, texts[position])
+    return _passage(doc["meta"], merged, score)
+
+
+def _passage(meta, text, score):
+    return {
+        "title": meta.get("title", "No Title"),
+        "url": meta.get("url", "No URL"),
+        "snippet": meta.get("snippet", ""),
+        "text": text,
+        "score": score,
+    }
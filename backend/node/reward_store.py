@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+
+from rag_resources import get_setting
+
+NODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ======== REWARD STORE SETTINGS ========
+REWARD_DB_PATH = get_setting("REWARD_DB_PATH", os.path.join(NODE_DIR, "reward_store.db"))
+LEGACY_REWARD_LOG = os.path.join(NODE_DIR, "reward_memory.json")
+REWARD_MAX_ROWS = int(get_setting("REWARD_MAX_ROWS", "100000"))  # Oldest entries beyond this are dropped
+REWARD_RETENTION_DAYS = int(get_setting("REWARD_RETENTION_DAYS", "0"))  # 0 keeps entries forever
+COMPACT_EVERY = 1000  # Inserts between automatic compactions
+
+
+class RewardStore:
+    """
+    Reward log backed by SQLite in WAL mode. Each entry is a single indexed
+    INSERT, so logging cost does not grow with the log and concurrent writers
+    (worker threads or separate processes) do not lose entries.
+    """
+
+    def __init__(self, path=REWARD_DB_PATH, legacy_log=LEGACY_REWARD_LOG):
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rewards (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT NOT NULL,
+                contexts TEXT NOT NULL,
+                answer TEXT,
+                reward_score REAL,
+                timestamp TEXT NOT NULL,
+                extra TEXT
+            );
+            CREATE INDEX IF NOT EXISTS rewards_query ON rewards (query);
+            CREATE INDEX IF NOT EXISTS rewards_timestamp ON rewards (timestamp);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._conn.commit()
+        if legacy_log:
+            self.migrate_legacy_log(legacy_log)
+
+    def migrate_legacy_log(self, path):
+        """One-time import of the old list-shaped reward_memory.json."""
+        key = f"migrated:{os.path.abspath(path)}"
+        entries = []
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                return 0
+            # BEGIN IMMEDIATE takes the write lock, so only one process performs the import
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+                    if os.path.exists(path):
+                        with open(path, "r", encoding="utf-8") as f:
+                            try:
+                                data = json.load(f)
+                            except json.JSONDecodeError:
+                                data = []
+                        if isinstance(data, list):  # The policy-shaped file written by RLAgent is not a reward log
+                            entries = data
+                    self._conn.executemany(
+                        "INSERT INTO rewards (query, contexts, answer, reward_score, timestamp, extra) VALUES (?, ?, ?, ?, ?, NULL)",
+                        [(e.get("query", ""), json.dumps(e.get("contexts", [])), e.get("answer"), e.get("reward_score"),
+                          e.get("timestamp") or datetime.now().isoformat()) for e in entries]
+                    )
+                    self._conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, datetime.now().isoformat()))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        if entries:
+            print(f"Migrated {len(entries)} entries from {path} into the reward store.", file=sys.stderr)
+        return len(entries)
+
+    def log(self, query, contexts, answer, reward_score, timestamp=None, **extra):
+        """Appends one entry; `extra` keyword fields are stored as JSON."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO rewards (query, contexts, answer, reward_score, timestamp, extra) VALUES (?, ?, ?, ?, ?, ?)",
+                    (query, json.dumps(contexts), answer, reward_score, timestamp or datetime.now().isoformat(),
+                     json.dumps(extra) if extra else None)
+                )
+            self._inserts += 1
+            if self._inserts % COMPACT_EVERY == 0:
+                self._compact()
+
+    def _to_entry(self, row):
+        entry = {
+            "query": row["query"],
+            "contexts": json.loads(row["contexts"]),
+            "answer": row["answer"],
+            "reward_score": row["reward_score"],
+            "timestamp": row["timestamp"],
+        }
+        if row["extra"]:
+            entry.update(json.loads(row["extra"]))
+        return entry
+
+    def _select(self, where="", params=(), order="id", limit=None):
+        sql = f"SELECT * FROM rewards {where} ORDER BY {order}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def by_query(self, query, limit=None):
+        return self._select("WHERE query = ?", (query,), limit=limit)
+
+    def between(self, start=None, end=None):
+        """Entries with start <= timestamp < end (ISO strings or datetimes)."""
+        start = start.isoformat() if isinstance(start, datetime) else (start or "")
+        end = end.isoformat() if isinstance(end, datetime) else (end or "\uffff")
+        return self._select("WHERE timestamp >= ? AND timestamp < ?", (start, end), order="timestamp")
+
+    def recent(self, limit=100):
+        return list(reversed(self._select(order="id DESC", limit=limit)))
+
+    def all(self):
+        return self._select()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rewards").fetchone()[0]
+
+    def compact(self, max_rows=None, retention_days=None):
+        with self._lock:
+            return self._compact(max_rows, retention_days)
+
+    def _compact(self, max_rows=None, retention_days=None):
+        """Drops entries beyond the retention policy and truncates the WAL file."""
+        max_rows = REWARD_MAX_ROWS if max_rows is None else max_rows
+        retention_days = REWARD_RETENTION_DAYS if retention_days is None else retention_days
+        with self._conn:
+            deleted = 0
+            if retention_days:
+                cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+                deleted += self._conn.execute("DELETE FROM rewards WHERE timestamp < ?", (cutoff,)).rowcount
+            if max_rows:
+                deleted += self._conn.execute(
+                    "DELETE FROM rewards WHERE id NOT IN (SELECT id FROM rewards ORDER BY id DESC LIMIT ?)", (max_rows,)
+                ).rowcount
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+
+def is_compare_entry(entry):
+    """
+    True for entries logged by rag_query_compare.py. Their reward is the
+    judge-based rag_reward (roughly 0-10), whereas rag_query.py and the legacy
+    log store an answer/context cosine similarity (0-1), so the two must not be
+    averaged together. Entries from before the pipeline field was logged are
+    recognised by the arm and latency only the compare pipeline records.
+    """
+    if entry.get("pipeline") is not None:
+        return entry["pipeline"] == "compare"
+    return entry.get("arm") is not None and entry.get("latency") is not None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_reward_store():
+    """Returns the process-wide RewardStore."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RewardStore()
+        return _store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and maintain the reward store.")
+    parser.add_argument("--compact", action="store_true", help="Apply the retention policy now")
+    parser.add_argument("--export", help="Write all entries to a JSON file in the old reward_memory.json format")
+    args = parser.parse_args()
+
+    store = get_reward_store()
+    if args.compact:
+        print(f"Removed {store.compact()} entries.")
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as f:
+            json.dump(store.all(), f, indent=2)
+    print(f"Reward store {REWARD_DB_PATH}: {store.count()} entries.")
@@ -1,67 +1,105 @@
-import json
-import os
-from collections import defaultdict
+from bandits import LINUCB_CONTEXT_DIM, UCB1, ThompsonSampling, LinUCB, project_context
+from policy_store import get_policy_store
+from rag_resources import get_setting
+
+POLICY_NAME = "top_k"
+CONFIG_POLICY_NAME = "config"
+RL_STRATEGY = get_setting("RL_STRATEGY", "linucb")  # "ucb1", "thompson" or "linucb"
+# Reward lost per second of pipeline latency, so cheaper configurations win ties
+LATENCY_PENALTY = float(get_setting("RL_LATENCY_PENALTY", "0.05"))
+
+# Configurations the agent chooses between: how many documents to retrieve,
+# whether to search and scrape the web first, and how many results to scrape.
+TOP_K_OPTIONS = [3, 5, 7]
+NUM_RESULTS_OPTIONS = [3, 5]
+CONFIG_ARMS = (
+    [f"top_k={k},ingest=0,results=0" for k in TOP_K_OPTIONS] +
+    [f"top_k={k},ingest=1,results={n}" for k in TOP_K_OPTIONS for n in NUM_RESULTS_OPTIONS]
+)
+# What the pipeline did before the agent chose anything beyond top_k
+DEFAULT_ARM = "top_k=5,ingest=1,results=5"
+
+
+def parse_arm(arm):
+    """Turns an arm key like "top_k=5,ingest=1,results=5" into a config dict."""
+    values = dict(part.split("=") for part in arm.split(","))
+    return {"arm": arm, "top_k": int(values["top_k"]), "web_ingest": values["ingest"] == "1", "num_results": int(values["results"])}
+
+
+def make_bandit(strategy, store=None):
+    """Builds a bandit for the configuration arms, loaded with the stored statistics."""
+    if strategy == "linucb":
+        # project_context appends a bias feature to the LINUCB_CONTEXT_DIM projection
+        return LinUCB(store.load_linear(CONFIG_POLICY_NAME, LINUCB_CONTEXT_DIM + 1) if store else None)
+    stats = store.load(CONFIG_POLICY_NAME) if store else None
+    if strategy == "thompson":
+        return ThompsonSampling(stats)
+    if strategy == "ucb1":
+        return UCB1(stats)
+    raise ValueError(f"Unknown RL strategy: {strategy}")
 
-POLICY_FILE = "reward_memory.json" # This file already exists and is used for reward scores.
 
 class RLAgent:
-    def __init__(self):
+    def __init__(self, store=None, strategy=RL_STRATEGY):
+        self.store = store or get_policy_store()
+        self.strategy = strategy
         self.policy = self._load_policy()
+        self.bandit = make_bandit(strategy, self.store)
 
     def _load_policy(self):
-        if os.path.exists(POLICY_FILE):
-            with open(POLICY_FILE, 'r') as f:
-                try:
-                    return json.load(f)
-                except json.JSONDecodeError:
-                    return {"top_k_rewards": defaultdict(lambda: {"sum": 0, "count": 0})}
-        return {"top_k_rewards": defaultdict(lambda: {"sum": 0, "count": 0})}
-
-    def _save_policy(self):
-        # Convert defaultdict to dict for JSON serialization
-        serializable_policy = {
-            "top_k_rewards": {k: dict(v) for k, v in self.policy["top_k_rewards"].items()}
-        }
-        with open(POLICY_FILE, 'w') as f:
-            json.dump(serializable_policy, f, indent=2)
+        return {"top_k_rewards": self.store.load(POLICY_NAME)}
 
     def choose_action(self, available_actions):
         """
-        Chooses an action (top_k) based on the current policy.
-        For simplicity, chooses the top_k with the highest average reward.
-        If no history, chooses randomly.
+        Chooses an action (top_k) based on the current policy using UCB1, so
+        arms with few samples keep being explored. Untried arms go first.
         """
-        best_top_k = None
-        max_avg_reward = -1
-
-        # Ensure available_actions are strings for consistent key comparison
-        available_actions_str = [str(k) for k in available_actions]
-
-        for top_k_str in available_actions_str:
-            if top_k_str in self.policy["top_k_rewards"] and self.policy["top_k_rewards"][top_k_str]["count"] > 0:
-                avg_reward = self.policy["top_k_rewards"][top_k_str]["sum"] / self.policy["top_k_rewards"][top_k_str]["count"]
-                if avg_reward > max_avg_reward:
-                    max_avg_reward = avg_reward
-                    best_top_k = int(top_k_str)
-        
-        if best_top_k is None:
-            # If no history or all average rewards are 0, choose randomly
-            import random
-            best_top_k = random.choice(available_actions)
-        
-        return best_top_k
+        bandit = UCB1(self.policy["top_k_rewards"])
+        return int(bandit.select([str(k) for k in available_actions]))
+
+    def choose_config(self, query_embedding=None):
+        """
+        Chooses a full pipeline configuration (top_k, web ingestion on/off,
+        number of results to scrape). LinUCB uses the query embedding as
+        context; without one it falls back to UCB1.
+        """
+        if isinstance(self.bandit, LinUCB) and query_embedding is not None:
+            arm = self.bandit.select(CONFIG_ARMS, project_context(query_embedding))
+        elif isinstance(self.bandit, LinUCB):
+            arm = UCB1(self.store.load(CONFIG_POLICY_NAME)).select(CONFIG_ARMS)
+        else:
+            arm = self.bandit.select(CONFIG_ARMS)
+        return parse_arm(arm)
 
     def learn(self, action, reward):
         """
         Updates the policy based on the action taken and the reward received.
+        The store applies the update atomically; the in-memory copy is then
+        refreshed so it also reflects updates made by concurrent requests.
+        """
+        self.store.record(POLICY_NAME, action, reward)
+        self.policy = self._load_policy()
+
+    def learn_config(self, config, reward, query_embedding=None, latency=None):
         """
-        action_str = str(action) # Ensure action is string for consistent key
-        if action_str not in self.policy["top_k_rewards"]:
-            self.policy["top_k_rewards"][action_str] = {"sum": 0, "count": 0}
-        
-        self.policy["top_k_rewards"][action_str]["sum"] += reward
-        self.policy["top_k_rewards"][action_str]["count"] += 1
-        self._save_policy()
+        Records the reward of a configuration chosen by choose_config, minus the
+        latency penalty. Both the per-arm statistics and the LinUCB matrices are
+        updated, so the strategy can be switched without losing history.
+        """
+        adjusted = reward_with_latency(reward, latency)
+        self.store.record(CONFIG_POLICY_NAME, config["arm"], adjusted)
+        self.learn(config["top_k"], reward)
+        if query_embedding is not None:
+            context = project_context(query_embedding)
+            self.store.record_linear(CONFIG_POLICY_NAME, config["arm"], context, adjusted)
+            if isinstance(self.bandit, LinUCB):
+                self.bandit.update(config["arm"], adjusted, context)
+        if not isinstance(self.bandit, LinUCB):
+            self.bandit.update(config["arm"], adjusted)
+
+
+def reward_with_latency(reward, latency):
+    return reward - LATENCY_PENALTY * latency if latency else reward
 
 if __name__ == "__main__":
     # Example usage:
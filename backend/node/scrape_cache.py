@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from embedding_service import content_hash
+from rag_resources import get_setting
+
+# ======== SCRAPE CACHE SETTINGS ========
+SCRAPE_CACHE_ENABLED = get_setting("SCRAPE_CACHE_ENABLED", "1") == "1"
+SCRAPE_CACHE_PATH = get_setting("SCRAPE_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "scrape_cache.db"))
+SCRAPE_CACHE_TTL = float(get_setting("SCRAPE_CACHE_TTL", "21600"))  # Seconds a page is served without revalidating
+SCRAPE_CACHE_MAX_BYTES = int(get_setting("SCRAPE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))  # Compressed text size bound
+
+
+class ScrapeCache:
+    """
+    On-disk cache of extracted page text keyed by URL. Each entry keeps the
+    ETag / Last-Modified validators for conditional revalidation and a content
+    hash. Texts are zlib-compressed and the least recently used entries are
+    evicted once the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, path=SCRAPE_CACHE_PATH, ttl=SCRAPE_CACHE_TTL, max_bytes=SCRAPE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                text BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                validated_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used);
+        """)
+        self._conn.commit()
+
+    def get(self, url):
+        """
+        Returns {"text", "content_hash", "etag", "last_modified", "fresh"} or
+        None. `fresh` entries are younger than the TTL and can be used without
+        contacting the server.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, content_hash, etag, last_modified, validated_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE pages SET last_used = ? WHERE url = ?", (now, url))
+        text, digest, etag, last_modified, validated_at = row
+        return {
+            "text": zlib.decompress(text).decode("utf-8"),
+            "content_hash": digest,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fresh": now - validated_at < self.ttl,
+        }
+
+    def put(self, url, text, etag=None, last_modified=None):
+        """Stores freshly downloaded text and returns its content hash."""
+        now = time.time()
+        digest = content_hash(text)
+        blob = zlib.compress(text.encode("utf-8"))
+        with self._lock:
+            with self._conn:
+                self._conn.execute("""
+                    INSERT INTO pages (url, text, size, content_hash, etag, last_modified, validated_at, last_used)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (url) DO UPDATE SET
+                        text = excluded.text, size = excluded.size, etag = excluded.etag,
+                        last_modified = excluded.last_modified, validated_at = excluded.validated_at,
+                        last_used = excluded.last_used, content_hash = excluded.content_hash
+                """, (url, blob, len(blob), digest, etag, last_modified, now, now))
+                self._evict()
+        return digest
+
+    def revalidated(self, url):
+        """Marks an entry as confirmed unchanged by the server (HTTP 304)."""
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("UPDATE pages SET validated_at = ?, last_used = ? WHERE url = ?", (now, now, url))
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        victims = []
+        for url, size in self._conn.execute("SELECT url, size FROM pages ORDER BY last_used"):
+            victims.append((url,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        self._conn.executemany("DELETE FROM pages WHERE url = ?", victims)
+
+    def prewarm(self, path):
+        """Loads the `url`/`content` pairs of a scraped_data.json file into the cache."""
+        with open(path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        loaded = 0
+        for item in items:
+            if item.get("url") and item.get("content"):
+                self.put(item["url"], item["content"])
+                loaded += 1
+        return loaded
+
+    def stats(self):
+        with self._lock:
+            count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return {"pages": count, "bytes": size, "ttl": self.ttl, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM pages")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_scrape_cache():
+    """Returns the process-wide ScrapeCache, or None when SCRAPE_CACHE_ENABLED=0."""
+    global _cache
+    if not SCRAPE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ScrapeCache()
+        return _cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, clear or pre-warm the scrape cache.")
+    parser.add_argument("--prewarm", metavar="SCRAPED_DATA_JSON", help="Load pages from a scraped_data.json file")
+    parser.add_argument("--clear", action="store_true")
+    args = parser.parse_args()
+
+    cache = ScrapeCache()
+    if args.clear:
+        cache.clear()
+    if args.prewarm:
+        print(f"Pre-warmed {cache.prewarm(args.prewarm)} pages from {args.prewarm}")
+    print(json.dumps(cache.stats(), indent=2))
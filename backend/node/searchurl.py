@@ -2,9 +2,12 @@ import requests
 import dotenv
 import json
 import sys
+from rag_resources import get_setting
+from tracing import span
 
 dotenv.load_dotenv()
 SERPER_API_KEY = dotenv.get_key(dotenv.find_dotenv(), 'SERPER_API_KEY')
+SERPER_URL = get_setting("SERPER_URL", "https://google.serper.dev/search")  # Overridden by the local stand-in in fake_services.py
 
 def search_serper(query, num_results=5):
     """
@@ -12,7 +15,7 @@ def search_serper(query, num_results=5):
     and return a list of top search results.
     """
 
-    url = "https://google.serper.dev/search"
+    url = SERPER_URL
     headers = {
         "X-API-KEY": SERPER_API_KEY,
         "Content-Type": "application/json"
@@ -22,21 +25,24 @@ def search_serper(query, num_results=5):
         "num": num_results  # optional: limit number of results
     }
 
-    response = requests.post(url, headers=headers, json=payload)
-
-    if response.status_code != 200:
-        print("Error:", response.status_code, response.text)
-        return []
-
-    data = response.json()
-    results = []
-
-    # Extract the organic search results
-    for item in data.get("organic", []):
-        results.append({
-            "title": item.get("title"),
-            "link": item.get("link"),
-            "snippet": item.get("snippet")
-        })
+    with span("search", num_results=num_results) as current:
+        response = requests.post(url, headers=headers, json=payload)
+
+        if response.status_code != 200:
+            print("Error:", response.status_code, response.text)
+            current.set(status_code=response.status_code)
+            return []
+
+        data = response.json()
+        results = []
+
+        # Extract the organic search results
+        for item in data.get("organic", []):
+            results.append({
+                "title": item.get("title"),
+                "link": item.get("link"),
+                "snippet": item.get("snippet")
+            })
+        current.set(results=len(results))
 
     return results
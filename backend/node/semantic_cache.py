@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from rag_resources import get_setting
+from tracing import count
+
+# ======== SEMANTIC CACHE SETTINGS ========
+SEMANTIC_CACHE_ENABLED = get_setting("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_PATH = get_setting("SEMANTIC_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "semantic_cache.db"))
+SEMANTIC_CACHE_THRESHOLD = float(get_setting("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # Minimum cosine similarity for a hit
+SEMANTIC_CACHE_TTL = float(get_setting("SEMANTIC_CACHE_TTL", "86400"))  # Seconds an answer stays fresh
+SEMANTIC_CACHE_MAX_ENTRIES = int(get_setting("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+
+
+class SemanticCache:
+    """
+    Query-level answer cache. A lookup returns the stored response of the most
+    similar cached query (by MiniLM cosine similarity) if it is above the
+    threshold and younger than the TTL. Entries live in SQLite, so the cache is
+    shared by the worker server and spawned scripts; the embeddings are kept in
+    an in-memory matrix that is reloaded whenever another connection writes.
+    Each namespace ("query", "compare") is cached separately.
+    """
+
+    def __init__(self, path=SEMANTIC_CACHE_PATH, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL, max_entries=SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace TEXT NOT NULL,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_namespace ON entries (namespace, created_at);
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS counters (namespace TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0, misses INTEGER NOT NULL DEFAULT 0);
+            -- Bumped whenever entries change, so readers know when to reload their matrices
+            CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO generation (id, value) VALUES (0, 0);
+        """)
+        self._conn.commit()
+        self._loaded_version = None
+        self._matrices = {}  # namespace -> (ids, created_at, normalised embeddings)
+
+    def _reload_if_changed(self):
+        version = self._conn.execute("SELECT value FROM generation").fetchone()[0]
+        if version == self._loaded_version:
+            return
+        rows = self._conn.execute("SELECT id, namespace, created_at, embedding FROM entries").fetchall()
+        # Rows deleted between reading the generation and the entries are skipped at lookup time
+        grouped = {}
+        for entry_id, namespace, created_at, embedding in rows:
+            grouped.setdefault(namespace, []).append((entry_id, created_at, np.frombuffer(embedding, dtype=np.float32)))
+        self._matrices = {
+            namespace: (
+                np.array([r[0] for r in items]),
+                np.array([r[1] for r in items]),
+                np.stack([r[2] / (np.linalg.norm(r[2]) or 1.0) for r in items]),
+            )
+            for namespace, items in grouped.items()
+        }
+        self._loaded_version = version
+
+    def _count(self, namespace, field):
+        self._conn.execute(
+            f"INSERT INTO counters (namespace, {field}) VALUES (?, 1) ON CONFLICT (namespace) DO UPDATE SET {field} = {field} + 1",
+            (namespace,)
+        )
+
+    def lookup(self, namespace, query_embedding):
+        """Returns (response, info) for a fresh cached query similar enough, else (None, None)."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        now = time.time()
+        with self._lock:
+            self._reload_if_changed()
+            best = None
+            if namespace in self._matrices:
+                ids, created_at, matrix = self._matrices[namespace]
+                scores = matrix @ query
+                scores[created_at < now - self.ttl] = -1.0
+                i = int(np.argmax(scores))
+                if scores[i] >= self.threshold:
+                    best = (int(ids[i]), float(scores[i]))
+
+            row = None
+            if best is not None:
+                row = self._conn.execute("SELECT query, response FROM entries WHERE id = ?", (best[0],)).fetchone()
+            with self._conn:
+                if row is None:
+                    self._count(namespace, "misses")
+                    count("cache_lookups", cache="semantic", result="miss")
+                    return None, None
+                self._conn.execute("UPDATE entries SET last_used = ? WHERE id = ?", (now, best[0]))
+                self._count(namespace, "hits")
+                count("cache_lookups", cache="semantic", result="hit")
+        return json.loads(row[1]), {"cached_query": row[0], "similarity": round(best[1], 4)}
+
+    def store(self, namespace, query, query_embedding, response):
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO entries (namespace, query, embedding, response, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                    (namespace, query, np.asarray(query_embedding, dtype=np.float32).tobytes(), json.dumps(response), now, now)
+                )
+                # Evict expired entries first, then the least recently used beyond the size bound
+                self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+                excess = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    self._conn.execute("DELETE FROM entries WHERE id IN (SELECT id FROM entries ORDER BY last_used LIMIT ?)", (excess,))
+                self._conn.execute("UPDATE generation SET value = value + 1")
+
+    def metrics(self):
+        """Hit/miss counters and entry counts per namespace."""
+        with self._lock:
+            counters = self._conn.execute("SELECT namespace, hits, misses FROM counters").fetchall()
+            sizes = dict(self._conn.execute("SELECT namespace, COUNT(*) FROM entries GROUP BY namespace").fetchall())
+        return {
+            namespace: {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+                "entries": sizes.get(namespace, 0),
+            }
+            for namespace, hits, misses in counters
+        }
+
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM entries")
+                self._conn.execute("DELETE FROM counters")
+                self._conn.execute("UPDATE generation SET value = value + 1")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """Returns the process-wide SemanticCache, or None when SEMANTIC_CACHE_ENABLED=0."""
+    global _cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticCache()
+        return _cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the semantic query cache.")
+    parser.add_argument("--clear", action="store_true")
+    args = parser.parse_args()
+
+    cache = SemanticCache()
+    if args.clear:
+        cache.clear()
+    print(json.dumps(cache.metrics(), indent=2))
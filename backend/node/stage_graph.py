@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from tracing import propagate, span
+
+
+class StageGraph:
+    """
+    Runs named pipeline stages as a dependency graph. A stage starts as soon as
+    all the stages it depends on have finished, so independent stages overlap.
+    Each stage function is called with the results of its dependencies as
+    keyword arguments. Every stage runs in a tracing span nested under the
+    span that was current when `run` was called.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._stages = {}
+
+    def add(self, name, fn, deps=()):
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self._stages[name] = (fn, tuple(deps))
+        return self
+
+    def run(self):
+        """Runs every stage; returns (results, timings) keyed by stage name, timings in seconds."""
+        results, timings = {}, {}
+        pending = dict(self._stages)
+        running = {}
+        graph_start = time.time()
+
+        def timed(name, fn, kwargs):
+            start = time.time()
+            try:
+                with span(name):
+                    return fn(**kwargs)
+            finally:
+                timings[name] = {
+                    "start": round(start - graph_start, 3),
+                    "seconds": round(time.time() - start, 3),
+                }
+
+        with ThreadPoolExecutor(max_workers=self.max_workers or len(self._stages) or 1) as executor:
+            while pending or running:
+                for name, (fn, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        kwargs = {dep: results[dep] for dep in deps}
+                        running[executor.submit(propagate(timed), name, fn, kwargs)] = name
+                        del pending[name]
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    # Re-raises a stage's exception; stages that can fail softly handle it themselves
+                    results[running.pop(future)] = future.result()
+        return results, timings
@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from rag_resources import get_setting
+
+# ======== PROFILE SETTINGS ========
+NODE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULES = [
+    "rag_resources", "embedding_service", "retrieval", "ingestion", "webscrap",
+    "rag_query", "rag_query_compare", "comprehensive_evaluate", "rag_server",
+]
+# Entry points the Node backend spawns or imports; they must start without loading any model
+ENTRY_MODULES = ["rag_query", "rag_query_compare", "comprehensive_evaluate", "rag_server"]
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "bert_score", "pinecone", "groq"]
+STARTUP_BUDGET_MS = float(get_setting("STARTUP_BUDGET_MS", "1500"))  # Cold import budget per entry module
+
+
+def profile_import(module, top=5):
+    """
+    Imports `module` in a fresh interpreter with `-X importtime` and returns
+    its cumulative import time, the slowest transitive imports and any heavy
+    ML/client packages that were loaded.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=NODE_DIR, capture_output=True, text=True
+    )
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if name == "site":
+            imports = {}  # Everything so far was interpreter startup
+            continue
+        imports[name] = int(cumulative) / 1000.0
+    if result.returncode != 0:
+        return {"module": module, "error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed"}
+    slowest = sorted(((ms, name) for name, ms in imports.items() if name != module), reverse=True)[:top]
+    return {
+        "module": module,
+        "import_ms": round(imports.get(module, 0.0), 1),
+        "slowest": [{"module": name, "ms": round(ms, 1)} for ms, name in slowest],
+        "heavy": sorted(name for name in HEAVY_MODULES if name in imports),
+    }
+
+
+def profile_models():
+    """Times each lazy loader in this process; failures (e.g. missing keys) are reported, not raised."""
+    from llm_client import get_llm_client
+    from rag_resources import get_embedder, get_index
+    from comprehensive_evaluate import get_qa_pipeline
+    from reranker import get_cross_encoder
+
+    loaders = [
+        ("embedder", get_embedder),
+        ("index", get_index),
+        ("llm_client", get_llm_client),
+        ("qa_pipeline", get_qa_pipeline),
+        ("cross_encoder", get_cross_encoder),
+    ]
+    timings = []
+    for name, loader in loaders:
+        start = time.perf_counter()
+        try:
+            loader()
+            timings.append({"resource": name, "load_ms": round((time.perf_counter() - start) * 1000, 1)})
+        except Exception as e:
+            timings.append({"resource": name, "error": f"{type(e).__name__}: {e}"})
+    return timings
+
+
+def check(report, budget_ms):
+    """Returns the cold-start regressions found in a report."""
+    failures = []
+    for entry in report["imports"]:
+        if entry["module"] not in ENTRY_MODULES:
+            continue
+        if "error" in entry:
+            failures.append(f"{entry['module']}: {entry['error']}")
+            continue
+        if entry["heavy"]:
+            failures.append(f"{entry['module']} loads {', '.join(entry['heavy'])} at import time")
+        if entry["import_ms"] > budget_ms:
+            failures.append(f"{entry['module']} takes {entry['import_ms']} ms to import (budget {budget_ms:.0f} ms)")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report import and model load times of the Python scripts.")
+    parser.add_argument("--models", action="store_true", help="Also time loading each model and client")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if an entry module regresses")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    args = parser.parse_args()
+
+    report = {"imports": [profile_import(module) for module in MODULES]}
+    if args.models:
+        report["models"] = profile_models()
+    print(json.dumps(report, indent=2))
+
+    if args.check:
+        failures = check(report, args.budget_ms)
+        for failure in failures:
+            print(f"Cold-start regression: {failure}", file=sys.stderr)
+        sys.exit(1 if failures else 0)
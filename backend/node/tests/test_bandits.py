@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from bandits import LinUCB, ThompsonSampling, UCB1, project_context
+from rag_resources import EMBEDDING_DIM
+
+
+def test_ucb1_tries_every_arm_first():
+    bandit = UCB1()
+    arms = ["a", "b", "c"]
+    for _ in arms:
+        arm = bandit.select(arms)
+        bandit.update(arm, 5.0)
+    assert {arm: s["count"] for arm, s in bandit.stats.items()} == {"a": 1, "b": 1, "c": 1}
+
+
+def test_ucb1_prefers_the_better_arm():
+    bandit = UCB1(reward_range=1.0)
+    for _ in range(50):
+        bandit.update("good", 9.0)
+        bandit.update("bad", 1.0)
+    assert bandit.select(["good", "bad"]) == "good"
+
+
+def test_ucb1_update_keeps_sums():
+    bandit = UCB1()
+    bandit.update("a", 2.0)
+    bandit.update("a", 4.0)
+    assert bandit.stats["a"] == {"sum": 6.0, "count": 2, "sum_sq": 20.0}
+
+
+def test_thompson_converges_on_the_better_arm():
+    bandit = ThompsonSampling()
+    for _ in range(100):
+        bandit.update("good", 8.0)
+        bandit.update("bad", 2.0)
+    picks = [bandit.select(["good", "bad"]) for _ in range(50)]
+    assert picks.count("good") == 50
+
+
+def test_linucb_update_accumulates_design_matrix():
+    bandit = LinUCB(dim=3)
+    x = np.array([1.0, 2.0, 1.0])
+    bandit.update("a", 3.0, x)
+    A, b = bandit.state["a"]
+    np.testing.assert_allclose(A, np.eye(3) + np.outer(x, x))
+    np.testing.assert_allclose(b, 3.0 * x)
+
+
+def test_linucb_learns_arm_per_context():
+    bandit = LinUCB(alpha=0.1, dim=2)
+    left, right = np.array([1.0, 0.0]), np.array([0.0, 1.0])
+    for _ in range(20):
+        bandit.update("a", 9.0, left)
+        bandit.update("a", 1.0, right)
+        bandit.update("b", 1.0, left)
+        bandit.update("b", 9.0, right)
+    assert bandit.select(["a", "b"], left) == "a"
+    assert bandit.select(["a", "b"], right) == "b"
+
+
+def test_linucb_needs_context():
+    with pytest.raises(ValueError):
+        LinUCB().select(["a"])
+
+
+def test_project_context_is_normalised_with_bias():
+    embedding = np.random.default_rng(1).normal(size=EMBEDDING_DIM)
+    x = project_context(embedding, dim=8)
+    assert x.shape == (9,)
+    assert x[-1] == 1.0
+    assert np.linalg.norm(x[:-1]) == pytest.approx(1.0)
+    np.testing.assert_allclose(project_context(embedding, dim=8), x)
@@ -0,0 +1,67 @@
+import pytest
+
+from bm25_index import BM25Index, tokenize
+from retrieval import reciprocal_rank_fusion
+
+DOCUMENTS = {
+    "doc-a": ["Node.js runs JavaScript on the server.", "It uses an event loop."],
+    "doc-b": ["Python is a programming language.", "Python has a large standard library."],
+    "doc-c": ["The event loop schedules callbacks in Node.js."],
+}
+
+
+def make_index(path, documents):
+    index = BM25Index(path=str(path))
+    for parent_id, chunks in documents.items():
+        index.add_document(parent_id, [f"{parent_id}#{p}" for p in range(len(chunks))], chunks, {"title": parent_id})
+    return index
+
+
+def scores(index, query):
+    return {m["id"]: m["score"] for m in index.search(query, top_k=10)}
+
+
+def test_tokenize_keeps_compound_terms_and_drops_stopwords():
+    assert tokenize("What is Node.js and GPT-4o?") == ["node.js", "node", "js", "gpt-4o", "gpt", "4o"]
+
+
+def test_search_ranks_matching_chunks(tmp_path):
+    index = make_index(tmp_path / "bm25.db", DOCUMENTS)
+    matches = index.search("python library", top_k=2)
+    assert [m["id"] for m in matches] == ["doc-b#1", "doc-b#0"]
+    assert matches[0]["metadata"] == {"title": "doc-b", "parent_id": "doc-b", "chunk": 1}
+    assert index.search("the of and") == []
+
+
+def test_remove_matches_an_index_built_without_the_document(tmp_path):
+    index = make_index(tmp_path / "incremental.db", DOCUMENTS)
+    index.remove_document("doc-b")
+    rebuilt = make_index(tmp_path / "rebuilt.db", {k: v for k, v in DOCUMENTS.items() if k != "doc-b"})
+
+    assert index.stats() == rebuilt.stats()
+    assert index.search("python") == []
+    for query in ("event loop", "node.js server"):
+        expected = scores(rebuilt, query)
+        assert scores(index, query).keys() == expected.keys()
+        for chunk_id, score in scores(index, query).items():
+            assert score == pytest.approx(expected[chunk_id])
+
+
+def test_re_adding_a_document_replaces_its_chunks(tmp_path):
+    index = make_index(tmp_path / "bm25.db", DOCUMENTS)
+    index.add_document("doc-a", ["doc-a#0"], ["Deno is another runtime."], {"title": "doc-a"})
+    assert index.stats()["chunks"] == 4
+    assert [m["id"] for m in index.search("javascript")] == []
+    assert [m["id"] for m in index.search("deno")] == ["doc-a#0"]
+
+
+def test_reciprocal_rank_fusion_sums_rank_contributions():
+    vector = [{"id": "x", "score": 0.9, "metadata": {"from": "vector"}}, {"id": "y", "score": 0.8, "metadata": {}}]
+    keyword = [{"id": "y", "score": 7.0, "metadata": {"from": "bm25"}}, {"id": "z", "score": 3.0, "metadata": {}}]
+    fused = reciprocal_rank_fusion([vector, keyword], top_k=3, k=60)
+
+    assert [m["id"] for m in fused] == ["y", "x", "z"]
+    assert fused[0]["score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1]["score"] == pytest.approx(1 / 61)
+    assert fused[1]["metadata"] == {"from": "vector"}
+    assert len(reciprocal_rank_fusion([vector, keyword], top_k=1)) == 1
@@ -0,0 +1,100 @@
+import time
+import zlib
+
+import numpy as np
+import pytest
+
+import chunking
+import ingestion
+from bm25_index import BM25Index
+from chunk_store import ChunkStore
+from ingestion import document_id, ingest_pages, normalize_url
+from vector_store import LocalVectorStore
+
+DIM = 8
+
+
+class FakeEmbedder:
+    """Deterministic per-text vectors in place of MiniLM."""
+
+    def encode(self, texts):
+        return np.array([np.random.default_rng(zlib.crc32(t.encode())).normal(size=DIM) for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    chunk_store = ChunkStore(path=str(tmp_path / "chunk_store.db"))
+    bm25 = BM25Index(path=str(tmp_path / "bm25_index.db"))
+    monkeypatch.setattr(ingestion, "get_chunk_store", lambda: chunk_store)
+    monkeypatch.setattr(ingestion, "get_bm25_index", lambda: bm25)
+    monkeypatch.setattr(chunking, "count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(ingestion, "_last_expiry", time.time())  # Only forced sweeps run
+    index = LocalVectorStore(path=str(tmp_path / "vector_store"), dimension=DIM, mmap=False, ann="")
+    return index, chunk_store, bm25
+
+
+def page(url, content, title="Page"):
+    return {"link": url, "title": title, "snippet": ""}, content
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTPS://WWW.Example.com/a/b/", "https://example.com/a/b"),
+    ("https://example.com:443/a#section", "https://example.com/a"),
+    ("http://example.com:8080/", "http://example.com:8080/"),
+    ("https://example.com/a?utm_source=x&b=2&a=1&fbclid=y", "https://example.com/a?a=1&b=2"),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+
+def test_document_id_ignores_url_noise_but_not_content():
+    content = "Retrieval augmented generation."
+    assert document_id("https://www.example.com/a/?utm_medium=email", content) == document_id("https://example.com/a", content)
+    assert document_id("https://example.com/a", content) != document_id("https://example.com/a", content + " Updated.")
+    assert document_id("https://example.com/a", content) != document_id("https://example.com/b", content)
+
+
+def test_unchanged_page_is_skipped(stores):
+    index, chunk_store, bm25 = stores
+    pages = [page("https://example.com/a", "Alpha beta gamma. Delta epsilon.")]
+    assert ingest_pages("q", pages, index, FakeEmbedder(), ttl=3600)["indexed"] == 1
+    stats = ingest_pages("q", pages + pages, index, FakeEmbedder(), ttl=3600)
+    assert stats == {"indexed": 0, "skipped": 2, "chunks": 0}
+    assert index.describe_index_stats()["total_vector_count"] == 1
+
+
+def test_changed_page_replaces_old_version(stores):
+    index, chunk_store, bm25 = stores
+    url = "https://example.com/a"
+    ingest_pages("q", [page(url, "Old text about pandas.")], index, FakeEmbedder(), ttl=3600)
+    old_id = document_id(url, "Old text about pandas.")
+
+    stats = ingest_pages("q", [page(url + "/?utm_source=feed", "New text about koalas.")], index, FakeEmbedder(), ttl=3600)
+    new_id = document_id(url, "New text about koalas.")
+
+    assert stats["indexed"] == 1
+    assert not chunk_store.has(old_id)
+    assert chunk_store.documents_for_url(normalize_url(url)) == [(new_id, 1)]
+    assert [m["metadata"]["parent_id"] for m in index.query(FakeEmbedder().encode(["x"])[0], top_k=5, include_metadata=True)["matches"]] == [new_id]
+    assert bm25.search("pandas") == []
+    assert bm25.search("koalas")[0]["metadata"]["parent_id"] == new_id
+
+
+def test_expired_documents_are_removed(stores):
+    index, chunk_store, bm25 = stores
+    ingest_pages("q", [page("https://example.com/a", "Short lived page.")], index, FakeEmbedder(), ttl=-1)
+    assert ingestion.expire_dynamic_documents(index, force=True) == 1
+    assert index.describe_index_stats()["total_vector_count"] == 0
+    assert bm25.stats()["documents"] == 0
+
+
+def test_purge_legacy_vectors_keeps_current_documents(stores):
+    index, chunk_store, bm25 = stores
+    ingest_pages("q", [page("https://example.com/a", "Current page.")], index, FakeEmbedder(), ttl=3600)
+    legacy = ["dynamic-0", "dynamic-4", "dynamic-1718000000.123456", "0", "17"]
+    index.upsert(vectors=[{"id": i, "values": FakeEmbedder().encode([i])[0].tolist()} for i in legacy + ["dynamic-notes", "7b"]])
+
+    assert ingestion.purge_legacy_vectors(index, batch_size=2) == len(legacy)
+    remaining = [i for ids in index.list() for i in ids]
+    assert sorted(remaining) == sorted([f"{document_id('https://example.com/a', 'Current page.')}#0", "dynamic-notes", "7b"])
+    assert ingestion.purge_legacy_vectors(index) == 0
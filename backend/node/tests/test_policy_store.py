@@ -0,0 +1,35 @@
+import numpy as np
+
+from policy_store import PolicyStore
+
+
+def make_store(tmp_path):
+    return PolicyStore(path=str(tmp_path / "policy_store.db"), legacy_files=[])
+
+
+def test_record_accumulates_arm_stats(tmp_path):
+    store = make_store(tmp_path)
+    store.record("top_k", 3, 2.0)
+    store.record("top_k", 3, 4.0)
+    assert store.load("top_k") == {"3": {"sum": 6.0, "count": 2, "sum_sq": 20.0}}
+
+
+def test_linear_arms_round_trip(tmp_path):
+    store = make_store(tmp_path)
+    x = np.array([1.0, 0.5, 1.0])
+    store.record_linear("config", "a", x, 2.0)
+    A, b = store.load_linear("config")["a"]
+    np.testing.assert_allclose(A, np.eye(3) + np.outer(x, x))
+    np.testing.assert_allclose(b, 2.0 * x)
+
+
+def test_linear_arm_resets_when_dimension_changes(tmp_path):
+    store = make_store(tmp_path)
+    store.record_linear("config", "a", np.ones(3), 2.0)
+    assert store.load_linear("config", dim=5) == {}
+
+    x = np.ones(5)
+    store.record_linear("config", "a", x, 1.0)
+    A, b = store.load_linear("config", dim=5)["a"]
+    np.testing.assert_allclose(A, np.eye(5) + np.outer(x, x))
+    np.testing.assert_allclose(b, x)
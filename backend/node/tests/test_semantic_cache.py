@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+import semantic_cache
+from semantic_cache import SemanticCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(semantic_cache.time, "time", clock)
+    return clock
+
+
+def make_cache(tmp_path, **kwargs):
+    return SemanticCache(path=str(tmp_path / "semantic_cache.db"), **kwargs)
+
+
+def unit(*values):
+    vector = np.zeros(8, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector
+
+
+def test_hit_above_threshold_miss_below(tmp_path, clock):
+    cache = make_cache(tmp_path, threshold=0.95)
+    cache.store("query", "what is rag", unit(1.0), {"answer": "retrieval"})
+
+    response, info = cache.lookup("query", unit(1.0, 0.1))
+    assert response == {"answer": "retrieval"}
+    assert info["cached_query"] == "what is rag"
+    assert info["similarity"] >= 0.95
+
+    assert cache.lookup("query", unit(1.0, 1.0)) == (None, None)
+    assert cache.metrics()["query"]["hits"] == 1
+    assert cache.metrics()["query"]["misses"] == 1
+
+
+def test_namespaces_are_separate(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.store("query", "q", unit(1.0), "a")
+    assert cache.lookup("compare", unit(1.0)) == (None, None)
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = make_cache(tmp_path, ttl=60)
+    cache.store("query", "q", unit(1.0), "a")
+    clock.now += 30
+    assert cache.lookup("query", unit(1.0))[0] == "a"
+    clock.now += 31
+    assert cache.lookup("query", unit(1.0)) == (None, None)
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.store("query", "first", unit(1.0), "1")
+    clock.now += 1
+    cache.store("query", "second", unit(0.0, 1.0), "2")
+    clock.now += 1
+    assert cache.lookup("query", unit(1.0))[0] == "1"  # "second" is now the least recently used
+    clock.now += 1
+    cache.store("query", "third", unit(0.0, 0.0, 1.0), "3")
+
+    assert cache.lookup("query", unit(0.0, 1.0)) == (None, None)
+    assert cache.lookup("query", unit(1.0))[0] == "1"
+    assert cache.lookup("query", unit(0.0, 0.0, 1.0))[0] == "3"
+    assert cache.metrics()["query"]["entries"] == 2
+
+
+def test_other_connections_see_new_entries(tmp_path, clock):
+    writer, reader = make_cache(tmp_path), make_cache(tmp_path)
+    assert reader.lookup("query", unit(1.0)) == (None, None)
+    writer.store("query", "q", unit(1.0), "a")
+    assert reader.lookup("query", unit(1.0))[0] == "a"
@@ -0,0 +1,25 @@
+import pytest
+
+from startup_profile import STARTUP_BUDGET_MS, check, profile_import
+
+
+@pytest.mark.parametrize("module", ["rag_server", "rag_query", "rag_query_compare"])
+def test_entry_module_starts_cold_within_budget(module):
+    entry = profile_import(module)
+    assert "error" not in entry, entry.get("error")
+    assert entry["heavy"] == [], f"{module} loads {', '.join(entry['heavy'])} at import time"
+    assert entry["import_ms"] <= STARTUP_BUDGET_MS
+    assert check({"imports": [entry]}, STARTUP_BUDGET_MS) == []
+
+
+def test_check_reports_regressions():
+    report = {"imports": [
+        {"module": "rag_query", "import_ms": 2000.0, "slowest": [], "heavy": ["torch"]},
+        {"module": "rag_server", "error": "ModuleNotFoundError: No module named 'x'"},
+        {"module": "retrieval", "import_ms": 5000.0, "slowest": [], "heavy": ["torch"]},  # Not an entry module
+    ]}
+    assert check(report, 1500) == [
+        "rag_query loads torch at import time",
+        "rag_query takes 2000.0 ms to import (budget 1500 ms)",
+        "rag_server: ModuleNotFoundError: No module named 'x'",
+    ]
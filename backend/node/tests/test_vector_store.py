@@ -0,0 +1,167 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import vector_store
+from vector_store import LocalVectorStore, matches_filter
+
+NODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DIM = 4
+
+
+def make_store(tmp_path, **kwargs):
+    return LocalVectorStore(path=str(tmp_path / "vector_store"), dimension=DIM, mmap=False, ann="", **kwargs)
+
+
+def vector(i):
+    values = np.zeros(DIM)
+    values[i % DIM] = 1.0
+    return values.tolist()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert(vectors=[
+        {"id": "a", "values": vector(0), "metadata": {"query": "q1", "year": 2020}},
+        {"id": "b", "values": [0.9, 0.1, 0, 0], "metadata": {"query": "q2", "year": 2023}},
+        {"id": "c", "values": vector(1), "metadata": {"query": "q1", "year": 2024}},
+    ])
+    return store
+
+
+@pytest.mark.parametrize("metadata_filter, expected", [
+    ({"query": "q1"}, True),
+    ({"query": {"$ne": "q1"}}, False),
+    ({"year": {"$gte": 2020, "$lt": 2021}}, True),
+    ({"query": {"$in": ["q2", "q3"]}}, False),
+    ({"$or": [{"query": "q2"}, {"year": 2020}]}, True),
+    ({"$and": [{"query": "q1"}, {"year": {"$gt": 2020}}]}, False),
+    ({"missing": {"$exists": False}}, True),
+])
+def test_matches_filter(metadata_filter, expected):
+    assert matches_filter({"query": "q1", "year": 2020}, metadata_filter) is expected
+
+
+def test_matches_filter_rejects_unknown_operators():
+    with pytest.raises(ValueError):
+        matches_filter({}, {"year": {"$regex": "20"}})
+
+
+def test_query_ranks_by_cosine_and_applies_filter(store):
+    assert [m["id"] for m in store.query(vector(0), top_k=2)["matches"]] == ["a", "b"]
+    matches = store.query(vector(0), top_k=2, filter={"query": "q1"}, include_metadata=True)["matches"]
+    assert [m["id"] for m in matches] == ["a", "c"]
+    assert matches[0]["metadata"]["year"] == 2020
+
+
+def test_upsert_overwrites_existing_id(store):
+    store.upsert(vectors=[{"id": "a", "values": vector(2), "metadata": {"query": "q3"}}])
+    assert store.describe_index_stats()["total_vector_count"] == 3
+    assert store.fetch(["a"])["vectors"]["a"]["metadata"] == {"query": "q3"}
+    assert store.query(vector(2), top_k=1)["matches"][0]["id"] == "a"
+
+
+def test_delete_by_id_and_filter(store):
+    store.delete(ids=["b"])
+    assert "b" not in store.fetch(["b"])["vectors"]
+    store.delete(filter={"year": {"$gte": 2024}})
+    assert [m["id"] for m in store.query(vector(0), top_k=10)["matches"]] == ["a"]
+
+
+def test_compact_drops_dead_rows_and_survives_reopen(tmp_path, store):
+    store.upsert(vectors=[{"id": "a", "values": vector(3)}])
+    store.delete(ids=["b"])
+    assert store.describe_index_stats()["stored_rows"] == 4
+
+    store.compact()
+    assert store.describe_index_stats() == {
+        "dimension": DIM, "total_vector_count": 2, "stored_rows": 2, "namespaces": {"": {"vector_count": 2}},
+    }
+    reopened = make_store(tmp_path)
+    assert sorted(reopened.fetch(["a", "b", "c"])["vectors"]) == ["a", "c"]
+    assert reopened.query(vector(3), top_k=1)["matches"][0]["id"] == "a"
+
+
+def test_other_instances_see_writes(tmp_path, store):
+    other = make_store(tmp_path)
+    store.upsert(vectors=[{"id": "d", "values": vector(3)}])
+    assert other.query(vector(3), top_k=1)["matches"][0]["id"] == "d"
+    other.delete(delete_all=True)
+    assert store.query(vector(0), top_k=5)["matches"] == []
+
+
+def clustered(n, dim, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    return centres[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))
+
+
+def test_ivf_top_results_match_exact_search(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "IVF_MIN_SIZE", 500)
+    data = clustered(2000, 16)
+    exact = LocalVectorStore(path=str(tmp_path / "exact"), dimension=16, mmap=False, ann="")
+    ivf = LocalVectorStore(path=str(tmp_path / "ivf"), dimension=16, mmap=False, ann="ivf")
+    for store in (exact, ivf):
+        store.upsert(vectors=[{"id": str(i), "values": v.tolist()} for i, v in enumerate(data)])
+
+    queries = data[:20] + 0.05 * np.random.default_rng(1).normal(size=(20, 16))
+    for query in queries:
+        expected = [m["id"] for m in exact.query(query.tolist(), top_k=5)["matches"]]
+        assert [m["id"] for m in ivf.query(query.tolist(), top_k=5)["matches"]] == expected
+    assert ivf._ivf.trained_size == 2000
+    assert len(ivf._ivf.candidates(vector_store._normalize(queries[0]))) < 2000  # Only the probed lists are scored
+
+    # Vectors added after training go into the posting lists without retraining
+    ivf.upsert(vectors=[{"id": "new", "values": data[5].tolist()}])
+    ivf.delete(ids=["5"])
+    assert ivf.query(data[5].tolist(), top_k=1)["matches"][0]["id"] == "new"
+    assert ivf._ivf.trained_size == 2000
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_reopen_after_add_delete_compact(tmp_path, mmap):
+    path = str(tmp_path / "vector_store")
+    data = clustered(50, DIM)
+    store = LocalVectorStore(path=path, dimension=DIM, mmap=mmap, ann="")
+    store.upsert(vectors=[{"id": f"v{i}", "values": v.tolist(), "metadata": {"i": i}} for i, v in enumerate(data)])
+    store.delete(ids=[f"v{i}" for i in range(0, 50, 3)])
+    store.upsert(vectors=[{"id": "v1", "values": data[0].tolist(), "metadata": {"i": 100}}])
+    expected = [(v.tolist(), [m["id"] for m in store.query(v.tolist(), top_k=5)["matches"]]) for v in data[:10]]
+
+    for step in ("reopen", "compact"):
+        if step == "compact":
+            store.compact()
+        reopened = LocalVectorStore(path=path, dimension=DIM, mmap=True, ann="")
+        assert reopened.describe_index_stats()["total_vector_count"] == 33
+        assert reopened.fetch(["v1"])["vectors"]["v1"]["metadata"] == {"i": 100}
+        assert reopened.fetch(["v0", "v3"])["vectors"] == {}
+        for v, ids in expected:
+            assert [m["id"] for m in reopened.query(v, top_k=5)["matches"]] == ids
+    assert reopened.describe_index_stats()["stored_rows"] == 33
+
+
+def test_catches_up_with_writes_from_another_process(tmp_path):
+    path = str(tmp_path / "vector_store")
+    store = LocalVectorStore(path=path, dimension=DIM, mmap=True, ann="")
+    store.upsert(vectors=[{"id": "a", "values": vector(0)}, {"id": "b", "values": vector(1)}])
+    assert store.query(vector(2), top_k=5)["matches"][0]["id"] in ("a", "b")
+
+    script = (
+        "from vector_store import LocalVectorStore\n"
+        f"store = LocalVectorStore(path={path!r}, dimension={DIM}, mmap=True, ann='')\n"
+        f"store.upsert(vectors=[{{'id': 'c', 'values': {vector(2)!r}}}])\n"
+        "store.delete(ids=['a'])\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=NODE_DIR, check=True)
+
+    assert store.query(vector(2), top_k=1)["matches"][0]["id"] == "c"
+    assert sorted(store.fetch(["a", "b", "c"])["vectors"]) == ["b", "c"]
+
+    subprocess.run([sys.executable, "-c", script.replace("store.delete(ids=['a'])", "store.compact()")], cwd=NODE_DIR, check=True)
+    assert sorted(store.fetch(["a", "b", "c"])["vectors"]) == ["b", "c"]
+    assert store.describe_index_stats()["stored_rows"] == 2
@@ -0,0 +1,205 @@
+import bisect
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from rag_resources import get_setting
+
+# ======== TRACING SETTINGS ========
+# NDJSON span events are appended to TRACE_FILE ("-" for stderr, empty to disable).
+# Field names follow the OpenTelemetry span model so a collector can ingest them.
+TRACE_FILE = get_setting("TRACE_FILE", "")
+SERVICE_NAME = get_setting("TRACE_SERVICE_NAME", "rag-pipeline")
+# Prometheus' default buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_write_lock = threading.Lock()
+_trace_out = None
+
+
+# ======== METRICS ========
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """In-process counters and histograms, keyed by name and label set."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def count(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {**h, "buckets": list(h["buckets"])} for key, h in self._histograms.items()}
+        return counters, histograms
+
+    def render_prometheus(self, prefix="rag_"):
+        """The metrics in the Prometheus text exposition format."""
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        counters, histograms = self.snapshot()
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {prefix}{name}_total counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{prefix}{name}_total{labels_text(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {prefix}{name} histogram")
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(self.buckets, histogram["buckets"]):
+                    cumulative += n
+                    lines.append(f"{prefix}{name}_bucket{labels_text(labels, [('le', repr(bound))])} {cumulative}")
+                lines.append(f"{prefix}{name}_bucket{labels_text(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{prefix}{name}_sum{labels_text(labels)} {histogram['sum']:.6f}")
+                lines.append(f"{prefix}{name}_count{labels_text(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def count(name, value=1, **labels):
+    """Adds `value` to a counter, e.g. count("cache_lookups", cache="scrape", result="hit")."""
+    metrics.count(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    metrics.observe(name, value, **labels)
+
+
+# ======== SPANS ========
+def _emit(event):
+    global _trace_out
+    if not TRACE_FILE:
+        return
+    line = json.dumps(event, default=str) + "\n"
+    with _write_lock:
+        if _trace_out is None:
+            _trace_out = sys.stderr if TRACE_FILE == "-" else open(TRACE_FILE, "a", encoding="utf-8")
+        _trace_out.write(line)
+        _trace_out.flush()
+
+
+class Span:
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+
+    def set(self, **attributes):
+        """Adds attributes that are only known once the stage has run (result sizes, hit or miss)."""
+        self.attributes.update(attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times a pipeline stage. Spans opened inside it (in the same thread, or in
+    threads started through `propagate`) become its children. On exit the
+    duration goes into the stage_duration_seconds histogram and, with
+    TRACE_FILE set, one NDJSON span event is written.
+    """
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    start_ns = time.time_ns()
+    start = time.perf_counter()
+    status = {"code": "OK"}
+    try:
+        yield current
+    except BaseException as e:
+        status = {"code": "ERROR", "message": f"{type(e).__name__}: {e}"}
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _current_span.reset(token)
+        observe("stage_duration_seconds", seconds, stage=name)
+        if status["code"] == "ERROR":
+            count("stage_errors", stage=name)
+        _emit({
+            "service": SERVICE_NAME,
+            "trace_id": current.trace_id,
+            "span_id": current.span_id,
+            "parent_span_id": current.parent_span_id,
+            "name": name,
+            "start_time_unix_nano": start_ns,
+            "end_time_unix_nano": start_ns + int(seconds * 1e9),
+            "duration_ms": round(seconds * 1000, 3),
+            "attributes": current.attributes,
+            "status": status,
+        })
+
+
+def current_span():
+    return _current_span.get()
+
+
+def propagate(fn):
+    """Wraps `fn` to run in the caller's trace context, for work handed to a thread pool."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+if __name__ == "__main__":
+    import argparse
+    from collections import defaultdict
+
+    parser = argparse.ArgumentParser(description="Summarise an NDJSON trace file by stage.")
+    parser.add_argument("trace_file")
+    args = parser.parse_args()
+
+    durations = defaultdict(list)
+    with open(args.trace_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                event = json.loads(line)
+                durations[event["name"]].append(event["duration_ms"])
+    summary = {}
+    for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "total_ms": round(sum(values), 1),
+            "p50_ms": values[len(values) // 2],
+            "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+        }
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,379 @@
+import json
+import os
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking is available
+    fcntl = None
+
+from rag_resources import EMBEDDING_DIM, get_setting
+
+# ======== LOCAL STORE SETTINGS ========
+LOCAL_STORE_DIR = get_setting("LOCAL_VECTOR_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_store"))
+LOCAL_STORE_MMAP = get_setting("LOCAL_VECTOR_STORE_MMAP", "1") == "1"  # Memory-map vectors.f32 instead of loading it
+LOCAL_STORE_ANN = get_setting("LOCAL_VECTOR_STORE_ANN", "")  # "" for exact search, "ivf" for the approximate index
+IVF_MIN_SIZE = int(get_setting("IVF_MIN_SIZE", "5000"))  # Below this many vectors exact search is used anyway
+IVF_NPROBE = int(get_setting("IVF_NPROBE", "8"))
+
+_OPERATORS = {
+    "$eq": lambda value, target: value == target,
+    "$ne": lambda value, target: value != target,
+    "$in": lambda value, target: value in target,
+    "$nin": lambda value, target: value not in target,
+    "$gt": lambda value, target: value is not None and value > target,
+    "$gte": lambda value, target: value is not None and value >= target,
+    "$lt": lambda value, target: value is not None and value < target,
+    "$lte": lambda value, target: value is not None and value <= target,
+    "$exists": lambda value, target: (value is not None) == target,
+}
+
+
+def matches_filter(metadata, metadata_filter):
+    """Evaluates a Pinecone-style metadata filter, e.g. {"query": {"$eq": "..."}}."""
+    for key, condition in metadata_filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, f) for f in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, f) for f in condition):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, target in condition.items():
+            if op not in _OPERATORS:
+                raise ValueError(f"Unsupported metadata filter operator: {op}")
+            if not _OPERATORS[op](value, target):
+                return False
+    return True
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class IVFIndex:
+    """
+    Inverted-file index: spherical k-means centroids, each with a posting list
+    of rows. A query only scores the rows in its `nprobe` closest lists.
+    """
+
+    def __init__(self, nlist=None, nprobe=IVF_NPROBE, iterations=10):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.centroids = None
+        self.lists = []
+        self.trained_size = 0
+        self.covered_rows = 0  # Rows below this are already in a posting list (or dead)
+
+    def train(self, matrix, rows):
+        data = np.asarray(matrix[rows])
+        nlist = min(len(rows), self.nlist or max(1, int(np.sqrt(len(rows)))))
+        rng = np.random.default_rng(0)
+        centroids = data[rng.choice(len(rows), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = data[assignment == c]
+                if len(members):
+                    centroids[c] = _normalize(members.sum(axis=0))
+        self.centroids = centroids
+        self.lists = [list(rows[assignment == c]) for c in range(nlist)]
+        self.trained_size = len(rows)
+        self.covered_rows = len(matrix)
+
+    def add(self, row, vector):
+        self.lists[int(np.argmax(self.centroids @ vector))].append(row)
+
+    def candidates(self, query):
+        probe = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        return np.array([row for c in probe for row in self.lists[c]], dtype=np.int64)
+
+
+class LocalVectorStore:
+    """
+    In-process vector store implementing the part of the Pinecone Index API
+    the scripts use (upsert, query, fetch, list, delete, describe_index_stats).
+
+    Vectors are L2-normalised float32 rows appended to vectors.f32, and ids and
+    metadata are appended to records.jsonl, so each upsert is persisted
+    incrementally. Several processes can share one directory: writes take a
+    file lock and readers replay records written by others before searching.
+    """
+
+    def __init__(self, path=LOCAL_STORE_DIR, dimension=EMBEDDING_DIM, mmap=LOCAL_STORE_MMAP, ann=LOCAL_STORE_ANN):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dimension = dimension
+        self.mmap = mmap
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.records_path = os.path.join(path, "records.jsonl")
+        self.lock_path = os.path.join(path, ".lock")
+        for p in (self.vectors_path, self.records_path):
+            open(p, "ab").close()
+
+        self._lock = threading.RLock()
+        self._ivf = IVFIndex() if ann == "ivf" else None
+        self._reset_state()
+        self._catch_up()
+
+    # ---- state and persistence ----
+
+    def _reset_state(self):
+        self._ids = []  # row -> id (None for unused rows)
+        self._metadata = []  # row -> metadata
+        self._live = []  # row -> bool
+        self._id_to_row = {}
+        self._rows = 0
+        self._log_offset = 0
+        self._log_inode = os.stat(self.records_path).st_ino
+        self._matrix = np.zeros((0, self.dimension), dtype=np.float32)
+        self._live_mask = None
+        if self._ivf is not None:
+            self._ivf.trained_size = 0
+
+    def _file_lock(self, shared=False):
+        store = self
+
+        class _Lock:
+            def __enter__(self):
+                self.f = open(store.lock_path, "a")
+                if fcntl is not None:
+                    fcntl.flock(self.f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+            def __exit__(self, *exc):
+                if fcntl is not None:
+                    fcntl.flock(self.f, fcntl.LOCK_UN)
+                self.f.close()
+
+        return _Lock()
+
+    def _catch_up(self):
+        """Applies records appended since the last call (by this or another process)."""
+        with self._lock:
+            stat = os.stat(self.records_path)
+            if stat.st_ino != self._log_inode or stat.st_size < self._log_offset:
+                self._reset_state()  # The store was compacted or cleared
+            if stat.st_size == self._log_offset:
+                return
+            with open(self.records_path, "rb") as f:
+                f.seek(self._log_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Partially written record; picked up next time
+                    self._log_offset += len(line)
+                    self._apply(json.loads(line))
+            self._live_mask = None
+
+    def _refresh(self):
+        """Catches up with other writers and maps the matrix under a shared lock."""
+        stat = os.stat(self.records_path)
+        if stat.st_ino != self._log_inode or stat.st_size != self._log_offset:
+            with self._file_lock(shared=True):
+                self._catch_up()
+                return self._get_matrix()
+        return self._get_matrix()
+
+    def _apply(self, record):
+        if record["op"] == "upsert":
+            row = record["row"]
+            while len(self._ids) <= row:
+                self._ids.append(None)
+                self._metadata.append(None)
+                self._live.append(False)
+            old_row = self._id_to_row.get(record["id"])
+            if old_row is not None:
+                self._live[old_row] = False
+                self._metadata[old_row] = None
+            self._ids[row] = record["id"]
+            self._metadata[row] = record.get("metadata") or {}
+            self._live[row] = True
+            self._id_to_row[record["id"]] = row
+            self._rows = max(self._rows, row + 1)
+        elif record["op"] == "delete":
+            row = self._id_to_row.pop(record["id"], None)
+            if row is not None:
+                self._live[row] = False
+                self._metadata[row] = None
+
+    def _get_matrix(self):
+        if self._matrix.shape[0] != self._rows:
+            row_bytes = self.dimension * 4
+            if self.mmap:
+                self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dimension))
+            else:
+                with open(self.vectors_path, "rb") as f:
+                    f.seek(self._matrix.shape[0] * row_bytes)
+                    new_rows = np.frombuffer(f.read((self._rows - self._matrix.shape[0]) * row_bytes), dtype=np.float32)
+                self._matrix = np.concatenate([self._matrix, new_rows.reshape(-1, self.dimension)])
+        return self._matrix
+
+    def _get_live_mask(self):
+        if self._live_mask is None:
+            self._live_mask = np.array(self._live, dtype=bool)
+        return self._live_mask
+
+    def _append_records(self, records):
+        with open(self.records_path, "ab") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in records).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    # ---- Pinecone-compatible API ----
+
+    def upsert(self, vectors, namespace=None):
+        ids = [v["id"] if isinstance(v, dict) else v[0] for v in vectors]
+        values = [v["values"] if isinstance(v, dict) else v[1] for v in vectors]
+        metadata = [(v.get("metadata") if isinstance(v, dict) else (v[2] if len(v) > 2 else None)) or {} for v in vectors]
+        if not ids:
+            return {"upserted_count": 0}
+        matrix = _normalize(np.asarray(values, dtype=np.float32).reshape(len(ids), self.dimension))
+
+        with self._lock, self._file_lock():
+            self._catch_up()
+            row_bytes = self.dimension * 4
+            with open(self.vectors_path, "r+b") as f:
+                start = os.fstat(f.fileno()).st_size // row_bytes
+                f.truncate(start * row_bytes)  # Drop a torn row left by a crashed writer
+                f.seek(start * row_bytes)
+                f.write(matrix.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._append_records([
+                {"op": "upsert", "id": i, "row": start + n, "metadata": m}
+                for n, (i, m) in enumerate(zip(ids, metadata))
+            ])
+            self._catch_up()
+        return {"upserted_count": len(ids)}
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, filter=None, namespace=None):
+        query = _normalize(np.asarray(vector, dtype=np.float32).reshape(self.dimension))
+        with self._lock:
+            matrix = self._refresh()
+            live = self._get_live_mask()
+            if not live.any():
+                return {"matches": [], "namespace": namespace or ""}
+
+            matches = None
+            if self._ivf is not None and live.sum() >= IVF_MIN_SIZE:
+                if live.sum() > 2 * self._ivf.trained_size:
+                    self._ivf.train(matrix, np.flatnonzero(live))
+                for row in range(self._ivf.covered_rows, self._rows):
+                    if live[row]:
+                        self._ivf.add(row, matrix[row])
+                self._ivf.covered_rows = self._rows
+                rows = self._ivf.candidates(query)
+                rows = rows[live[rows]]
+                matches = self._rank(matrix, rows, query, top_k, filter, include_metadata, include_values)
+                if len(matches) < top_k:
+                    matches = None  # Too few candidates in the probed lists; fall back to exact search
+            if matches is None:
+                rows = np.flatnonzero(live)
+                matches = self._rank(matrix, rows, query, top_k, filter, include_metadata, include_values)
+        return {"matches": matches, "namespace": namespace or ""}
+
+    def _rank(self, matrix, rows, query, top_k, metadata_filter, include_metadata, include_values):
+        scores = matrix[rows] @ query
+        if metadata_filter is None and top_k < len(rows):
+            order = np.argpartition(-scores, top_k)[:top_k]
+            order = order[np.argsort(-scores[order])]
+        else:
+            order = np.argsort(-scores)
+
+        matches = []
+        for i in order:
+            row = int(rows[i])
+            meta = self._metadata[row]
+            if metadata_filter is not None and not matches_filter(meta, metadata_filter):
+                continue
+            match = {"id": self._ids[row], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = meta
+            if include_values:
+                match["values"] = matrix[row].tolist()
+            matches.append(match)
+            if len(matches) == top_k:
+                break
+        return matches
+
+    def fetch(self, ids, namespace=None):
+        with self._lock:
+            matrix = self._refresh()
+            found = {}
+            for i in ids:
+                row = self._id_to_row.get(i)
+                if row is not None:
+                    found[i] = {"id": i, "values": matrix[row].tolist(), "metadata": self._metadata[row]}
+        return {"vectors": found, "namespace": namespace or ""}
+
+    def list(self, prefix=None, limit=100, namespace=None):
+        """Yields the stored ids starting with `prefix` in pages of up to `limit`, like Pinecone's Index.list."""
+        with self._lock:
+            self._refresh()
+            ids = sorted(i for i in self._id_to_row if i.startswith(prefix or ""))
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def delete(self, ids=None, delete_all=False, filter=None, namespace=None):
+        with self._lock, self._file_lock():
+            self._catch_up()
+            if delete_all:
+                for p in (self.vectors_path, self.records_path):
+                    open(p + ".tmp", "wb").close()
+                    os.replace(p + ".tmp", p)
+                self._reset_state()
+                return {}
+            ids = list(ids or [])
+            if filter is not None:
+                ids += [i for i, row in self._id_to_row.items() if matches_filter(self._metadata[row], filter)]
+            ids = [i for i in dict.fromkeys(ids) if i in self._id_to_row]
+            if ids:
+                self._append_records([{"op": "delete", "id": i} for i in ids])
+                self._catch_up()
+            if self._rows - len(self._id_to_row) > max(1000, len(self._id_to_row)):
+                self._compact()
+        return {}
+
+    def describe_index_stats(self):
+        with self._lock:
+            self._refresh()
+            return {
+                "dimension": self.dimension,
+                "total_vector_count": len(self._id_to_row),
+                "stored_rows": self._rows,
+                "namespaces": {"": {"vector_count": len(self._id_to_row)}},
+            }
+
+    def compact(self):
+        """Rewrites the store without overwritten and deleted rows."""
+        with self._lock, self._file_lock():
+            self._catch_up()
+            self._compact()
+
+    def _compact(self):
+        matrix = self._get_matrix()
+        live_rows = [row for row in range(self._rows) if self._live[row]]
+        with open(self.vectors_path + ".tmp", "wb") as f:
+            for row in live_rows:
+                f.write(np.asarray(matrix[row], dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.records_path + ".tmp", "wb") as f:
+            for new_row, row in enumerate(live_rows):
+                record = {"op": "upsert", "id": self._ids[row], "row": new_row, "metadata": self._metadata[row]}
+                f.write((json.dumps(record) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self._matrix = np.zeros((0, self.dimension), dtype=np.float32)  # Release the old mapping first
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+        os.replace(self.records_path + ".tmp", self.records_path)
+        self._reset_state()
+        self._catch_up()
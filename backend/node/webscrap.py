@@ -1,32 +1,156 @@
-from bs4 import BeautifulSoup
 import requests
 import json
 from searchurl import search_serper
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 
-def scrape_webpage(url):
-    """Scrape clean text content from a webpage."""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36'
-    }
-    try:
-        response = requests.get(url, timeout=15, headers=headers)
-        if response.status_code != 200:
-            print(f"Failed to retrieve {url} | Status code: {response.status_code}", file=sys.stderr)
-            return ""
+from rag_resources import get_setting
+from scrape_cache import get_scrape_cache
+from extract import extract_text
+from tracing import count, propagate, span
+
+MIN_CONTENT_LENGTH = 200  # Pages with less text than this are not worth embedding
+SCRAPE_WORKERS = int(get_setting("SCRAPE_WORKERS", "8"))
+SCRAPE_PER_HOST = int(get_setting("SCRAPE_PER_HOST", "2"))  # Concurrent connections per host
+SCRAPE_DEADLINE = float(get_setting("SCRAPE_DEADLINE", "10"))  # Seconds for all fetches of one query
+SCRAPE_MIN_DOCS = int(get_setting("SCRAPE_MIN_DOCS", "3"))  # Stop once this many usable pages arrived
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36'
+}
+
+_session = None
+_executor = None
+_host_slots = {}
+_state_lock = threading.Lock()
+
+
+def get_session():
+    """Returns the shared HTTP session so connections are pooled and reused."""
+    global _session
+    with _state_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=SCRAPE_WORKERS, pool_maxsize=SCRAPE_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers.update(HEADERS)
+        return _session
+
+
+def _get_executor():
+    global _executor
+    with _state_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SCRAPE_WORKERS, thread_name_prefix="scrape")
+        return _executor
+
+
+def _host_slot(url):
+    host = urlparse(url).netloc
+    with _state_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(SCRAPE_PER_HOST)
+        return _host_slots[host]
 
-        soup = BeautifulSoup(response.content, 'html.parser')
 
-        # Remove unwanted elements
-        for tag in soup(['script', 'style', 'noscript', 'iframe']):
-            tag.decompose()
+def scrape_webpage(url, timeout=15, session=None):
+    """
+    Scrape clean text content from a webpage. Pages in the scrape cache are
+    returned without a request while fresh; stale ones are revalidated with a
+    conditional GET, and a 304 reuses the cached text without re-parsing.
+    """
+    cache = get_scrape_cache()
+    cached = cache.get(url) if cache is not None else None
+    if cached is not None and cached["fresh"]:
+        count("cache_lookups", cache="scrape", result="hit")
+        return cached["text"]
 
-        # Extract readable text
-        text = soup.get_text(separator=' ', strip=True)
-        return text
+    headers = {}
+    if cached is not None:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        with span("scrape", host=urlparse(url).netloc, conditional=bool(headers)) as current:
+            if session is None:
+                response = requests.get(url, timeout=timeout, headers={**HEADERS, **headers})
+            else:
+                response = session.get(url, timeout=timeout, headers=headers)
+            current.set(status_code=response.status_code, bytes=len(response.content))
+            count("scraped_bytes", len(response.content))
+            if response.status_code == 304 and cached is not None:
+                count("cache_lookups", cache="scrape", result="revalidated")
+                cache.revalidated(url)
+                return cached["text"]
+            if response.status_code != 200:
+                print(f"Failed to retrieve {url} | Status code: {response.status_code}", file=sys.stderr)
+                return ""
+
+            count("cache_lookups", cache="scrape", result="miss")
+            with span("extract", bytes=len(response.content)):
+                text = extract_text(response.content)
+            if cache is not None and text:
+                cache.put(url, text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            return text
 
     except Exception as e:
         print(f"Error scraping {url}: {e}", file=sys.stderr)
         return ""
 
+
+def _scrape_with_limits(url, deadline):
+    # Fresh cached pages need no connection, so they don't wait for a host slot
+    cache = get_scrape_cache()
+    cached = cache.get(url) if cache is not None else None
+    if cached is not None and cached["fresh"]:
+        count("cache_lookups", cache="scrape", result="hit")
+        return cached["text"]
+
+    slot = _host_slot(url)
+    if not slot.acquire(timeout=max(0.0, deadline - time.monotonic())):
+        return ""
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return ""
+        return scrape_webpage(url, timeout=min(15, remaining), session=get_session())
+    finally:
+        slot.release()
+
+
+def scrape_concurrently(search_results, min_docs=SCRAPE_MIN_DOCS, deadline=SCRAPE_DEADLINE):
+    """
+    Scrapes the search results in parallel and yields (result, content) for
+    each usable page as soon as it is downloaded, so the caller can embed it
+    while the others are still in flight. Stops after `min_docs` usable pages
+    or `deadline` seconds, whichever comes first; pages still pending are
+    cancelled and late responses are discarded.
+    """
+    end = time.monotonic() + deadline
+    executor = _get_executor()
+    futures = {executor.submit(propagate(_scrape_with_limits), r.get('link'), end): r for r in search_results if r.get('link')}
+    usable = 0
+    try:
+        for future in as_completed(futures, timeout=max(0.0, end - time.monotonic())):
+            result = futures[future]
+            content = future.result()
+            if len(content) < MIN_CONTENT_LENGTH:
+                print(f"Skipping '{result.get('link')}' — content too short.", file=sys.stderr)
+                continue
+            yield result, content
+            usable += 1
+            if min_docs and usable >= min_docs:
+                break
+    except FuturesTimeoutError:
+        print(f"Scrape deadline of {deadline:.1f}s reached with {usable} usable pages.", file=sys.stderr)
+    finally:
+        for future in futures:
+            future.cancel()
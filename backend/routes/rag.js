@@ -2,42 +2,38 @@ const express = require('express');
 const router = express.Router();
 const { spawn } = require('child_process');
 const path = require('path');
-
-router.post('/query', (req, res) => {
-    const { query } = req.body;
-    console.log('Received query:', query);
-
-    if (!query) {
-        return res.status(400).json({ error: 'Query is required' });
+const axios = require('axios');
+
+// When set (e.g. http://127.0.0.1:5801), requests go to the long-lived
+// Python worker server (node/rag_server.py) instead of spawning a process.
+const RAG_SERVER_URL = process.env.RAG_SERVER_URL;
+
+const forwardToRagServer = async (endpoint, query, res) => {
+    try {
+        const response = await axios.post(`${RAG_SERVER_URL}${endpoint}`, { query });
+        res.json(response.data);
+    } catch (error) {
+        const details = error.response ? error.response.data : error.message;
+        console.error(`RAG server request to ${endpoint} failed:`, details);
+        res.status(500).json({ error: 'Failed to process query', details });
     }
+};
 
-    const pythonProcess = spawn('python', [path.join(__dirname, '..', 'node', 'rag_query.py')]);
-
-    let stdoutBuffer = '';
-    let stderr = '';
-    let finalAnswer = null;
-    let rewardScore = null;
-
-    pythonProcess.stdin.write(query);
-    pythonProcess.stdin.end();
-
-    pythonProcess.stdout.on('data', (data) => {
-        stdoutBuffer += data.toString();
+// Splits a byte stream into lines and hands every JSON line to onEvent.
+const createLineParser = (onEvent) => {
+    let buffer = '';
+    return (data) => {
+        buffer += data.toString();
         let newlineIndex;
-        while ((newlineIndex = stdoutBuffer.indexOf('\n')) !== -1) {
-            const line = stdoutBuffer.substring(0, newlineIndex).trim();
-            stdoutBuffer = stdoutBuffer.substring(newlineIndex + 1);
+        while ((newlineIndex = buffer.indexOf('\n')) !== -1) {
+            const line = buffer.substring(0, newlineIndex).trim();
+            buffer = buffer.substring(newlineIndex + 1);
 
             if (line) {
                 // Only attempt to parse as JSON if it looks like JSON
                 if (line.startsWith('{') && line.endsWith('}')) {
                     try {
-                        const jsonMessage = JSON.parse(line);
-                        if (jsonMessage.type === "final_answer") {
-                            finalAnswer = jsonMessage.answer;
-                        } else if (jsonMessage.type === "reward_score") {
-                            rewardScore = jsonMessage.score;
-                        }
+                        onEvent(JSON.parse(line));
                     } catch (e) {
                         // If JSON parsing fails, log it but don't treat as process update
                         console.log('Python stdout (malformed JSON or non-JSON):', line);
@@ -48,7 +44,37 @@ router.post('/query', (req, res) => {
                 }
             }
         }
-    });
+    };
+};
+
+// Runs rag_query for one query and calls onEvent for each NDJSON event
+// (token, final_answer, reward_score, error) as soon as it is printed.
+// onEnd(errorDetails) is called once the event stream is over; errorDetails
+// is null on success.
+const runQuery = (query, onEvent, onEnd) => {
+    const parse = createLineParser(onEvent);
+
+    if (RAG_SERVER_URL) {
+        axios.post(`${RAG_SERVER_URL}/query/stream`, { query }, { responseType: 'stream' })
+            .then((response) => {
+                response.data.on('data', parse);
+                response.data.on('end', () => onEnd(null));
+                response.data.on('error', (error) => onEnd(error.message));
+            })
+            .catch((error) => {
+                console.error('RAG server request to /query/stream failed:', error.message);
+                onEnd(error.message);
+            });
+        return;
+    }
+
+    const pythonProcess = spawn('python', [path.join(__dirname, '..', 'node', 'rag_query.py')]);
+    let stderr = '';
+
+    pythonProcess.stdin.write(query);
+    pythonProcess.stdin.end();
+
+    pythonProcess.stdout.on('data', parse);
 
     pythonProcess.stderr.on('data', (data) => {
         console.error('Python stderr:', data.toString());
@@ -59,16 +85,82 @@ router.post('/query', (req, res) => {
         console.log(`Python script exited with code ${code}`);
         if (code !== 0) {
             console.error('Error executing Python script:', stderr);
-            return res.status(500).json({ error: 'Failed to process query', details: stderr });
         }
+        onEnd(code !== 0 ? stderr : null);
+    });
+};
 
-        if (finalAnswer !== null && rewardScore !== null) {
+router.post('/query', (req, res) => {
+    const { query } = req.body;
+    console.log('Received query:', query);
+
+    if (!query) {
+        return res.status(400).json({ error: 'Query is required' });
+    }
+
+    let finalAnswer = null;
+    let rewardScore = null;
+    let errorMessage = null;
+
+    // The response is sent as soon as the answer and reward are known; the
+    // Python side keeps logging the reward after that
+    runQuery(query, (message) => {
+        if (message.type === "final_answer") {
+            finalAnswer = message.answer;
+        } else if (message.type === "reward_score") {
+            rewardScore = message.score;
+        } else if (message.type === "error") {
+            errorMessage = message.message;
+        }
+        if (finalAnswer !== null && rewardScore !== null && !res.headersSent) {
             console.log('Successfully processed query:', { finalAnswer, rewardScore });
             res.json({ answer: finalAnswer, reward_score: rewardScore });
-        } else {
-            console.error('Failed to get final answer or reward score from Python script. Full stdout buffer:', stdoutBuffer);
-            res.status(500).json({ error: 'Failed to parse Python script output', details: stdoutBuffer });
         }
+    }, (errorDetails) => {
+        if (res.headersSent) {
+            return;
+        }
+        console.error('Failed to get final answer or reward score for query:', errorDetails || errorMessage);
+        res.status(500).json({ error: 'Failed to process query', details: errorDetails || errorMessage || 'No answer produced' });
+    });
+});
+
+// Server-Sent Events version of /query: "token" events carry the answer as it
+// is generated, followed by "final_answer", "reward_score" and "done".
+router.post('/query/stream', (req, res) => {
+    const { query } = req.body;
+    console.log('Received streaming query:', query);
+
+    if (!query) {
+        return res.status(400).json({ error: 'Query is required' });
+    }
+
+    res.set({
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+        'X-Accel-Buffering': 'no',
+    });
+    res.flushHeaders();
+
+    const sendEvent = (type, data) => {
+        if (!res.writableEnded) {
+            res.write(`event: ${type}\ndata: ${JSON.stringify(data)}\n\n`);
+        }
+    };
+
+    runQuery(query, (message) => {
+        sendEvent(message.type, message);
+        if (message.type === "reward_score") {
+            sendEvent('done', {});
+            res.end();
+        }
+    }, (errorDetails) => {
+        if (res.writableEnded) {
+            return;
+        }
+        sendEvent('error', { error: 'Failed to process query', details: errorDetails || 'No answer produced' });
+        res.end();
     });
 });
 
@@ -81,6 +173,10 @@ router.post('/compare', (req, res) => {
         return res.status(400).json({ error: 'Query is required' });
     }
 
+    if (RAG_SERVER_URL) {
+        return forwardToRagServer('/compare', query, res);
+    }
+
     // The RL agent in rag_query_compare.py will now choose top_k
     const pythonProcess = spawn('python', [path.join(__dirname, '..', 'node', 'rag_query_compare.py'), query]);
 